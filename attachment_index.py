@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""จำลิงก์ไฟล์แนบบน Discord CDN ของไฟล์ที่เคยอัปโหลดสำเร็จ
+ถ้าเพลงเดิมถูกขอซ้ำ ส่งลิงก์เดิมแทนการอัปโหลดไฟล์ใหม่ (ประหยัด bandwidth ขาขึ้น)
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+
+# ลิงก์ต้องเหลืออายุอย่างน้อยเท่านี้ถึงจะนำกลับมาใช้ (วินาที)
+MIN_REMAINING_SECONDS: int = 10 * 60
+
+
+def url_expires_at(url: str) -> Optional[int]:
+    """อ่านเวลาหมดอายุ (unix time) จากพารามิเตอร์ ex= ของลิงก์ CDN (เลขฐาน 16)"""
+    values = parse_qs(urlparse(url).query).get("ex")
+    if not values:
+        return None
+    try:
+        return int(values[0], 16)
+    except ValueError:
+        return None
+
+
+class AttachmentIndex:
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._urls: "OrderedDict[str, str]" = OrderedDict()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.reused = 0
+        self.expired = 0
+        self._load()
+
+    @staticmethod
+    def make_key(cache_key: str, filename: str) -> str:
+        # ชื่อไฟล์อยู่ในลิงก์ด้วย จึงต้องแยก key ตามชื่อไฟล์ที่ผู้ใช้ตั้ง
+        return f"{cache_key}/{filename}"
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self._urls.update(data)
+
+    def _save_blocking(self, data: Dict[str, str]) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("Save attachment index error:", e)
+
+    async def _save(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._save_blocking, dict(self._urls))
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
+
+    async def is_valid(self, url: str) -> bool:
+        """ลิงก์ยังใช้ได้ไหม: ดูเวลาหมดอายุก่อน แล้วค่อยยิง HEAD ไปถาม CDN"""
+        expires_at = url_expires_at(url)
+        if expires_at is not None and expires_at - time.time() < MIN_REMAINING_SECONDS:
+            return False
+        try:
+            session = await self._get_session()
+            async with session.head(url, allow_redirects=True) as resp:
+                return resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def get(self, key: str) -> Optional[str]:
+        """คืนลิงก์ที่ยังใช้ได้ ถ้าหมดอายุแล้วจะลบออกจาก index และคืน None"""
+        url = self._urls.get(key)
+        if url is None:
+            return None
+        if not await self.is_valid(url):
+            self._urls.pop(key, None)
+            self.expired += 1
+            await self._save()
+            return None
+        self._urls.move_to_end(key)
+        self.reused += 1
+        return url
+
+    async def put(self, key: str, url: str) -> None:
+        self._urls[key] = url
+        self._urls.move_to_end(key)
+        while len(self._urls) > self.max_entries:
+            self._urls.popitem(last=False)
+        await self._save()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._urls), "reused": self.reused, "expired": self.expired}
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""ตัวตั้งเวลาลบข้อความอัตโนมัติแบบรวมศูนย์ (timer wheel)
+แทนการสร้าง task ละ 1 ข้อความ: เก็บข้อความที่รอลบเป็นถังตามวินาทีที่ถึงกำหนด
+แล้วมี task เดียวคอยเก็บถังที่ถึงเวลา รวมตามห้อง และลบทีละหลายข้อความด้วย bulk delete
+"""
+
+import asyncio
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import discord
+
+# Discord ให้ bulk delete ได้ครั้งละไม่เกิน 100 ข้อความ และเฉพาะข้อความอายุไม่เกิน 14 วัน
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+
+ChannelResolver = Callable[[int], Optional[discord.abc.Messageable]]
+FlushCallback = Callable[[List[int]], None]
+
+
+class AutoDeleteScheduler:
+    def __init__(
+        self,
+        resolve_channel: ChannelResolver,
+        tick_seconds: float = 1.0,
+        on_flushed: Optional[FlushCallback] = None,
+    ):
+        self._resolve_channel = resolve_channel
+        # เรียกพร้อม id ข้อความที่ถึงเวลาลบแล้ว (เช่นไว้ลบออกจากที่เก็บถาวร)
+        self._on_flushed = on_flushed
+        self.tick_seconds = tick_seconds
+        # วินาทีที่ถึงกำหนด -> ห้อง -> id ข้อความ
+        self._buckets: Dict[int, Dict[int, Set[int]]] = {}
+        self._due_heap: List[int] = []
+        # id ข้อความ -> (วินาทีที่ถึงกำหนด, id ห้อง) ใช้ยกเลิกรายข้อความ
+        self._pending: Dict[int, Tuple[int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.deleted_total = 0
+        self.bulk_requests = 0
+        self.single_requests = 0
+
+    # ----------------- จัดการตัวตั้งเวลา -----------------
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="autodel-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def schedule(self, channel_id: int, message_id: int, delay: float, due_at: Optional[float] = None) -> None:
+        """ตั้งเวลาลบข้อความ (ถ้ามีอยู่แล้วจะเลื่อนเวลาใหม่)"""
+        self.cancel(message_id)
+        due = int(due_at if due_at is not None else time.time() + delay)
+        bucket = self._buckets.get(due)
+        if bucket is None:
+            bucket = self._buckets[due] = {}
+            heapq.heappush(self._due_heap, due)
+        bucket.setdefault(channel_id, set()).add(message_id)
+        self._pending[message_id] = (due, channel_id)
+        self.start()
+
+    def cancel(self, message_id: int) -> bool:
+        """ยกเลิกการลบข้อความนี้ (เช่นถูกเพิ่มเข้า list ยกเว้น)"""
+        item = self._pending.pop(message_id, None)
+        if item is None:
+            return False
+        due, channel_id = item
+        channels = self._buckets.get(due, {})
+        ids = channels.get(channel_id)
+        if ids is not None:
+            ids.discard(message_id)
+            if not ids:
+                del channels[channel_id]
+        return True
+
+    def clear(self) -> int:
+        """ยกเลิกทั้งหมด (ใช้ตอนปิด autodel) คืนจำนวนข้อความที่ยกเลิก"""
+        count = len(self._pending)
+        self._buckets.clear()
+        self._due_heap.clear()
+        self._pending.clear()
+        return count
+
+    # ----------------- วนลบ -----------------
+
+    def _pop_due(self, now: float) -> Dict[int, List[int]]:
+        """ดึงข้อความที่ถึงเวลาทั้งหมด รวมเป็นรายห้อง"""
+        by_channel: Dict[int, List[int]] = {}
+        while self._due_heap and self._due_heap[0] <= now:
+            due = heapq.heappop(self._due_heap)
+            for channel_id, ids in self._buckets.pop(due, {}).items():
+                for message_id in ids:
+                    self._pending.pop(message_id, None)
+                by_channel.setdefault(channel_id, []).extend(ids)
+        return by_channel
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            due = self._pop_due(time.time())
+            if not due:
+                continue
+            if self._on_flushed is not None:
+                self._on_flushed([m for ids in due.values() for m in ids])
+            await asyncio.gather(
+                *(self._flush_channel(ch, ids) for ch, ids in due.items()),
+                return_exceptions=True,
+            )
+
+    async def _flush_channel(self, channel_id: int, message_ids: List[int]) -> None:
+        channel = self._resolve_channel(channel_id)
+        if channel is None:
+            return
+
+        cutoff = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE
+        recent = [m for m in message_ids if discord.utils.snowflake_time(m) > cutoff]
+        old = [m for m in message_ids if discord.utils.snowflake_time(m) <= cutoff]
+
+        can_bulk = hasattr(channel, "delete_messages")
+        if not can_bulk:
+            old, recent = old + recent, []
+
+        for start in range(0, len(recent), BULK_DELETE_LIMIT):
+            chunk = recent[start:start + BULK_DELETE_LIMIT]
+            if len(chunk) == 1:
+                old.append(chunk[0])
+                continue
+            try:
+                await channel.delete_messages([discord.Object(id=m) for m in chunk])
+                self.bulk_requests += 1
+                self.deleted_total += len(chunk)
+            except discord.HTTPException:
+                # เช่นมีบางข้อความถูกลบไปแล้ว -> ถอยไปลบทีละข้อความ
+                old.extend(chunk)
+
+        # ข้อความเก่ากว่า 14 วัน (หรือเหลือข้อความเดียว) ต้องลบทีละข้อความ
+        for message_id in old:
+            try:
+                await channel.get_partial_message(message_id).delete()
+                self.single_requests += 1
+                self.deleted_total += 1
+            except discord.HTTPException:
+                pass
@@ -0,0 +1,754 @@
+# -*- coding: utf-8 -*-
+"""ชุดวัดประสิทธิภาพแบบออฟไลน์ (ไม่ต่อ YouTube / Discord จริง)
+
+- เซิร์ฟเวอร์ HTTP ในเครื่องเสิร์ฟไฟล์เสียงสังเคราะห์ (WAV คลื่น sine) ให้ generic extractor ของ yt-dlp
+  path เป็นรูป /youtube.com/watch?v=<id> เพื่อให้ extract_video_id ได้ id (ใช้แคช/รวมคำขอซ้ำได้เหมือนของจริง)
+- Discord ปลอม: ผู้ใช้/DM/ห้อง ที่จดการส่งข้อความ อัปโหลดไฟล์ และการลบข้อความไว้
+- ขับผ่านฟังก์ชันจริงของบอท: enqueue_download -> process_download_queue -> send_mp3_to_dm
+  และ schedule_auto_delete -> AutoDeleteScheduler
+
+รายงาน jobs/sec, latency p50/p95/p99, RSS สูงสุด และพื้นที่ temp สูงสุด ต่อจำนวน worker ที่กำหนด
+
+ตัวอย่าง:
+    python benchmark.py --jobs 30 --workers 1,2,4 --mix 30:mp3:3,120:m4a:1 --dup-ratio 0.3
+    python benchmark.py --jobs 0 --throttle-kbps 1024 --fragments 1,4,8 --bandwidth-kbps 4096
+    python benchmark.py --jobs 0 --fetch-jobs 0 --autodel-messages 0 --profile-jobs 500
+ต้องมี ffmpeg ในเครื่อง (ขั้นแปลงไฟล์ใช้ ffmpeg จริง) ยกเว้นรอบวัดการโหลดไฟล์ต้นทาง (--fetch-jobs)
+และรอบจำลอง extractor profile (--profile-jobs ใช้ extractor ปลอมกับนาฬิกาจำลอง ไม่โหลดอะไรจริง)
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import wave
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+
+import discord  # noqa: E402
+
+import bot  # noqa: E402
+import downloader  # noqa: E402
+from attachment_index import AttachmentIndex  # noqa: E402
+from autodel_scheduler import AutoDeleteScheduler  # noqa: E402
+from download_queue import DownloadJob, DownloadScheduler  # noqa: E402
+from extractor_profiles import ExtractorProfile, ProfilePool  # noqa: E402
+from http_fetch import ConnectionPool, TokenBucket, iter_ranges  # noqa: E402
+from metrics import process_rss_bytes  # noqa: E402
+from mp3_cache import Mp3Cache  # noqa: E402
+from state_store import StateStore  # noqa: E402
+from temp_storage import TempStorage  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+# ----------------- เสียงสังเคราะห์ + เซิร์ฟเวอร์ในเครื่อง -----------------
+
+def write_sine_wav(path: str, seconds: int, freq: float = 440.0) -> None:
+    """สร้างไฟล์ WAV mono 16-bit (ไม่ต้องพึ่ง ffmpeg)"""
+    one_second = b"".join(
+        struct.pack("<h", int(12000 * math.sin(2 * math.pi * freq * i / SAMPLE_RATE)))
+        for i in range(SAMPLE_RATE)
+    )
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        for _ in range(seconds):
+            w.writeframes(one_second)
+
+
+class MediaServer:
+    """เซิร์ฟเวอร์ไฟล์เสียงในเครื่อง รองรับ HEAD และ Range (bytes=a-b)
+
+    /youtube.com/watch?v=<id> -> ไฟล์เสียงของ id นั้น
+    /cdn/<n>?ex=<hex>          -> ลิงก์ไฟล์แนบปลอมของ Discord CDN (ตอบ 200 เสมอ)
+    """
+
+    def __init__(self, root: str, throttle_bytes_per_sec: int = 0):
+        self.root = root
+        self.throttle = throttle_bytes_per_sec
+        self.tracks: Dict[str, str] = {}
+        self.bytes_served = 0
+        self.requests = 0
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def add_track(self, video_id: str, path: str) -> str:
+        self.tracks[video_id] = path
+        return f"{self.base_url}/youtube.com/watch?v={video_id}"
+
+    @property
+    def base_url(self) -> str:
+        assert self._httpd is not None
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _resolve(self) -> Optional[str]:
+                match = re.search(r"[?&]v=([0-9A-Za-z_-]{11})", self.path)
+                return server.tracks.get(match.group(1)) if match else None
+
+            def _send_media(self, body: bool) -> None:
+                server.requests += 1
+                if self.path.startswith("/cdn/"):
+                    self.send_response(200)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                path = self._resolve()
+                if path is None:
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                start, end = 0, size - 1
+                match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(0, size - int(match.group(2)))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                if not body:
+                    return
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = f.read(min(64 * 1024, remaining))
+                        if not chunk:
+                            break
+                        try:
+                            self.wfile.write(chunk)
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+                        remaining -= len(chunk)
+                        server.bytes_served += len(chunk)
+                        if server.throttle:
+                            time.sleep(len(chunk) / server.throttle)
+
+            def do_GET(self):
+                self._send_media(body=True)
+
+            def do_HEAD(self):
+                self._send_media(body=False)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+# ----------------- Discord ปลอม -----------------
+
+_snowflakes = iter(range(1, 1 << 22))
+
+
+def fake_snowflake() -> int:
+    """id แบบ snowflake ของเวลาปัจจุบัน (ให้ตัวลบข้อความคิดว่าเป็นข้อความใหม่)"""
+    return discord.utils.time_snowflake(discord.utils.utcnow()) + next(_snowflakes)
+
+
+@dataclass
+class FakeAttachment:
+    url: str
+
+
+class FakeMessage:
+    def __init__(self, channel, content: Optional[str] = None, author=None, attachments=None):
+        self.id = fake_snowflake()
+        self.channel = channel
+        self.content = content or ""
+        self.author = author
+        self.attachments: List[FakeAttachment] = attachments or []
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        if "content" in kwargs:
+            self.content = kwargs["content"]
+        return self
+
+
+class FakeDM:
+    def __init__(self, recorder: "Recorder", cdn_base: str):
+        self.id = fake_snowflake()
+        self._recorder = recorder
+        self._cdn_base = cdn_base
+
+    async def send(self, content: Optional[str] = None, *, file: Optional[discord.File] = None, **kwargs):
+        attachments = []
+        if file is not None:
+            size = os.fstat(file.fp.fileno()).st_size
+            file.close()
+            self._recorder.uploads += 1
+            self._recorder.upload_bytes += size
+            expires = int(time.time()) + 24 * 3600
+            attachments.append(FakeAttachment(f"{self._cdn_base}/cdn/{fake_snowflake()}?ex={expires:x}"))
+        else:
+            self._recorder.messages += 1
+        return FakeMessage(self, content, attachments=attachments)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, recorder: "Recorder", cdn_base: str):
+        self.id = user_id
+        self.bot = False
+        self.display_name = f"bench-{user_id}"
+        self._dm = FakeDM(recorder, cdn_base)
+
+    async def create_dm(self):
+        return self._dm
+
+
+class FakeChannel:
+    """ห้องปลอมที่รองรับ bulk delete และลบทีละข้อความ"""
+
+    class _Partial:
+        def __init__(self, channel: "FakeChannel", message_id: int):
+            self._channel = channel
+            self.id = message_id
+
+        async def delete(self):
+            self._channel.deleted.add(self.id)
+            self._channel.single_deletes += 1
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.deleted: set = set()
+        self.bulk_deletes = 0
+        self.single_deletes = 0
+
+    async def delete_messages(self, messages):
+        self.bulk_deletes += 1
+        self.deleted.update(m.id for m in messages)
+
+    def get_partial_message(self, message_id: int):
+        return FakeChannel._Partial(self, message_id)
+
+
+@dataclass
+class Recorder:
+    messages: int = 0
+    uploads: int = 0
+    upload_bytes: int = 0
+
+
+# ----------------- ตัวเก็บสถิติ -----------------
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResourceSampler:
+    """เก็บค่า RSS และพื้นที่ temp (โฟลเดอร์ ytmp3_* + แคช) สูงสุดระหว่างรัน"""
+
+    def __init__(self, cache_dir: str, temp_root: str, interval: float = 0.1):
+        self.cache_dir = cache_dir
+        self.temp_root = temp_root
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> None:
+        self.peak_rss = max(self.peak_rss, process_rss_bytes())
+        temp_dirs = glob.glob(os.path.join(self.temp_root, "ytmp3_*"))
+        disk = sum(dir_bytes(d) for d in temp_dirs) + dir_bytes(self.cache_dir)
+        self.peak_disk = max(self.peak_disk, disk)
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.sample()
+
+
+# ----------------- สถานการณ์ทดสอบ -----------------
+
+@dataclass
+class MixEntry:
+    duration: int
+    fmt: str
+    weight: int
+
+
+def parse_mix(raw: str) -> List[MixEntry]:
+    """รูปแบบ "ความยาว[:รูปแบบไฟล์[:น้ำหนัก]],..." เช่น 30:mp3:3,120:m4a:1"""
+    mix = []
+    for item in raw.split(","):
+        fields = item.strip().split(":")
+        duration = int(fields[0])
+        fmt = fields[1] if len(fields) > 1 and fields[1] else "mp3"
+        weight = int(fields[2]) if len(fields) > 2 else 1
+        if fmt not in bot.OUTPUT_FORMATS:
+            raise SystemExit(f"รูปแบบไฟล์ไม่รองรับ: {fmt}")
+        mix.append(MixEntry(duration, fmt, weight))
+    return mix
+
+
+@dataclass
+class ScenarioResult:
+    workers: int
+    jobs: int
+    completed: int
+    failed: int
+    wall_seconds: float
+    latencies: List[float] = field(default_factory=list)
+    peak_rss: int = 0
+    peak_disk: int = 0
+    uploads: int = 0
+    upload_bytes: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "jobs": self.jobs,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "jobs_per_sec": round(self.completed / self.wall_seconds, 3) if self.wall_seconds else 0.0,
+            "p50": round(percentile(self.latencies, 50), 3),
+            "p95": round(percentile(self.latencies, 95), 3),
+            "p99": round(percentile(self.latencies, 99), 3),
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1),
+            "peak_temp_mb": round(self.peak_disk / (1024 * 1024), 1),
+            "uploads": self.uploads,
+            "upload_mb": round(self.upload_bytes / (1024 * 1024), 1),
+        }
+
+
+def build_workload(
+    server: MediaServer, track_files: Dict[int, str], mix: List[MixEntry], jobs: int, dup_ratio: float, seed: int
+) -> List[Tuple[str, str]]:
+    """สุ่มรายการงาน (url, รูปแบบไฟล์) ตามสัดส่วน mix; dup_ratio = สัดส่วนงานที่ขอคลิปเดิมซ้ำ"""
+    rng = random.Random(seed)
+    weights = [m.weight for m in mix]
+    workload: List[Tuple[str, str]] = []
+    for n in range(jobs):
+        if workload and rng.random() < dup_ratio:
+            workload.append(rng.choice(workload))
+            continue
+        entry = rng.choices(mix, weights=weights)[0]
+        url = server.add_track(f"bench{n:06d}", track_files[entry.duration])
+        workload.append((url, entry.fmt))
+    return workload
+
+
+async def run_download_scenario(
+    server: MediaServer,
+    workload: List[Tuple[str, str]],
+    workers: int,
+    users: int,
+    cache_bytes: int,
+) -> ScenarioResult:
+    """รันงานทั้งหมดผ่านคิวจริงของบอท ด้วย worker ตามจำนวนที่กำหนด"""
+    work_dir = tempfile.mkdtemp(prefix="ytmp3bench_")
+    recorder = Recorder()
+    latencies: List[float] = []
+    done = asyncio.Event()
+
+    def mark_done():
+        if len(latencies) >= len(workload):
+            done.set()
+
+    async def run_job(job: DownloadJob):
+        try:
+            await bot.process_download_queue(job)
+        finally:
+            latencies.append(time.monotonic() - job.enqueued_at)
+            mark_done()
+
+    async def reject_job(job: DownloadJob, error: Exception):
+        await bot.reject_download_job(job, error)
+        latencies.append(time.monotonic() - job.enqueued_at)
+        mark_done()
+
+    # ใช้ของจริงทุกชิ้น แต่ชี้ไปที่โฟลเดอร์ชั่วคราวของรอบนี้
+    bot.MP3_CACHE = Mp3Cache(os.path.join(work_dir, "cache"), cache_bytes)
+    bot.ATTACHMENT_INDEX = AttachmentIndex(os.path.join(work_dir, "attachments.json"))
+    bot.STATE_STORE = StateStore(os.path.join(work_dir, "state.sqlite3"))
+    await bot.STATE_STORE.open()
+    bot.TEMP_STORAGE = TempStorage(os.path.join(work_dir, "work"), bot.TEMP_BUDGET_BYTES)
+    bot.DOWNLOAD_SCHEDULER = DownloadScheduler(
+        run_job,
+        workers=workers,
+        max_depth=0,
+        prefetch=bot.prefetch_download_job,
+        on_rejected=reject_job,
+        prefetch_concurrency=bot.PREFETCH_CONCURRENCY,
+    )
+    succeeded_before = bot.JOBS_TOTAL.value(result="ok") + bot.JOBS_TOTAL.value(result="cache_hit")
+
+    fake_users = [FakeUser(10_000 + i, recorder, server.base_url) for i in range(max(1, users))]
+    sampler = ResourceSampler(bot.MP3_CACHE.root, bot.TEMP_STORAGE.root)
+    sampler.start()
+    started = time.monotonic()
+    try:
+        for index, (url, fmt) in enumerate(workload):
+            await bot.enqueue_download(fake_users[index % len(fake_users)], url, None, fmt)
+        await done.wait()
+    finally:
+        wall = time.monotonic() - started
+        await sampler.stop()
+        await bot.DOWNLOAD_SCHEDULER.stop()
+        await bot.STATE_STORE.close()
+        await bot.ATTACHMENT_INDEX.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    completed = int(bot.JOBS_TOTAL.value(result="ok") + bot.JOBS_TOTAL.value(result="cache_hit") - succeeded_before)
+    return ScenarioResult(
+        workers=workers,
+        jobs=len(workload),
+        completed=completed,
+        failed=len(workload) - completed,
+        wall_seconds=wall,
+        latencies=latencies,
+        peak_rss=sampler.peak_rss,
+        peak_disk=sampler.peak_disk,
+        uploads=recorder.uploads,
+        upload_bytes=recorder.upload_bytes,
+    )
+
+
+async def run_autodel_scenario(messages: int, delay: int) -> Dict[str, float]:
+    """ตั้งเวลาลบข้อความจำนวนมากผ่าน schedule_auto_delete แล้ววัดเวลาจนลบครบ"""
+    work_dir = tempfile.mkdtemp(prefix="ytmp3bench_")
+    channel_id = next(iter(bot.TARGET_CHANNEL_IDS), 1)
+    channel = FakeChannel(channel_id)
+    author = FakeUser(1, Recorder(), "")
+    bot.STATE_STORE = StateStore(os.path.join(work_dir, "state.sqlite3"))
+    await bot.STATE_STORE.open()
+    bot.AUTO_DELETE_SCHEDULER = AutoDeleteScheduler(
+        lambda _channel_id: channel, on_flushed=bot.STATE_STORE.remove_deletions
+    )
+    bot.AUTO_DELETE_ENABLED = True
+    bot.AUTO_DELETE_DELAY = delay
+
+    try:
+        started = time.monotonic()
+        for _ in range(messages):
+            bot.schedule_auto_delete(FakeMessage(channel, "hello", author=author))
+        schedule_seconds = time.monotonic() - started
+        while len(channel.deleted) < messages:
+            await asyncio.sleep(0.05)
+        drain_seconds = time.monotonic() - started
+    finally:
+        await bot.AUTO_DELETE_SCHEDULER.stop()
+        await bot.STATE_STORE.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "messages": messages,
+        "schedule_per_sec": round(messages / schedule_seconds, 1) if schedule_seconds else 0.0,
+        "drain_seconds": round(drain_seconds, 3),
+        "bulk_requests": channel.bulk_deletes,
+        "single_requests": channel.single_deletes,
+    }
+
+
+def run_fetch_scenario(
+    server: MediaServer,
+    small_path: str,
+    big_path: str,
+    jobs: int,
+    fragments: int,
+    chunk_bytes: int,
+    bandwidth: int,
+) -> Dict[str, float]:
+    """โหลดไฟล์ต้นทางอย่างเดียว (ไม่แปลง ไม่ต้องมี ffmpeg) ผ่าน iter_ranges พร้อมกัน jobs งาน
+    งานแรกเป็นไฟล์ใหญ่ ที่เหลือไฟล์เล็ก ดูว่าไฟล์ใหญ่แย่งแบนด์วิดท์จนงานเล็กช้าหรือไม่ (small_p95)"""
+    pool = ConnectionPool(max_idle_per_host=max(2, fragments * jobs))
+    bucket = TokenBucket(bandwidth)
+    ranges = ThreadPoolExecutor(max_workers=max(1, fragments * jobs), thread_name_prefix="bench-range")
+    urls = [server.add_track("fetchbig000", big_path)] + [server.add_track("fetchsml000", small_path)] * (jobs - 1)
+    requests_before = server.requests
+    durations: List[float] = [0.0] * len(urls)
+    received: List[int] = [0] * len(urls)
+
+    def fetch(index: int) -> None:
+        started = time.monotonic()
+        for chunk in iter_ranges(urls[index], {}, ranges, pool, bucket, chunk_bytes, fragments):
+            received[index] += len(chunk)
+        durations[index] = time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(urls)) as jobs_pool:
+        list(jobs_pool.map(fetch, range(len(urls))))
+    wall = time.monotonic() - started
+    ranges.shutdown()
+    pool.close()
+    conns = pool.stats()
+    small = durations[1:] or durations
+    return {
+        "fragments": fragments,
+        "jobs": len(urls),
+        "wall_seconds": round(wall, 3),
+        "mb_per_sec": round(sum(received) / (1024 * 1024) / wall, 2) if wall else 0.0,
+        "big_seconds": round(durations[0], 3),
+        "small_p50": round(percentile(small, 50), 3),
+        "small_p95": round(percentile(small, 95), 3),
+        "requests": server.requests - requests_before,
+        "conns_opened": conns["opened"],
+        "conns_reused": conns["reused"],
+        "throttled_s": round(bucket.throttled_seconds, 2),
+    }
+
+
+class FakeExtractor:
+    """ตัวตนปลอมของ YouTube ต่อ profile: ความเร็วปกติ, ถูกจำกัดความเร็วหลังงานที่ throttle_after,
+    ถูกถามว่าเป็นบอทหลังงานที่ botcheck_after (นับงานของ profile นั้นเอง) และฟื้นเมื่อพ้นเวลา recover_after"""
+
+    def __init__(
+        self,
+        speed: float,
+        throttle_after: int = 0,
+        throttled_speed: float = 16 * 1024,
+        botcheck_after: int = 0,
+        recover_after: float = 0.0,
+    ):
+        self.speed = speed
+        self.throttle_after = throttle_after
+        self.throttled_speed = throttled_speed
+        self.botcheck_after = botcheck_after
+        self.recover_after = recover_after  # วินาทีจำลองหลังเริ่มโดนจำกัด (0 = ไม่ฟื้น)
+        self.jobs = 0
+        self.limited_since: Optional[float] = None
+
+    def run(self, nbytes: int, now: float) -> float:
+        """คืนเวลาที่ใช้โหลด (วินาที) หรือโยน error แบบที่ yt-dlp โยน"""
+        self.jobs += 1
+        if self.limited_since is not None and self.recover_after and now - self.limited_since >= self.recover_after:
+            self.jobs, self.limited_since = 1, None
+        if self.botcheck_after and self.jobs > self.botcheck_after:
+            self.limited_since = self.limited_since if self.limited_since is not None else now
+            raise RuntimeError("ERROR: [youtube] Sign in to confirm you're not a bot")
+        if self.throttle_after and self.jobs > self.throttle_after:
+            self.limited_since = self.limited_since if self.limited_since is not None else now
+            return nbytes / self.throttled_speed
+        return nbytes / self.speed
+
+
+def run_profile_scenario(jobs: int, single: bool, seed: int) -> Dict[str, object]:
+    """จำลองงาน jobs งาน (ทีละงาน เว้นช่วง 2 วินาที) ผ่าน ProfilePool ด้วยนาฬิกาจำลอง
+    single = ใช้ profile เดียวแบบเดิม (เทียบกับหลาย profile + circuit breaker)"""
+    rng = random.Random(seed)
+    now = [0.0]
+    fakes = {
+        # ตัวหลักเร็วแต่โดนถามว่าเป็นบอทหลังงานที่ 60 (ฟื้นหลัง 30 นาที)
+        "android": FakeExtractor(4 * 1024 * 1024, botcheck_after=60, recover_after=1800),
+        # ช้ากว่าแต่ถูกจำกัดความเร็วหลังงานที่ 150
+        "web-b": FakeExtractor(2 * 1024 * 1024, throttle_after=150, recover_after=1200),
+        # ตัวสำรองที่ช้าแต่ไม่เคยมีปัญหา
+        "tv-c": FakeExtractor(1 * 1024 * 1024),
+    }
+    names = ["android"] if single else list(fakes)
+    pool = ProfilePool(
+        [ExtractorProfile(name=n) for n in names],
+        failure_threshold=3,
+        cooldown_seconds=300,
+        min_throughput=64 * 1024,
+        clock=lambda: now[0],
+    )
+    per: Dict[str, Dict[str, float]] = {n: {"jobs": 0, "ok": 0, "failed": 0, "bytes": 0, "seconds": 0.0} for n in names}
+    latencies: List[float] = []
+    for _ in range(jobs):
+        nbytes = rng.randint(2, 8) * 1024 * 1024
+        profile = pool.acquire()
+        stat = per[profile.name]
+        stat["jobs"] += 1
+        try:
+            seconds = fakes[profile.name].run(nbytes, now[0])
+        except RuntimeError as e:
+            now[0] += 1.0
+            stat["failed"] += 1
+            pool.report_failure(profile, e)
+        else:
+            now[0] += seconds
+            latencies.append(seconds)
+            stat["ok"] += 1
+            stat["bytes"] += nbytes
+            stat["seconds"] += seconds
+            pool.report_success(profile, nbytes, seconds)
+        now[0] += 2.0
+
+    health = {p["name"]: p for p in pool.snapshot()}
+    rows = []
+    for name, stat in per.items():
+        rows.append({
+            "profile": name,
+            "jobs": stat["jobs"],
+            "ok": stat["ok"],
+            "failed": stat["failed"],
+            "mb_per_sec": round(stat["bytes"] / (1024 * 1024) / stat["seconds"], 2) if stat["seconds"] else 0.0,
+            "trips": health[name]["trips"],
+            "state": health[name]["state"],
+        })
+    ok = sum(r["ok"] for r in rows)
+    return {
+        "mode": "single" if single else "pool",
+        "jobs": jobs,
+        "success_rate": round(ok / jobs, 3) if jobs else 0.0,
+        "p50_seconds": round(percentile(latencies, 50), 2),
+        "p95_seconds": round(percentile(latencies, 95), 2),
+        "virtual_minutes": round(now[0] / 60, 1),
+        "profiles": rows,
+    }
+
+
+# ----------------- main -----------------
+
+def print_table(rows: List[Dict[str, float]]) -> None:
+    if not rows:
+        return
+    headers = list(rows[0])
+    widths = [max(len(h), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(h.rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).rjust(w) for h, w in zip(headers, widths)))
+
+
+async def main_async(args) -> Dict[str, object]:
+    mix = parse_mix(args.mix)
+    media_dir = tempfile.mkdtemp(prefix="ytmp3bench_media_")
+    server = MediaServer(media_dir, throttle_bytes_per_sec=args.throttle_kbps * 1024)
+    server.start()
+    report: Dict[str, object] = {"downloads": [], "fetch": [], "autodel": None, "profiles": []}
+    # ค่าของการโหลดแบบแบ่งช่วง + งบแบนด์วิดท์ที่งานดาวน์โหลดจริงจะใช้
+    downloader.DOWNLOAD_FRAGMENTS = args.fragments[-1]
+    downloader.HTTP_CHUNK_SIZE = args.chunk_kb * 1024
+    downloader.BANDWIDTH = TokenBucket(args.bandwidth_kbps * 1024)
+    try:
+        track_files = {}
+        for entry in mix:
+            if entry.duration not in track_files:
+                path = os.path.join(media_dir, f"sine_{entry.duration}.wav")
+                write_sine_wav(path, entry.duration)
+                track_files[entry.duration] = path
+
+        if args.jobs > 0:
+            for workers in args.workers:
+                workload = build_workload(server, track_files, mix, args.jobs, args.dup_ratio, args.seed)
+                result = await run_download_scenario(server, workload, workers, args.users, args.cache_mb * 1024 * 1024)
+                report["downloads"].append(result.summary())
+            print_table(report["downloads"])
+
+        if args.fetch_jobs > 0:
+            small_path = os.path.join(media_dir, "fetch_small.bin")
+            big_path = os.path.join(media_dir, "fetch_big.bin")
+            for path, size_mb in ((small_path, args.fetch_mb), (big_path, args.fetch_mb * 4)):
+                with open(path, "wb") as f:
+                    f.write(os.urandom(int(size_mb * 1024 * 1024)))
+            for fragments in args.fragments:
+                report["fetch"].append(await asyncio.to_thread(
+                    run_fetch_scenario, server, small_path, big_path, args.fetch_jobs,
+                    fragments, args.chunk_kb * 1024, args.bandwidth_kbps * 1024,
+                ))
+            print()
+            print_table(report["fetch"])
+
+        if args.autodel_messages > 0:
+            report["autodel"] = await run_autodel_scenario(args.autodel_messages, args.autodel_delay)
+            print()
+            print_table([report["autodel"]])
+
+        if args.profile_jobs > 0:
+            for single in (True, False):
+                result = run_profile_scenario(args.profile_jobs, single, args.seed)
+                report["profiles"].append(result)
+                print()
+                print_table([{k: v for k, v in result.items() if k != "profiles"}])
+                print_table(result["profiles"])
+    finally:
+        server.stop()
+        shutil.rmtree(media_dir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="วัดประสิทธิภาพบอทแบบออฟไลน์ด้วย YouTube/Discord ปลอม")
+    parser.add_argument("--jobs", type=int, default=20, help="จำนวนงานดาวน์โหลดต่อรอบ (0 = ข้าม)")
+    parser.add_argument("--workers", default="1,2,4", help="จำนวน worker ที่จะลอง คั่นด้วย ,")
+    parser.add_argument("--mix", default="30:mp3:3,120:mp3:1", help="ความยาว:รูปแบบ:น้ำหนัก คั่นด้วย ,")
+    parser.add_argument("--dup-ratio", type=float, default=0.0, help="สัดส่วนงานที่ขอคลิปซ้ำ (0-1)")
+    parser.add_argument("--users", type=int, default=5, help="จำนวนผู้ใช้ปลอมที่ส่งงาน")
+    parser.add_argument("--cache-mb", type=int, default=256, help="ขนาดแคช (MB, 0 = ปิด)")
+    parser.add_argument("--throttle-kbps", type=int, default=0, help="จำกัดความเร็วเซิร์ฟเวอร์ต่อการเชื่อมต่อ (KB/s)")
+    parser.add_argument("--fragments", default="1,4", help="จำนวนช่วงที่โหลดพร้อมกันต่องานที่จะลอง คั่นด้วย , (ค่าสุดท้ายใช้กับงานดาวน์โหลด)")
+    parser.add_argument("--chunk-kb", type=int, default=512, help="ขนาดช่วงที่ขอต่อครั้ง (KB)")
+    parser.add_argument("--bandwidth-kbps", type=int, default=0, help="งบแบนด์วิดท์รวมทุกงาน (KB/s, 0 = ไม่จำกัด)")
+    parser.add_argument("--fetch-jobs", type=int, default=4, help="จำนวนงานในรอบวัดการโหลดไฟล์ต้นทางอย่างเดียว (0 = ข้าม)")
+    parser.add_argument("--fetch-mb", type=float, default=4, help="ขนาดไฟล์เล็กในรอบวัดการโหลด (MB, ไฟล์ใหญ่ = 4 เท่า)")
+    parser.add_argument("--autodel-messages", type=int, default=500, help="จำนวนข้อความที่ทดสอบลบอัตโนมัติ (0 = ข้าม)")
+    parser.add_argument("--autodel-delay", type=int, default=1)
+    parser.add_argument("--profile-jobs", type=int, default=0, help="จำนวนงานในรอบจำลอง extractor profile (0 = ข้าม)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = parser.parse_args()
+    args.workers = [int(w) for w in args.workers.split(",") if w.strip()]
+    args.fragments = [int(f) for f in args.fragments.split(",") if f.strip()] or [1]
+
+    report = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
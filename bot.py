@@ -1,14 +1,25 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import hashlib
+import itertools
+import json
 import os
+import re
+import shutil
+import signal
 import tempfile
-from typing import Optional, Set, Dict, Callable, Awaitable
-from collections import deque
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Optional, Set, Dict, List, Tuple, Callable, Awaitable
 
 import discord
 from discord.ext import commands
 from discord import app_commands
 
+from attachment_index import AttachmentIndex
+from autodel_scheduler import AutoDeleteScheduler
+from bounded_maps import SnowflakeSet, TTLDict
 from config import (
     TOKEN,
     TARGET_CHANNEL_IDS,
@@ -17,26 +28,151 @@ from config import (
     ADMIN_IDS,
     AUTO_DELETE_DEFAULT_DELAY,
     MAX_FILE_SIZE_BYTES,
+    DOWNLOAD_WORKERS,
+    MAX_QUEUE_DEPTH,
+    CACHE_DIR,
+    CACHE_MAX_BYTES,
+    ATTACHMENT_INDEX_FILE,
+    PREFETCH_CONCURRENCY,
+    STATE_DB_PATH,
+    STATE_FLUSH_INTERVAL,
+    EXEMPT_RETENTION_DAYS,
+    METRICS_SAMPLE_INTERVAL,
+    PROGRESS_EDIT_INTERVAL,
+    PER_USER_CONCURRENT_JOBS,
+    PER_USER_JOBS_PER_HOUR,
+    BATCH_MAX_ITEMS,
+    BATCH_MAX_IN_QUEUE,
+    TEMP_DIR,
+    TEMP_BUDGET_BYTES,
+    TEMP_RAM_DIR,
+    TEMP_RAM_BUDGET_BYTES,
+    TEMP_RAM_MAX_JOB_BYTES,
+    BROKER_URL,
+    DOWNLOAD_JOB_TIMEOUT,
+    WORKER_CLAIM_TIMEOUT,
+    BROKER_POLL_INTERVAL,
+    LOW_MEMORY_MODE,
+    MESSAGE_CACHE_SIZE,
+    PENDING_URL_TTL_SECONDS,
+    PENDING_URL_MAX,
+    EXEMPT_MAX_IDS,
+    SHARD_COUNT,
 )
-from form_view import YTMP3View, build_form_embed
-from keep_alive import keep_alive
+from download_queue import AdmissionError, DownloadJob, DownloadScheduler, QueueFullError, QuotaExceededError
+from downloader import (
+    OUTPUT_FORMATS,
+    PROFILE_POOL,
+    EncodeOptions,
+    JobCancelled,
+    Progress,
+    ProgressCallback,
+    TooLongForSingleFile,
+    build_filename,
+    estimate_work_bytes,
+    extract_video_id,
+    run_download,
+    run_expand_playlist,
+    run_prefetch,
+    shutdown_executor,
+    warm_up,
+    zip_files_blocking,
+)
+from form_view import SplitOfferView, YTMP3View, build_form_embed
+from job_broker import RemoteRunner, open_broker
+from job_stats import JobStats
+from keep_alive import keep_alive, start_health_server
+from metrics import MetricsRegistry, process_rss_bytes
+from mp3_cache import Mp3Cache
+from progress_reporter import ProgressEditor
+from shard_stats import ShardStats, shard_for_guild
+from state_store import StateStore
+from temp_storage import TempLease, TempStorage
 
 # ----------------- ตัวแปรสถานะในหน่วยความจำ -----------------
 
 AUTO_DELETE_ENABLED: bool = False
 AUTO_DELETE_DELAY: int = AUTO_DELETE_DEFAULT_DELAY
-EXEMPT_MESSAGE_IDS: Set[int] = set()  # id ข้อความที่ "ยกเว้นไม่ลบ"
+# id ข้อความที่ "ยกเว้นไม่ลบ" (จำกัดจำนวน ตัดข้อความเก่าสุดออกพร้อมลบจากฐานข้อมูล)
+EXEMPT_MESSAGE_IDS = SnowflakeSet(EXEMPT_MAX_IDS, on_evict=lambda message_id: STATE_STORE.remove_exempt(message_id))
 
 # เก็บสถานะรอชื่อไฟล์ จากคำสั่ง ytmp3 (ข้อความปกติ / slash)
-# key = user.id, value = url ที่จะโหลด
-PENDING_URL_BY_USER: Dict[int, str] = {}
-# คิวงานดาวน์โหลด (ให้ทำทีละ 1 งาน)
-# เก็บเป็น list ของ tuple: (discord.User, url, custom_name)
-DOWNLOAD_QUEUE = deque()
-IS_DOWNLOADING: bool = False
-CANCEL_ALL_DOWNLOADS: bool = False
+# key = user.id, value = (url ที่จะโหลด, รูปแบบไฟล์) หมดอายุถ้าผู้ใช้ไม่ตอบ
+PENDING_URL_BY_USER: "TTLDict[int, Tuple[str, str]]" = TTLDict(
+    PENDING_URL_TTL_SECONDS, PENDING_URL_MAX, on_evict=lambda user_id: STATE_STORE.remove_pending_url(user_id)
+)
 
+# hash ของ slash commands ที่ซิงค์สำเร็จล่าสุด (โหลดจาก STATE_STORE) ไม่เปลี่ยน = ไม่ต้องซิงค์ใหม่
+SYNCED_COMMAND_HASH: Optional[str] = None
+
+# แคชไฟล์ที่แปลงแล้ว (key = video id + codec/bitrate)
+DEFAULT_ENCODE_OPTIONS = EncodeOptions()
+MP3_CACHE = Mp3Cache(CACHE_DIR, CACHE_MAX_BYTES)
+# งานโหลดที่กำลังทำอยู่ (key แคช -> future) ให้คำขอซ้ำรอผลร่วมกัน
+_INFLIGHT_DOWNLOADS: Dict[str, asyncio.Future] = {}
+# สถิติเวลา CPU ต่อรูปแบบไฟล์ (ดูผลของการ remux)
+JOB_STATS = JobStats()
+# metric สำหรับ /metrics ของ keep_alive (Prometheus)
+METRICS = MetricsRegistry()
+JOB_STAGE_SECONDS = METRICS.histogram(
+    "ytmp3_job_stage_seconds",
+    "เวลาที่ใช้ต่อขั้นของงาน (queue_wait/prefetch/metadata/download/transcode/split/dm/upload/total)",
+    ["stage"],
+)
+JOBS_TOTAL = METRICS.counter("ytmp3_jobs_total", "จำนวนงานแยกตามผลลัพธ์", ["result"])
+JOB_BYTES_TOTAL = METRICS.counter("ytmp3_job_bytes_total", "จำนวนไบต์ที่โหลด (source) และที่ได้ (output)", ["kind"])
+JOB_CPU_SECONDS_TOTAL = METRICS.counter("ytmp3_job_cpu_seconds_total", "เวลา CPU ของ ffmpeg", ["codec", "remuxed"])
+QUEUE_DEPTH = METRICS.gauge("ytmp3_queue_depth", "จำนวนช่องคิวที่รออยู่")
+QUEUE_WAITING_REQUESTS = METRICS.gauge("ytmp3_queue_waiting_requests", "จำนวนคำขอที่รออยู่ (รวมคำขอที่ถูกรวมช่อง)")
+ACTIVE_WORKERS = METRICS.gauge("ytmp3_active_workers", "จำนวน worker ที่กำลังทำงาน")
+CACHE_BYTES = METRICS.gauge("ytmp3_cache_bytes", "ขนาดแคชไฟล์เสียง")
+CACHE_ENTRIES = METRICS.gauge("ytmp3_cache_entries", "จำนวนไฟล์ในแคช")
+CACHE_EVENTS_TOTAL = METRICS.counter("ytmp3_cache_events_total", "hit/miss/eviction ของแคช", ["event"])
+TEMP_RESERVED_BYTES = METRICS.gauge("ytmp3_temp_reserved_bytes", "พื้นที่ชั่วคราวที่จองไว้", ["pool"])
+TEMP_WAITING = METRICS.gauge("ytmp3_temp_waiting_jobs", "จำนวนงานที่รอพื้นที่ชั่วคราว")
+AUTODEL_PENDING = METRICS.gauge("ytmp3_autodel_pending", "จำนวนข้อความที่รอลบ")
+PROCESS_RSS = METRICS.gauge("ytmp3_process_rss_bytes", "หน่วยความจำที่ process บอทใช้อยู่ (RSS)")
+MEMORY_MAP_ENTRIES = METRICS.gauge("ytmp3_memory_map_entries", "จำนวนรายการในสถานะในหน่วยความจำ", ["map"])
+SHARD_LATENCY = METRICS.gauge("ytmp3_shard_latency_seconds", "ความหน่วง heartbeat ของแต่ละ shard", ["shard"])
+SHARD_EVENT_RATE = METRICS.gauge("ytmp3_shard_event_rate", "event ที่บอทจัดการต่อวินาที (ค่าเฉลี่ยเคลื่อนที่) ต่อ shard", ["shard"])
+SHARD_EVENTS_TOTAL = METRICS.counter("ytmp3_shard_events_total", "จำนวน event ที่บอทจัดการต่อ shard", ["shard", "event"])
+SHARD_GUILDS = METRICS.gauge("ytmp3_shard_guilds", "จำนวนเซิร์ฟเวอร์ต่อ shard", ["shard"])
+SHARD_RECONNECTS_TOTAL = METRICS.counter("ytmp3_shard_reconnects_total", "การต่อ gateway ใหม่ต่อ shard", ["shard", "kind"])
+EXTRACTOR_PROFILE_UP = METRICS.gauge(
+    "ytmp3_extractor_profile_up", "สถานะ extractor profile (1 = ใช้ได้, 0.5 = กำลังทดลอง, 0 = ถูกพัก)", ["profile"]
+)
+EXTRACTOR_PROFILE_JOBS_TOTAL = METRICS.counter(
+    "ytmp3_extractor_profile_jobs_total", "ผลของงานต่อ extractor profile", ["profile", "result"]
+)
+EXTRACTOR_PROFILE_THROUGHPUT = METRICS.gauge(
+    "ytmp3_extractor_profile_throughput_bytes", "ความเร็วโหลดเฉลี่ยต่อ extractor profile", ["profile"]
+)
+EVENT_LOOP_LAG = METRICS.gauge("ytmp3_event_loop_lag_seconds", "ความหน่วงของ event loop ล่าสุด")
+EVENT_LOOP_LAG_HIST = METRICS.histogram(
+    "ytmp3_event_loop_lag_histogram_seconds",
+    "การกระจายของความหน่วง event loop",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+# ลิงก์ไฟล์แนบบน Discord CDN ที่เคยส่งแล้ว (ใช้ส่งซ้ำโดยไม่ต้องอัปโหลดใหม่)
+ATTACHMENT_INDEX = AttachmentIndex(ATTACHMENT_INDEX_FILE)
+# สถิติต่อ shard (ความหน่วง, อัตรา event, การต่อใหม่)
+SHARD_STATS = ShardStats()
+# แก้ข้อความสถานะระหว่างโหลด (รวมชุดต่อห้อง ไม่ให้ชน rate limit)
+PROGRESS_EDITOR = ProgressEditor(PROGRESS_EDIT_INTERVAL)
+# สถานะถาวร (SQLite) ตัวแปรด้านบนคือสำเนาในหน่วยความจำ ทุกครั้งที่แก้ต้องบันทึกผ่านตัวนี้ด้วย
+STATE_STORE = StateStore(STATE_DB_PATH, STATE_FLUSH_INTERVAL, EXEMPT_RETENTION_DAYS)
+
+# พื้นที่ทำงานชั่วคราวของงานโหลด (จองก่อนเริ่ม ไม่ให้งานพร้อมกันจนดิสก์เต็ม)
+TEMP_STORAGE = TempStorage(
+    TEMP_DIR,
+    TEMP_BUDGET_BYTES,
+    ram_root=TEMP_RAM_DIR or None,
+    ram_budget_bytes=TEMP_RAM_BUDGET_BYTES,
+    ram_max_job_bytes=TEMP_RAM_MAX_JOB_BYTES,
+)
 
+# ตั้ง BROKER_URL = ส่งงานโหลด/แปลงไฟล์ให้ worker.py ทำ (เปิดใน setup_hook) บอททำแค่ Discord + อัปโหลด
+REMOTE_RUNNER: Optional[RemoteRunner] = None
 
 
 # ----------------- ฟังก์ชันช่วยต่าง ๆ -----------------
@@ -50,116 +186,317 @@ def is_admin(user: discord.abc.User) -> bool:
     return user.id in ADMIN_IDS or is_owner(user)
 
 
-async def download_mp3(url: str, custom_name: Optional[str]) -> str:
-    """โหลดและแปลง YouTube เป็น MP3 แล้วคืน path ไฟล์ชั่วคราวกลับมา"""
-    import yt_dlp  # นำเข้าในฟังก์ชัน เพื่อลดโอกาส import error ตอนยังไม่ติดตั้ง
-
-    temp_dir = tempfile.mkdtemp(prefix="ytmp3_")
-    ydl_opts = {
-        # ใช้ตัวเลือก format แบบยืดหยุ่นขึ้น เผื่อกรณีบางคลิปไม่มี bestaudio/best แบบเดิม
-        # yt-dlp จะลอง bestaudio*, best, ba ตามลำดับ
-        "format": "bestaudio* / bestaudio / best / ba",
-
-        "outtmpl": os.path.join(temp_dir, "%(title)s.%(ext)s"),
-        "noplaylist": True,
-        "quiet": True,
-        "no_warnings": True,
-        # ใช้ client แบบ Android ของ YouTube แทน web ปกติ (วิธีที่ 1 ไม่ใช้ browser / cookies)
-        "extractor_args": {
-            "youtube": {
-                "player_client": ["android"],
-            }
-        },
-        # ปลอม User-Agent ให้เหมือนแอป YouTube บน Android
-        "http_headers": {
-            "User-Agent": "com.google.android.youtube/18.14.37 (Linux; U; Android 11)"
-        },
-        # ใช้คุกกี้จากไฟล์ cookies.txt เพื่อผ่าน “Sign in to confirm you’re not a bot”
-        "cookiefile": "cookies.txt",
-        # กันไว้ ถ้าไฟล์ต้นทางใหญ่เกิน 30 MB จะหยุดโหลดตั้งแต่ต้น
-        "max_filesize": MAX_FILE_SIZE_BYTES,
-        "postprocessors": [
-            {
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "192",
-            }
-        ],
-        # บังคับให้ ffmpeg ทำเสียงเป็น 2 แชนแนล (กันปัญหา track แปลก ๆ)
-        "postprocessor_args": ["-ac", "2"],
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        title = info.get("title", "audio")
-        original_path = ydl.prepare_filename(info)
-        base, _ext = os.path.splitext(original_path)
-        mp3_path = base + ".mp3"
-
-    # ถ้าผู้ใช้ตั้งชื่อเอง -> เปลี่ยนชื่อไฟล์
-    if custom_name:
-        safe_name = custom_name.replace("/", "_").replace("\\", "_").strip() or title
-        new_path = os.path.join(temp_dir, safe_name + ".mp3")
-        os.replace(mp3_path, new_path)
-        mp3_path = new_path
-
-    return mp3_path
-
-
-async def send_mp3_to_dm(user: discord.User, url: str, custom_name: Optional[str]):
-    """โหลด + ส่งไฟล์ MP3 ไป DM ของผู้ใช้ (ใช้ร่วมกับระบบคิว)"""
-    dm = await user.create_dm()
-    status_msg = await dm.send("⏳ กำลังดาวน์โหลดและแปลงเป็น MP3...")
-    mp3_path: Optional[str] = None
+@dataclass
+class DownloadResult:
+    path: str
+    title: str
+    cache_key: Optional[str] = None  # ไม่ใช่ None = ไฟล์อยู่ในแคช (ต้อง release หลังใช้)
+    cache_hit: bool = False
+    parts: List[str] = field(default_factory=list)  # ไฟล์ย่อยเมื่อแบ่งไฟล์ (ไม่แบ่ง = [path])
+    lease: Optional[TempLease] = None  # พื้นที่ชั่วคราวที่ไฟล์นี้ใช้อยู่ (ไม่ใช่ไฟล์ในแคช)
+
+    def __post_init__(self):
+        if not self.parts:
+            self.parts = [self.path]
+
+
+async def download_mp3(
+    url: str,
+    options: EncodeOptions = DEFAULT_ENCODE_OPTIONS,
+    info: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> DownloadResult:
+    """โหลดและแปลง YouTube เป็นไฟล์เสียงตาม options (ใช้แคชก่อนถ้ามี)
+    งานหนักรันใน pool แยก ไม่บล็อก event loop ของบอท
+
+    ถ้ามีงาน key เดียวกันกำลังโหลดอยู่ จะรอผลจากงานนั้น (single-flight) แทนการโหลดซ้ำ
+    info = metadata ที่ prefetch ไว้ตอนรอคิว (ถ้ามี จะไม่ resolve format ซ้ำ)
+    progress = callback ความคืบหน้า (ถูกเรียกจาก thread ของ pool)
+    """
+    video_id = extract_video_id(url)
+    # ผลแบบแบ่งหลายไฟล์ไม่เก็บแคช (แคชเก็บไฟล์เดียวต่อ key)
+    key = options.cache_key(video_id) if video_id and not options.split else None
+    if not key:
+        return await _download_uncached(url, options, key, info, progress)
+
+    while True:
+        entry = MP3_CACHE.get(key)
+        if entry is not None:
+            return DownloadResult(entry.path, entry.title, cache_key=key, cache_hit=True)
+        inflight = _INFLIGHT_DOWNLOADS.get(key)
+        if inflight is None:
+            break
+        # asyncio.wait ไม่ยกเลิกงานต้นทางเมื่อเราถูกยกเลิก และไม่โยน CancelledError เมื่องานต้นทางถูกยกเลิก
+        await asyncio.wait([inflight])
+        if inflight.cancelled():
+            # งานต้นทางถูกผู้ขอของมันยกเลิก -> วนกลับไป: ผู้รอคนแรกเป็นเจ้าของงานใหม่ คนอื่นรองานนั้นต่อ
+            continue
+        inflight.result()  # งานต้นทางล้มเหลว -> โยน error เดียวกัน
+        entry = MP3_CACHE.get(key)
+        if entry is not None:
+            return DownloadResult(entry.path, entry.title, cache_key=key)
+        # เก็บเข้าแคชไม่ได้ (เช่นไฟล์ใหญ่เกินแคช) ไฟล์แชร์กันไม่ได้ -> โหลดเองตามปกติ
+        return await _download_uncached(url, options, key, info, progress)
+
+    fut = asyncio.get_running_loop().create_future()
+    # กันเตือน "exception was never retrieved" ตอนไม่มีใครรอผล
+    fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _INFLIGHT_DOWNLOADS[key] = fut
+    try:
+        result = await _download_uncached(url, options, key, info, progress)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(None)
+        return result
+    finally:
+        _INFLIGHT_DOWNLOADS.pop(key, None)
+
+
+async def _download_uncached(
+    url: str,
+    options: EncodeOptions,
+    key: Optional[str],
+    info: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> DownloadResult:
+    # จองพื้นที่ชั่วคราวก่อนเริ่มโหลด (ถ้างบเต็มจะรอตรงนี้)
+    waited = time.monotonic()
+    lease = await TEMP_STORAGE.acquire(estimate_work_bytes(info, options))
+    JOB_STAGE_SECONDS.observe(time.monotonic() - waited, stage="temp_wait")
     try:
-        mp3_path = await download_mp3(url, custom_name)
-        # ถ้าแอดมินกดยกเลิกทั้งหมดระหว่างโหลด ให้ยกเลิกการส่งไฟล์
-        from config import MAX_FILE_SIZE_BYTES as _MAX
+        if REMOTE_RUNNER is not None:
+            outcome = await REMOTE_RUNNER.download(url, options, info, progress, lease.root)
+        else:
+            outcome = await run_download(
+                url, options, info, progress, lease.root, on_failure_settled=lease.release
+            )
+    except BaseException:
+        # downloader ลบโฟลเดอร์ของงานที่ล้มเหลวเองแล้ว
+        # งานในเครื่องคืน lease เองหลัง thread จบจริง (ตอน timeout thread ยังเขียนไฟล์อยู่ได้)
+        if REMOTE_RUNNER is not None:
+            lease.release()
+        raise
+    temp_root = os.path.dirname(outcome.path)
+    try:
+        JOB_STATS.record(outcome.codec, outcome.remuxed, outcome.cpu_seconds, outcome.media_seconds)
+        for stage, seconds in outcome.stage_seconds.items():
+            JOB_STAGE_SECONDS.observe(seconds, stage=stage)
+        JOB_CPU_SECONDS_TOTAL.inc(outcome.cpu_seconds, codec=outcome.codec, remuxed=str(outcome.remuxed).lower())
+        JOB_BYTES_TOTAL.inc(outcome.source_bytes, kind="source")
+        output_bytes = sum(os.path.getsize(p) for p in outcome.parts)
+        JOB_BYTES_TOTAL.inc(output_bytes, kind="output")
+        path, title = outcome.path, outcome.title
+        if key and len(outcome.parts) == 1:
+            entry = await MP3_CACHE.put_async(key, path, title)
+            if entry is not None:
+                _remove_temp_dir(temp_root)
+                lease.release()
+                return DownloadResult(entry.path, title, cache_key=key)
+    except BaseException:
+        _remove_temp_dir(temp_root)
+        lease.release()
+        raise
+    # เหลือแค่ไฟล์ผลลัพธ์ที่รอส่ง -> คืนพื้นที่ส่วนที่จองเผื่อไว้
+    lease.resize(output_bytes)
+    return DownloadResult(path, title, parts=outcome.parts, lease=lease)
+
+
+def _remove_temp_dir(temp_root: str) -> None:
+    try:
+        for name in os.listdir(temp_root):
+            try:
+                os.remove(os.path.join(temp_root, name))
+            except OSError:
+                pass
+        os.rmdir(temp_root)
+    except OSError:
+        pass
+
+
+async def deliver_file(dm: discord.abc.Messageable, result: DownloadResult, filename: str):
+    """ส่งไฟล์ให้ผู้ใช้ ถ้าเคยอัปโหลดไฟล์เดียวกัน (ชื่อเดียวกัน) แล้วและลิงก์ CDN ยังใช้ได้ ส่งลิงก์เดิมแทน"""
+    index_key = AttachmentIndex.make_key(result.cache_key, filename) if result.cache_key else None
+    if index_key:
+        url = await ATTACHMENT_INDEX.get(index_key)
+        if url is not None:
+            await dm.send(url)
+            return
+
+    sent = await dm.send(file=discord.File(result.path, filename=filename))
+    if index_key and sent.attachments:
+        await ATTACHMENT_INDEX.put(index_key, sent.attachments[0].url)
+
+
+def _format_mb(num_bytes: float) -> str:
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+def format_progress(update: Progress, label: str) -> str:
+    """ข้อความสถานะจาก Progress ของ downloader"""
+    percent = f" {update.fraction * 100:.0f}%" if update.fraction is not None else ""
+    if update.stage == "download":
+        details = [_format_mb(update.downloaded_bytes)]
+        if update.total_bytes:
+            details[0] += f" / {_format_mb(update.total_bytes)}"
+        if update.speed:
+            details.append(f"{_format_mb(update.speed)}/s")
+        return f"⏳ กำลังดาวน์โหลด{percent} ({', '.join(details)})"
+    if update.stage == "transcode":
+        return f"🎛️ กำลังแปลงเป็น {label}{percent}..."
+    if update.stage == "split":
+        return "✂️ กำลังแบ่งไฟล์..."
+    return f"⏳ กำลังทำงาน ({update.stage})..."
+
+
+def encode_options_for(fmt: str, split: bool = False) -> EncodeOptions:
+    """แปลงชื่อรูปแบบไฟล์ที่ผู้ใช้เลือกเป็น EncodeOptions"""
+    if fmt == DEFAULT_ENCODE_OPTIONS.codec and not split:
+        return DEFAULT_ENCODE_OPTIONS
+    return EncodeOptions(codec=fmt, split=split)
+
+
+def parse_output_format(raw: Optional[str]) -> Optional[str]:
+    """ตรวจรูปแบบไฟล์ที่ผู้ใช้พิมพ์มา (ว่าง = mp3) คืน None ถ้าไม่รองรับ"""
+    fmt = (raw or "").strip().lower() or "mp3"
+    return fmt if fmt in OUTPUT_FORMATS else None
+
+
+def _split_offer_view(
+    error: TooLongForSingleFile,
+    user: discord.User,
+    url: str,
+    custom_name: Optional[str],
+    fmt: str,
+) -> SplitOfferView:
+    """ปุ่มให้ผู้ใช้กดยืนยันส่งงานเดิมเข้าคิวใหม่แบบแบ่งไฟล์"""
+    async def accept_split(interaction: discord.Interaction):
+        try:
+            text = await enqueue_download(user, url, custom_name, fmt, split=True)
+        except AdmissionError as full:
+            await interaction.response.send_message(f"🚫 {full} กรุณาลองใหม่อีกครั้งภายหลัง")
+            return
+        await interaction.response.send_message(text)
+
+    return SplitOfferView(parts=error.parts, on_accept=accept_split)
+
+
+async def send_mp3_to_dm(
+    user: discord.User,
+    url: str,
+    custom_name: Optional[str],
+    fmt: str = "mp3",
+    split: bool = False,
+    info: Optional[dict] = None,
+):
+    """โหลด + ส่งไฟล์เสียงไป DM ของผู้ใช้ (ใช้ร่วมกับระบบคิว)"""
+    started = time.monotonic()
+    dm = await user.create_dm()
+    label = "ไฟล์ต้นฉบับ" if fmt == "original" else fmt.upper()
+    status_msg = await dm.send(f"⏳ กำลังดาวน์โหลดและแปลงเป็น {label}...")
+    JOB_STAGE_SECONDS.observe(time.monotonic() - started, stage="dm")
+    result: Optional[DownloadResult] = None
+
+    # progress มาจาก thread ของ pool -> ส่งต่อเข้า loop และหยุดรับเมื่อจะแก้ข้อความเป็นผลลัพธ์สุดท้าย
+    loop = asyncio.get_running_loop()
+    progress_open = True
+
+    def apply_progress(text: str):
+        if progress_open:
+            PROGRESS_EDITOR.update(status_msg, text)
+
+    def on_progress(update: Progress):
+        loop.call_soon_threadsafe(apply_progress, format_progress(update, label))
 
+    async def final_edit(**kwargs):
+        nonlocal progress_open
+        progress_open = False
+        await PROGRESS_EDITOR.finish(status_msg)
+        await status_msg.edit(**kwargs)
+
+    try:
+        result = await download_mp3(
+            url,
+            encode_options_for(fmt, split),
+            info,
+            progress=on_progress if PROGRESS_EDITOR.enabled else None,
+        )
+        upload_started = time.monotonic()
         # ตรวจขนาดไฟล์อีกชั้น (กันพลาด)
-        file_size = os.path.getsize(mp3_path)
-        if file_size > _MAX:
-            await status_msg.edit(content=f"⚠️ ไฟล์ใหญ่เกิน {_MAX // (1024*1024)} MB ส่งผ่าน Discord ไม่ได้")
+        if any(os.path.getsize(part) > MAX_FILE_SIZE_BYTES for part in result.parts):
+            await final_edit(content=f"⚠️ ไฟล์ใหญ่เกิน {MAX_FILE_SIZE_BYTES // (1024*1024)} MB ส่งผ่าน Discord ไม่ได้")
+            JOBS_TOTAL.inc(result="too_large")
+            return
+        if len(result.parts) > 1:
+            total = len(result.parts)
+            await final_edit(content=f"✅ โหลดเสร็จแล้ว แบ่งเป็น {total} ไฟล์ กำลังส่งให้ครับ")
+            for index, part in enumerate(result.parts, start=1):
+                _base, ext = os.path.splitext(part)
+                filename = build_filename(custom_name, result.title, ext, suffix=f" ({index}-{total})")
+                await dm.send(file=discord.File(part, filename=filename))
         else:
-            await status_msg.edit(content="✅ โหลดเสร็จแล้ว ส่งไฟล์ให้แล้วครับ")
-            await dm.send(file=discord.File(mp3_path, filename=os.path.basename(mp3_path)))
+            await final_edit(content="✅ โหลดเสร็จแล้ว ส่งไฟล์ให้แล้วครับ")
+            # ชื่อไฟล์ที่ผู้ใช้ตั้ง ใส่ตอนอัปโหลด (ไฟล์ในแคชใช้ชื่อตาม key)
+            _base, ext = os.path.splitext(result.path)
+            filename = build_filename(custom_name, result.title, ext)
+            await deliver_file(dm, result, filename)
+        JOB_STAGE_SECONDS.observe(time.monotonic() - upload_started, stage="upload")
+        JOBS_TOTAL.inc(result="cache_hit" if result.cache_hit else "ok")
+    except (asyncio.CancelledError, JobCancelled):
+        # ยกเลิกด้วย /cancel หรือ cancel_downloads (งานหนักใน thread ถูกหยุดและลบไฟล์แล้ว)
+        JOBS_TOTAL.inc(result="cancelled")
+        try:
+            await final_edit(content="🛑 ยกเลิกงานนี้แล้ว")
+        except discord.HTTPException:
+            pass
+        raise
+    except TooLongForSingleFile as e:
+        JOBS_TOTAL.inc(result="too_long")
+        # รู้ตั้งแต่ขั้นอ่าน metadata ยังไม่ได้โหลดจริง -> เสนอให้แบ่งไฟล์แทน
+        await final_edit(
+            content=f"⚠️ {e}\nกดปุ่มด้านล่างถ้าต้องการให้แบ่งเป็น {e.parts} ไฟล์ย่อย",
+            view=_split_offer_view(e, user, url, custom_name, fmt),
+        )
     except Exception as e:
-        await status_msg.edit(content=f"❌ เกิดข้อผิดพลาด: {e}")
+        JOBS_TOTAL.inc(result="error")
+        await final_edit(content=f"❌ เกิดข้อผิดพลาด: {e}")
     finally:
-        if mp3_path and os.path.isfile(mp3_path):
-            try:
-                temp_root = os.path.dirname(mp3_path)
-                for name in os.listdir(temp_root):
-                    try:
-                        os.remove(os.path.join(temp_root, name))
-                    except OSError:
-                        pass
-                os.rmdir(temp_root)
-            except OSError:
-                pass
+        if result is not None:
+            release_result(result)
+
 
+def release_result(result: DownloadResult) -> None:
+    """คืนไฟล์หลังส่งเสร็จ (ปลดล็อกไฟล์ในแคช หรือลบโฟลเดอร์ชั่วคราวและคืนพื้นที่ที่จองไว้)"""
+    if result.cache_key:
+        MP3_CACHE.release(result.cache_key)
+    elif os.path.isfile(result.path):
+        _remove_temp_dir(os.path.dirname(result.path))
+    if result.lease is not None:
+        result.lease.release()
 
-async def schedule_auto_delete(message: discord.Message):
-    """ตั้งเวลาลบข้อความ (ถ้าเปิดระบบ autodel และห้องอยู่ในลิสต์)"""
+
+def schedule_auto_delete(message: discord.Message) -> bool:
+    """ตั้งเวลาลบข้อความ (ถ้าเปิดระบบ autodel และห้องอยู่ในลิสต์) คืน True ถ้าตั้งเวลาแล้ว
+    ข้อความจะถูกลบรวมเป็นชุดโดย AUTO_DELETE_SCHEDULER ไม่มี task แยกต่อข้อความ"""
     if isinstance(message.channel, discord.DMChannel):
-        return
+        return False
     if not AUTO_DELETE_ENABLED:
-        return
+        return False
     if TARGET_CHANNEL_IDS and message.channel.id not in TARGET_CHANNEL_IDS:
-        return
+        return False
     if message.id in EXEMPT_MESSAGE_IDS:
-        return
+        return False
     if message.author.bot:
-        return
+        return False
 
-    await asyncio.sleep(max(1, AUTO_DELETE_DELAY))
-
-    # เช็คอีกที เผื่อระหว่างนั้นมีเปลี่ยนสถานะ
-    if AUTO_DELETE_ENABLED and message.id not in EXEMPT_MESSAGE_IDS:
-        try:
-            await message.delete()
-        except discord.HTTPException:
-            pass
+    due_at = time.time() + max(1, AUTO_DELETE_DELAY)
+    AUTO_DELETE_SCHEDULER.schedule(message.channel.id, message.id, 0, due_at=due_at)
+    STATE_STORE.add_deletion(message.channel.id, message.id, due_at)
+    return True
 
 
 def _check_ytmp3_channel(channel) -> bool:
@@ -172,29 +509,328 @@ def _check_ytmp3_channel(channel) -> bool:
 
 # ----------------- สร้างบอท -----------------
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+if LOW_MEMORY_MODE:
+    # เฉพาะที่คำสั่งใช้: ข้อความในห้อง/DM (คำสั่ง !, รอชื่อไฟล์, autodel) + ข้อมูลเซิร์ฟเวอร์/ห้อง
+    # ไม่เก็บสมาชิก / สถานะออนไลน์ / อีโมจิ / reaction ในหน่วยความจำ
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    _bot_options = {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    _bot_options = {}
+
+if SHARD_COUNT in ("", "0"):
+    bot = commands.Bot(command_prefix="!", intents=intents, max_messages=MESSAGE_CACHE_SIZE or None, **_bot_options)
+else:
+    # แบ่ง gateway เป็นหลาย shard ใน process เดียว (คิว/autodel/สถานะเป็นชุดเดียวกันทุก shard)
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        max_messages=MESSAGE_CACHE_SIZE or None,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        **_bot_options,
+    )
+SHARDED = isinstance(bot, commands.AutoShardedBot)
+
+# ตัวตั้งเวลาลบข้อความ (task เดียว ลบรวมเป็นชุดต่อห้อง)
+AUTO_DELETE_SCHEDULER = AutoDeleteScheduler(
+    lambda channel_id: bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id),
+    on_flushed=STATE_STORE.remove_deletions,
+)
+
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+async def restore_state():
+    """โหลดสถานะที่บันทึกไว้กลับเข้าหน่วยความจำ แล้วคืนคิวงาน/ข้อความรอลบที่ค้างจากรอบก่อน"""
+    global AUTO_DELETE_ENABLED, AUTO_DELETE_DELAY, SYNCED_COMMAND_HASH
+    state = await STATE_STORE.load()
+
+    settings = state["settings"]
+    SYNCED_COMMAND_HASH = settings.get("command_tree_hash")
+    if "autodel_enabled" in settings:
+        AUTO_DELETE_ENABLED = settings["autodel_enabled"] == "1"
+    if "autodel_delay" in settings:
+        AUTO_DELETE_DELAY = int(settings["autodel_delay"])
+    ADMIN_IDS.update(state["admins"])
+    EXEMPT_MESSAGE_IDS.update(state["exempt"])
+    PENDING_URL_BY_USER.update(state["pending_urls"])
+
+    # ข้อความที่เลยเวลาแล้วจะถูกลบในรอบถัดไปของตัวตั้งเวลา
+    for message_id, channel_id, due_at in state["deletions"]:
+        AUTO_DELETE_SCHEDULER.schedule(channel_id, message_id, 0, due_at=due_at)
+
+    # job_id เริ่มนับใหม่ทุกครั้งที่รัน -> ล้างแถวเดิมแล้วใส่คิวใหม่ (ได้แถวใหม่ตาม id ใหม่)
+    STATE_STORE.clear_jobs()
+    restored = 0
+    for _job_id, user_id, url, custom_name, fmt, split in state["jobs"]:
+        try:
+            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+            # งานเดิมนับโควตาไปแล้วตอนส่งครั้งแรก
+            await enqueue_download(user, url, custom_name, fmt, bool(split), quota_exempt=True)
+            restored += 1
+        except (discord.HTTPException, AdmissionError) as e:
+            print(f"คืนงานของผู้ใช้ {user_id} ไม่ได้:", e)
+    print(
+        f"โหลดสถานะเดิมแล้ว: งานในคิว {restored} งาน, "
+        f"ข้อความรอลบ {len(state['deletions'])} ข้อความ"
+    )
 
 
-@bot.event
-async def on_ready():
-    # ซิงค์ slash commands
+def update_runtime_gauges():
+    """อัปเดตค่า gauge ที่อ่านจากสถานะปัจจุบัน (คิว, แคช, autodel)"""
+    QUEUE_DEPTH.set(DOWNLOAD_SCHEDULER.waiting_count)
+    QUEUE_WAITING_REQUESTS.set(DOWNLOAD_SCHEDULER.waiting_requests)
+    ACTIVE_WORKERS.set(DOWNLOAD_SCHEDULER.running_count)
+    AUTODEL_PENDING.set(AUTO_DELETE_SCHEDULER.pending_count)
+    temp = TEMP_STORAGE.stats()
+    TEMP_RESERVED_BYTES.set(temp["reserved"], pool="disk")
+    TEMP_RESERVED_BYTES.set(temp["ram_reserved"], pool="ram")
+    TEMP_WAITING.set(temp["waiting"])
+    update_shard_gauges()
+    for profile in PROFILE_POOL.snapshot():
+        name = profile["name"]
+        EXTRACTOR_PROFILE_UP.set(_PROFILE_STATE_VALUE.get(profile["state"], 0.0), profile=name)
+        EXTRACTOR_PROFILE_JOBS_TOTAL.set_total(profile["successes"], profile=name, result="ok")
+        EXTRACTOR_PROFILE_JOBS_TOTAL.set_total(profile["failures"], profile=name, result="failed")
+        if profile["throughput"] is not None:
+            EXTRACTOR_PROFILE_THROUGHPUT.set(profile["throughput"], profile=name)
+    PROCESS_RSS.set(process_rss_bytes())
+    MEMORY_MAP_ENTRIES.set(len(PENDING_URL_BY_USER), map="pending_urls")
+    MEMORY_MAP_ENTRIES.set(len(EXEMPT_MESSAGE_IDS), map="exempt_messages")
+    MEMORY_MAP_ENTRIES.set(len(bot.cached_messages), map="message_cache")
+    stats = MP3_CACHE.stats()
+    CACHE_BYTES.set(stats["bytes"])
+    CACHE_ENTRIES.set(stats["entries"])
+    for event in ("hits", "misses", "evictions"):
+        CACHE_EVENTS_TOTAL.set_total(stats[event], event=event.rstrip("s"))
+
+
+async def monitor_event_loop():
+    """วัดความหน่วงของ event loop (ตื่นช้ากว่ากำหนดเท่าไร) และเก็บค่า gauge ทุก ๆ รอบ
+    ค่าทั้งหมดถูกอ่านบน loop นี้ Flask thread อ่านแค่ผลใน METRICS"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(METRICS_SAMPLE_INTERVAL)
+        lag = max(0.0, loop.time() - started - METRICS_SAMPLE_INTERVAL)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HIST.observe(lag)
+        prune_memory_state()
+        update_runtime_gauges()
+
+
+_PROFILE_STATE_VALUE = {"closed": 1.0, "half_open": 0.5, "open": 0.0}
+_PROFILE_STATE_ICON = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+
+
+def update_shard_gauges():
+    """เก็บความหน่วง/อัตรา event/จำนวนเซิร์ฟเวอร์ ของแต่ละ shard"""
+    latencies = dict(bot.latencies) if SHARDED else {0: bot.latency}
+    SHARD_STATS.sample(latencies)
+    guilds: Dict[int, int] = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+    for shard_id, info in SHARD_STATS.shards.items():
+        shard = str(shard_id)
+        if info.latency is not None:
+            SHARD_LATENCY.set(info.latency, shard=shard)
+        SHARD_EVENT_RATE.set(info.events_per_sec, shard=shard)
+        SHARD_GUILDS.set(guilds.get(shard_id, 0), shard=shard)
+        for event, count in info.events.items():
+            SHARD_EVENTS_TOTAL.set_total(count, shard=shard, event=event)
+        SHARD_RECONNECTS_TOTAL.set_total(info.resume_count, shard=shard, kind="resume")
+        SHARD_RECONNECTS_TOTAL.set_total(info.disconnect_count, shard=shard, kind="disconnect")
+
+
+_LAST_EXEMPT_PRUNE = 0.0
+
+
+def prune_memory_state():
+    """ล้างสถานะในหน่วยความจำที่หมดอายุ (รอชื่อไฟล์ที่ไม่มีใครตอบ, ข้อความยกเว้นที่เก่าเกิน EXEMPT_RETENTION_DAYS)"""
+    global _LAST_EXEMPT_PRUNE
+    PENDING_URL_BY_USER.prune()
+    if time.monotonic() - _LAST_EXEMPT_PRUNE > 3600:
+        _LAST_EXEMPT_PRUNE = time.monotonic()
+        # ฐานข้อมูลตัดข้อความเก่าตอน compact อยู่แล้ว ตรงนี้ตัดสำเนาในหน่วยความจำให้ตรงกัน
+        cutoff = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=EXEMPT_RETENTION_DAYS))
+        EXEMPT_MESSAGE_IDS.prune_older_than(cutoff)
+
+
+def command_tree_hash() -> str:
+    """hash ของ slash commands ทั้งหมด (ชื่อ, คำอธิบาย, พารามิเตอร์, ตัวเลือก) ของแอปนี้"""
+    payload = sorted(
+        (cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()),
+        key=lambda c: (c.get("type", 1), c["name"]),
+    )
+    raw = json.dumps({"app": bot.application_id, "commands": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def sync_command_tree(force: bool = False) -> bool:
+    """ซิงค์ slash commands เฉพาะเมื่อ tree เปลี่ยนจากครั้งที่ซิงค์สำเร็จล่าสุด (force = ซิงค์เสมอ)
+    คืน True ถ้าซิงค์จริง"""
+    global SYNCED_COMMAND_HASH
+    digest = command_tree_hash()
+    if not force and digest == SYNCED_COMMAND_HASH:
+        print("slash commands ไม่เปลี่ยน ข้ามการซิงค์")
+        return False
+    await bot.tree.sync()
+    SYNCED_COMMAND_HASH = digest
+    STATE_STORE.set_setting("command_tree_hash", digest)
+    print("ซิงค์ slash commands แล้ว")
+    return True
+
+
+async def startup_background():
+    """งานตอนเริ่มที่ไม่ต้องรอก่อนต่อ gateway: ซิงค์ slash commands + อุ่นเครื่อง yt_dlp"""
+    started = time.monotonic()
     try:
-        await bot.tree.sync()
-        print("ซิงค์ slash commands แล้ว")
+        await sync_command_tree()
     except Exception as e:
         print("Sync slash command error:", e)
-    print(f"ล็อกอินเป็น {bot.user} (ID: {bot.user.id})")
+    if REMOTE_RUNNER is not None:
+        return  # yt_dlp รันที่ worker (worker อุ่นเครื่องเองตอนเริ่ม)
+    try:
+        await warm_up()
+        print(f"อุ่นเครื่อง yt_dlp แล้ว ({time.monotonic() - started:.1f} วินาที)")
+    except Exception as e:
+        print("Warm up error:", e)
+
+
+_BACKGROUND_TASKS: List[asyncio.Task] = []
+# server ของหน้า health ในโหมดประหยัดหน่วยความจำ / RSS ตอน on_ready ครั้งแรก (ไว้เทียบกับตอนรันไปนาน ๆ)
+HEALTH_SERVER = None
+READY_RSS: Optional[int] = None
+
+
+@bot.event
+async def setup_hook():
+    # เรียกครั้งเดียวหลังล็อกอิน (ก่อนต่อ gateway) ต่างจาก on_ready ที่เรียกซ้ำทุกครั้งที่ reconnect
+    global REMOTE_RUNNER, HEALTH_SERVER
+    # โฟลเดอร์งานที่ค้างจากรอบก่อน (ล่มกลางงาน) ไม่มีใครใช้แล้ว -> กวาดทิ้งก่อนรับงานใหม่
+    # (ไม่ลบของบอทตัวอื่นที่ยังทำงานอยู่) โฟลเดอร์แบบเก่าใน /tmp ลบเฉพาะที่ค้างนานเกินเวลางานสูงสุด
+    loop = asyncio.get_running_loop()
+    try:
+        # SIGTERM (systemd / docker stop) ปิดบอทแบบเดียวกับ Ctrl+C เพื่อให้ข้อมูลที่ค้างอยู่ถูกเขียนลงดิสก์
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(bot.close()))
+    except (NotImplementedError, RuntimeError):
+        pass
+    swept, freed = await loop.run_in_executor(
+        None, TEMP_STORAGE.sweep_orphans, (tempfile.gettempdir(),), float(DOWNLOAD_JOB_TIMEOUT or 3600)
+    )
+    if swept:
+        print(f"ลบโฟลเดอร์ชั่วคราวที่ค้างอยู่ {swept} โฟลเดอร์ ({_format_mb(freed)})")
+    await STATE_STORE.open()
+    if BROKER_URL:
+        broker = await loop.run_in_executor(None, open_broker, BROKER_URL)
+        REMOTE_RUNNER = RemoteRunner(broker, BROKER_POLL_INTERVAL, WORKER_CLAIM_TIMEOUT, DOWNLOAD_JOB_TIMEOUT)
+        print("ส่งงานดาวน์โหลดให้ worker ผ่าน broker")
+    await restore_state()
+    _BACKGROUND_TASKS.append(asyncio.create_task(monitor_event_loop(), name="event-loop-monitor"))
+    _BACKGROUND_TASKS.append(asyncio.create_task(startup_background(), name="startup-background"))
+    if LOW_MEMORY_MODE:
+        # หน้า health/metrics บน loop นี้เลย (ไม่ต้องมี Flask + thread แยก)
+        HEALTH_SERVER = await start_health_server(METRICS.render)
+
+
+_discord_close = bot.close
+_SHUTDOWN_DONE = False
+
+
+async def close_bot():
+    """ปิดบอท: ตัดการเชื่อมต่อ Discord ก่อน แล้วเขียนสถานะที่ค้างอยู่ลงฐานข้อมูลและปิด resource ที่เปิดไว้"""
+    global _SHUTDOWN_DONE, HEALTH_SERVER
+    await _discord_close()
+    if _SHUTDOWN_DONE:
+        return
+    _SHUTDOWN_DONE = True
+    for task in _BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*_BACKGROUND_TASKS, return_exceptions=True)
+    # ปิดฐานข้อมูลก่อนหยุดคิว: งานที่ถูกตัดกลางคันจะไม่ถูกลบออกจากสถานะ (รีสตาร์ทแล้วกลับเข้าคิวใหม่)
+    await STATE_STORE.close()
+    await ATTACHMENT_INDEX.close()
+    if HEALTH_SERVER is not None:
+        await HEALTH_SERVER.cleanup()
+        HEALTH_SERVER = None
+    # process pool ของงานโหลด/แปลง + thread pool + connection pool ของการโหลดแบบแบ่งช่วง
+    shutdown_executor()
+
+
+bot.close = close_bot
+
+
+@bot.event
+async def on_ready():
+    # ซิงค์ slash commands ทำครั้งเดียวเบื้องหลังตั้งแต่ setup_hook (ไม่ซิงค์ซ้ำทุกครั้งที่ reconnect)
+    global READY_RSS
+    print(f"ล็อกอินเป็น {bot.user} (ID: {bot.user.id})" + (f" | {bot.shard_count} shard" if SHARDED else ""))
+    if not SHARDED:
+        SHARD_STATS.on_ready(0)
+    if READY_RSS is None:
+        READY_RSS = process_rss_bytes()
+        print(f"หน่วยความจำหลังพร้อมใช้งาน: {_format_mb(READY_RSS)} (โหมดประหยัดหน่วยความจำ: {'เปิด' if LOW_MEMORY_MODE else 'ปิด'})")
+
+
+# เหตุการณ์ของการเชื่อมต่อ gateway: โหมดไม่แบ่ง shard ใช้ on_connect/... (shard 0) โหมดแบ่งใช้ on_shard_*
+
+
+@bot.event
+async def on_connect():
+    if not SHARDED:
+        SHARD_STATS.on_connect(0)
+
+
+@bot.event
+async def on_resumed():
+    if not SHARDED:
+        SHARD_STATS.on_resumed(0)
+
+
+@bot.event
+async def on_disconnect():
+    if not SHARDED:
+        SHARD_STATS.on_disconnect(0)
+
+
+@bot.event
+async def on_shard_connect(shard_id: int):
+    SHARD_STATS.on_connect(shard_id)
+
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    SHARD_STATS.on_ready(shard_id)
+    ready = SHARD_STATS.shards[shard_id].last_ready_seconds
+    print(f"shard {shard_id} พร้อมแล้ว" + (f" ({ready:.1f} วินาที)" if ready is not None else ""))
+
+
+@bot.event
+async def on_shard_resumed(shard_id: int):
+    SHARD_STATS.on_resumed(shard_id)
+
+
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    SHARD_STATS.on_disconnect(shard_id)
+
+
+@bot.listen("on_interaction")
+async def count_interaction(interaction: discord.Interaction):
+    SHARD_STATS.record_event(shard_for_guild(interaction.guild_id, bot.shard_count or 1), "interaction")
 
 
 @bot.event
 async def on_message(message: discord.Message):
+    SHARD_STATS.record_event(message.guild.shard_id if message.guild else 0, "message")
+
     # ตั้งเวลาลบ (ถ้าเปิด autodel)
     if not isinstance(message.channel, discord.DMChannel):
-        bot.loop.create_task(schedule_auto_delete(message))
+        schedule_auto_delete(message)
 
     # ให้ระบบ command ทำงาน
     await bot.process_commands(message)
@@ -205,7 +841,8 @@ async def on_message(message: discord.Message):
 
     user_id = message.author.id
     if user_id in PENDING_URL_BY_USER:
-        url = PENDING_URL_BY_USER.pop(user_id)
+        url, fmt = PENDING_URL_BY_USER.pop(user_id)
+        STATE_STORE.remove_pending_url(user_id)
         file_name_raw = message.content.strip()
 
         if file_name_raw.lower() == "no":
@@ -213,7 +850,11 @@ async def on_message(message: discord.Message):
         else:
             custom_name = file_name_raw or None
 
-        status_text = await enqueue_download(message.author, url, custom_name)
+        try:
+            status_text = await enqueue_download(message.author, url, custom_name, fmt)
+        except AdmissionError as e:
+            await message.channel.send(f"🚫 {e} กรุณาลองใหม่อีกครั้งภายหลัง", reference=message)
+            return
         await message.channel.send(
             status_text + " เดี๋ยวผมจะส่งไฟล์ให้ทาง DM 👍",
             reference=message,
@@ -222,61 +863,445 @@ async def on_message(message: discord.Message):
 
 # ----------------- ระบบคิวดาวน์โหลด -----------------
 
-async def enqueue_download(user: discord.User, url: str, custom_name: Optional[str]) -> str:
-    """ใส่งานเข้า queue และสตาร์ท worker ถ้ายังไม่รัน คืนข้อความสรุปสถานะ"""
-    job = (user, url, custom_name)
-    DOWNLOAD_QUEUE.append(job)
-    position = len(DOWNLOAD_QUEUE)
-    # ถ้ายังไม่มีงานกำลังทำ -> เริ่มประมวลผลคิวเลย
-    if not IS_DOWNLOADING:
-        bot.loop.create_task(process_download_queue())
-    if IS_DOWNLOADING and position > 1:
-        return f"📥 มีงานกำลังดาวน์โหลดอยู่แล้ว คิวของคุณอยู่ลำดับที่ {position}"
+def _format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"~{seconds} วินาที"
+    return f"~{seconds // 60} นาที {seconds % 60} วินาที"
+
+
+def get_queue_status_text(user_id: Optional[int] = None) -> str:
+    """สรุปสถานะคิว + ลำดับ/ETA ของงานของผู้ใช้ (ถ้าระบุ user_id)"""
+    running = DOWNLOAD_SCHEDULER.running_count
+    waiting = DOWNLOAD_SCHEDULER.waiting_count
+    if running == 0 and waiting == 0:
+        return "✅ ตอนนี้คิวว่าง ไม่มีงานดาวน์โหลดค้างอยู่"
+
+    lines = [
+        f"📥 กำลังดาวน์โหลด {running}/{DOWNLOAD_SCHEDULER.workers} งาน และมีคิวรออีก {waiting} งาน"
+    ]
+    requests = DOWNLOAD_SCHEDULER.waiting_requests
+    if requests > waiting:
+        lines.append(f"(คำขอที่รอทั้งหมด {requests} รายการ บางรายการเป็นคลิปเดียวกันจึงโหลดครั้งเดียว)")
+    if user_id is not None:
+        for job in DOWNLOAD_SCHEDULER.jobs_for_user(user_id):
+            position = DOWNLOAD_SCHEDULER.position(job.job_id)
+            eta = _format_eta(DOWNLOAD_SCHEDULER.eta_seconds(job.job_id))
+            merged = DOWNLOAD_SCHEDULER.merged_count(job.job_id)
+            note = f" รวมกับคำขอเดียวกันอีก {merged} รายการ" if merged else ""
+            if position == 0:
+                lines.append(f"• งาน #{job.job_id} ของคุณกำลังดาวน์โหลด (เสร็จใน {eta}){note}")
+            elif position is not None:
+                lines.append(f"• งาน #{job.job_id} ของคุณอยู่ลำดับที่ {position} (เสร็จใน {eta}){note}")
+    return "\n".join(lines)
+
+
+async def enqueue_download(
+    user: discord.User,
+    url: str,
+    custom_name: Optional[str],
+    fmt: str = "mp3",
+    split: bool = False,
+    quota_exempt: bool = False,
+) -> str:
+    """ใส่งานเข้า queue (worker จะเริ่มเองอัตโนมัติ) คืนข้อความสรุปสถานะ
+    ถ้าคิวเต็มหรือเกินโควตาจะโยน AdmissionError"""
+    job = _submit_job(user, url, custom_name, fmt, split, quota_exempt)
+    STATE_STORE.add_job(job.job_id, user.id, url, custom_name, fmt, split)
+    position = DOWNLOAD_SCHEDULER.position(job.job_id) or 0
+    merged = DOWNLOAD_SCHEDULER.merged_count(job.job_id)
+    if merged:
+        eta = _format_eta(DOWNLOAD_SCHEDULER.eta_seconds(job.job_id))
+        where = "กำลังโหลดอยู่" if position == 0 else f"อยู่คิวลำดับที่ {position}"
+        return f"🔗 งาน #{job.job_id} ใช้คลิปเดียวกับคำขออื่นที่{where} (คาดว่าเสร็จใน {eta})"
+    free_slots = DOWNLOAD_SCHEDULER.workers - DOWNLOAD_SCHEDULER.running_count
+    if position > free_slots:
+        eta = _format_eta(DOWNLOAD_SCHEDULER.eta_seconds(job.job_id))
+        return f"📥 งาน #{job.job_id} อยู่คิวลำดับที่ {position} (คาดว่าเสร็จใน {eta})"
+    return f"⏳ เริ่มประมวลผลงานดาวน์โหลด #{job.job_id} ของคุณแล้ว..."
+
+
+def _submit_job(
+    user: discord.User,
+    url: str,
+    custom_name: Optional[str],
+    fmt: str,
+    split: bool = False,
+    quota_exempt: bool = False,
+    batch_id: Optional[int] = None,
+) -> DownloadJob:
+    # คลิปเดียวกัน + ค่าการเข้ารหัสเดียวกัน ใช้ช่องคิวร่วมกัน (ต้องเปิดแคชไว้ถึงจะแชร์ไฟล์ได้)
+    video_id = extract_video_id(url)
+    options = encode_options_for(fmt, split)
+    dedup_key = options.cache_key(video_id) if video_id and MP3_CACHE.enabled and not split else None
+    admin = is_admin(user)
+    # ช่องด่วน: งานแอดมิน และงานที่มีไฟล์ในแคชแล้ว (เสร็จเร็ว ไม่ควรรอหลังงานโหลดยาว ๆ)
+    priority = admin or (dedup_key is not None and MP3_CACHE.contains(dedup_key))
+    return DOWNLOAD_SCHEDULER.submit(
+        user,
+        url,
+        custom_name,
+        fmt=fmt,
+        split=split,
+        dedup_key=dedup_key,
+        priority=priority,
+        quota_exempt=admin or quota_exempt,
+        batch_id=batch_id,
+    )
+
+
+# ----------------- ชุดงาน (เพลย์ลิสต์ / หลายลิงก์) -----------------
+
+@dataclass
+class BatchItem:
+    url: str
+    title: str = ""
+    result: Optional[DownloadResult] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class DownloadBatch:
+    """ชุดงานที่แตกเป็นงานย่อยในคิวเดียวกับงานปกติ (ได้ทั้ง fair share, dedup และแคช)
+    ผลทั้งหมดรวมเป็นไฟล์ zip แล้วสรุปในข้อความเดียว แทนที่จะส่งสถานะทีละคลิป"""
+    batch_id: int
+    user: discord.User
+    fmt: str
+    name: Optional[str]
+    items: List[BatchItem]
+    status_msg: Optional[discord.Message] = None
+    pending: Dict[int, int] = field(default_factory=dict)  # job_id ที่ยังไม่เสร็จ -> index ใน items
+    backlog: List[int] = field(default_factory=list)  # index ใน items ที่ยังไม่ได้ป้อนเข้าคิว
+    finish_task: Optional[asyncio.Task] = None
+
+
+# งานย่อยของชุดงานไม่ถูกบันทึกลง STATE_STORE (รีสตาร์ทแล้วชุดงานที่ค้างจะหายไป)
+BATCHES: Dict[int, DownloadBatch] = {}
+_BATCH_IDS = itertools.count(1)
+_URL_RE = re.compile(r"https?://[^\s,<>]+")
+
+
+def parse_batch_urls(text: str) -> List[str]:
+    """ดึงลิงก์ทั้งหมดจากข้อความ (คั่นด้วยช่องว่าง / ขึ้นบรรทัด / จุลภาค) ตัดลิงก์ซ้ำ"""
+    return list(dict.fromkeys(_URL_RE.findall(text)))
+
+
+def is_batch_request(urls: List[str]) -> bool:
+    """หลายลิงก์ หรือเป็นลิงก์เพลย์ลิสต์ล้วน (ไม่มีคลิปเดี่ยวให้โหลด) -> ทำเป็นชุดงาน"""
+    return len(urls) > 1 or (len(urls) == 1 and "list=" in urls[0] and extract_video_id(urls[0]) is None)
+
+
+async def expand_batch_urls(urls: List[str], limit: int) -> List[BatchItem]:
+    """แตกลิงก์เป็นรายการคลิป (อ่านเพลย์ลิสต์พร้อมกัน) ไม่เกิน limit คลิป ตัดคลิปซ้ำ
+    ลิงก์ที่อ่านไม่ได้จะอยู่ในรายการพร้อม error"""
+
+    async def expand(url: str) -> List[BatchItem]:
+        # ลิงก์คลิปเดี่ยวไม่ต้องถาม yt-dlp (ลิงก์ที่มี list= ในโหมดชุดงานถือเป็นเพลย์ลิสต์)
+        if extract_video_id(url) and "list=" not in url:
+            return [BatchItem(url)]
+        try:
+            if REMOTE_RUNNER is not None:
+                entries = await REMOTE_RUNNER.expand_playlist(url, limit)
+            else:
+                entries = await run_expand_playlist(url, limit)
+        except Exception as e:
+            return [BatchItem(url, error=f"อ่านรายการไม่ได้: {e}")]
+        if not entries:
+            return [BatchItem(url, error="ไม่พบคลิปในลิงก์นี้")]
+        return [BatchItem(entry_url, title) for entry_url, title in entries]
+
+    expanded = await asyncio.gather(*(expand(url) for url in urls))
+    items: List[BatchItem] = []
+    seen: Set[str] = set()
+    for item in itertools.chain.from_iterable(expanded):
+        key = extract_video_id(item.url) or item.url
+        if key in seen:
+            continue
+        seen.add(key)
+        items.append(item)
+        if len(items) >= limit:
+            break
+    return items
+
+
+def batch_status_text(batch: DownloadBatch) -> str:
+    total = len(batch.items)
+    done = total - len(batch.pending) - len(batch.backlog)
+    return f"📦 ชุดงาน #{batch.batch_id}: เสร็จแล้ว {done}/{total} คลิป..."
+
+
+def _feed_batch(batch: DownloadBatch) -> None:
+    """ป้อนงานย่อยจาก backlog เข้าคิวจนมีในคิวครบ BATCH_MAX_IN_QUEUE งาน (แต่ละงานนับโควตาต่อชั่วโมง)"""
+    while batch.backlog and (not BATCH_MAX_IN_QUEUE or len(batch.pending) < BATCH_MAX_IN_QUEUE):
+        index = batch.backlog.pop(0)
+        item = batch.items[index]
+        try:
+            job = _submit_job(batch.user, item.url, None, batch.fmt, batch_id=batch.batch_id)
+        except QueueFullError as e:
+            if batch.pending:
+                # คิวรวมเต็ม -> รอป้อนใหม่ตอนงานย่อยที่ค้างอยู่เสร็จ
+                batch.backlog.insert(0, index)
+                return
+            item.error = str(e)
+            continue
+        except QuotaExceededError as e:
+            # โควตาหมดแล้ว รายการที่เหลือก็ส่งไม่ได้เช่นกัน
+            for rest in [index, *batch.backlog]:
+                batch.items[rest].error = str(e)
+            batch.backlog.clear()
+            return
+        except AdmissionError as e:
+            item.error = str(e)
+            continue
+        batch.pending[job.job_id] = index
+
+
+async def enqueue_batch(user: discord.User, urls: List[str], name: Optional[str], fmt: str = "mp3") -> str:
+    """แตกเพลย์ลิสต์/หลายลิงก์เป็นงานย่อยเข้าคิว คืนข้อความสรุปสถานะ
+
+    งานย่อยแต่ละงานนับโควตาต่อชั่วโมงเหมือนงานปกติ และอยู่ในคิวพร้อมกันได้ไม่เกิน BATCH_MAX_IN_QUEUE งาน
+    (ที่เหลือป้อนเข้าคิวเมื่องานก่อนหน้าเสร็จ) ถ้าโควตาหมดตั้งแต่ต้นจะโยน AdmissionError"""
+    if not is_admin(user):
+        DOWNLOAD_SCHEDULER.check_quota(user.id)
+    items = await expand_batch_urls(urls, BATCH_MAX_ITEMS)
+    if not any(item.error is None for item in items):
+        reasons = "\n".join(f"• {item.url}: {item.error}" for item in items[:5])
+        return f"❌ ไม่พบคลิปที่โหลดได้\n{reasons}"
+
+    batch = DownloadBatch(next(_BATCH_IDS), user, fmt, name, items)
+    try:
+        dm = await user.create_dm()
+        batch.status_msg = await dm.send(batch_status_text(batch))
+    except discord.HTTPException:
+        return "❌ ส่ง DM ถึงคุณไม่ได้ กรุณาเปิดรับ DM ก่อนใช้โหมดชุดงาน"
+
+    BATCHES[batch.batch_id] = batch
+    batch.backlog = [index for index, item in enumerate(items) if item.error is None]
+    _feed_batch(batch)
+    if not batch.pending:
+        batch.finish_task = asyncio.create_task(finish_batch(batch))
     else:
-        return "⏳ เริ่มประมวลผลงานดาวน์โหลดของคุณแล้ว..."
+        _update_batch_status(batch)
+    accepted = len(batch.pending) + len(batch.backlog)
+    skipped = len(items) - accepted
+    note = f" (ข้าม {skipped} รายการ ดูรายละเอียดในสรุปท้ายชุด)" if skipped else ""
+    waiting = f" ใส่คิวแล้ว {len(batch.pending)} ที่เหลือจะเข้าคิวเมื่อคลิปก่อนหน้าเสร็จ" if batch.backlog else ""
+    return f"📦 ชุดงาน #{batch.batch_id}: รับ {accepted} คลิปแล้ว{waiting}{note}"
+
+
+def _update_batch_status(batch: DownloadBatch) -> None:
+    if batch.status_msg is not None:
+        PROGRESS_EDITOR.update(batch.status_msg, batch_status_text(batch))
 
 
-async def process_download_queue():
-    """ประมวลผลงานในคิวทีละ 1 งาน"""
-    global IS_DOWNLOADING, CANCEL_ALL_DOWNLOADS
-    if IS_DOWNLOADING:
+def drop_batch_backlog(user_id: Optional[int] = None, reason: str = "ถูกยกเลิก") -> None:
+    """ทิ้งงานย่อยที่ยังไม่ได้ป้อนเข้าคิวของทุกชุดงาน (หรือเฉพาะของผู้ใช้คนนี้) ใช้ตอนสั่งยกเลิกทั้งหมด"""
+    for batch in BATCHES.values():
+        if user_id is not None and batch.user.id != user_id:
+            continue
+        for index in batch.backlog:
+            batch.items[index].error = reason
+        batch.backlog.clear()
+
+
+def batch_job_done(batch: DownloadBatch, job_id: int, error: Optional[str] = None) -> None:
+    """บันทึกว่างานย่อยจบแล้ว (เรียกซ้ำได้) ถ้าครบทุกงานจะเริ่มรวมไฟล์และส่งสรุป"""
+    index = batch.pending.pop(job_id, None)
+    if index is None:
         return
-    IS_DOWNLOADING = True
+    if error is not None:
+        batch.items[index].error = error
+    _feed_batch(batch)
+    if not batch.pending and batch.finish_task is None:
+        batch.finish_task = asyncio.create_task(finish_batch(batch))
+    else:
+        _update_batch_status(batch)
+
+
+async def run_batch_item(batch: DownloadBatch, job: DownloadJob) -> None:
+    """โหลดคลิป 1 รายการของชุดงาน เก็บผลไว้รวม zip ตอนจบชุด (ไม่ส่งข้อความแยก)"""
+    item = batch.items[batch.pending[job.job_id]]
+    error = None
     try:
-        while DOWNLOAD_QUEUE:
-            if CANCEL_ALL_DOWNLOADS:
-                # ถ้ามีคำสั่งยกเลิกทั้งหมด ให้ล้างคิวแล้วหยุด
-                DOWNLOAD_QUEUE.clear()
-                CANCEL_ALL_DOWNLOADS = False
-                break
-            user, url, custom_name = DOWNLOAD_QUEUE[0]
-            try:
-                await send_mp3_to_dm(user, url, custom_name)
-            except Exception as e:
-                try:
-                    dm = await user.create_dm()
-                    await dm.send(f"❌ งานดาวน์โหลดของคุณล้มเหลว: {e}")
-                except Exception:
-                    pass
-            # เอางานนี้ออกจากคิว
-            if DOWNLOAD_QUEUE and DOWNLOAD_QUEUE[0][0].id == user.id:
-                DOWNLOAD_QUEUE.popleft()
+        result = await download_mp3(job.url, encode_options_for(job.fmt), job.prefetched)
+        if job.job_id not in batch.pending:
+            # ชุดงานจบไปก่อนแล้ว (เช่นถูกยกเลิกระหว่างโหลด)
+            release_result(result)
+            return
+        item.result = result
+        item.title = result.title
+        JOBS_TOTAL.inc(result="cache_hit" if result.cache_hit else "ok")
+    except (asyncio.CancelledError, JobCancelled) as e:
+        JOBS_TOTAL.inc(result="cancelled")
+        error = "ถูกยกเลิก"
+        # JobCancelled ไม่ต้องโยนต่อ (ไม่ต้องแจ้งล้มเหลวแยกรายคลิป)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    except Exception as e:
+        JOBS_TOTAL.inc(result="too_long" if isinstance(e, TooLongForSingleFile) else "error")
+        error = str(e)
     finally:
-        IS_DOWNLOADING = False
-        CANCEL_ALL_DOWNLOADS = False
+        batch_job_done(batch, job.job_id, error)
+
+
+async def finish_batch(batch: DownloadBatch) -> None:
+    """รวมไฟล์ของชุดงานเป็น zip (แต่ละไฟล์ไม่เกิน MAX_FILE_SIZE_BYTES) แล้วแก้ข้อความสถานะเป็นสรุป"""
+    lease = await TEMP_STORAGE.acquire(
+        sum(os.path.getsize(item.result.path) for item in batch.items if item.result is not None)
+    )
+    work_dir = tempfile.mkdtemp(prefix="ytmp3_batch_", dir=lease.root)
+    try:
+        files = []
+        for index, item in enumerate(batch.items, start=1):
+            if item.result is None:
+                continue
+            _base, ext = os.path.splitext(item.result.path)
+            files.append((item.result.path, build_filename(f"{index:02d} {item.result.title}", "", ext)))
+        base_name = batch.name or f"ytmp3-batch-{batch.batch_id}"
+        loop = asyncio.get_running_loop()
+        archives = (
+            await loop.run_in_executor(None, zip_files_blocking, files, work_dir, base_name, MAX_FILE_SIZE_BYTES)
+            if files
+            else []
+        )
+
+        total = len(batch.items)
+        lines = [f"📦 ชุดงาน #{batch.batch_id} เสร็จแล้ว: สำเร็จ {len(files)}/{total} คลิป"]
+        if archives:
+            lines[0] += f" รวมเป็น {len(archives)} ไฟล์ zip"
+        failed = [item for item in batch.items if item.result is None]
+        for item in failed[:15]:
+            lines.append(f"• ❌ {item.title or item.url}: {item.error or 'ไม่ทราบสาเหตุ'}")
+        if len(failed) > 15:
+            lines.append(f"• ... และอีก {len(failed) - 15} รายการ")
+        summary = "\n".join(lines)[:1900]
+
+        dm = await batch.user.create_dm()
+        if batch.status_msg is not None:
+            await PROGRESS_EDITOR.finish(batch.status_msg)
+            await batch.status_msg.edit(content=summary)
+        else:
+            await dm.send(summary)
+        for archive in archives:
+            if os.path.getsize(archive) > MAX_FILE_SIZE_BYTES:
+                await dm.send(f"⚠️ {os.path.basename(archive)} ใหญ่เกิน {MAX_FILE_SIZE_BYTES // (1024*1024)} MB ส่งไม่ได้")
+                continue
+            await dm.send(file=discord.File(archive))
+    except Exception as e:
+        print(f"ส่งผลชุดงาน #{batch.batch_id} ไม่สำเร็จ:", e)
+    finally:
+        for item in batch.items:
+            if item.result is not None:
+                release_result(item.result)
+                item.result = None
+        shutil.rmtree(work_dir, ignore_errors=True)
+        lease.release()
+        BATCHES.pop(batch.batch_id, None)
+
+
+def forget_job(job: DownloadJob, reason: str = "ถูกยกเลิก") -> None:
+    """ลบงานที่ถูกเอาออกจากคิว/ยกเลิก ออกจากที่เก็บสถานะและชุดงาน (ถ้าเป็นงานย่อย)"""
+    STATE_STORE.remove_job(job.job_id)
+    batch = BATCHES.get(job.batch_id) if job.batch_id is not None else None
+    if batch is not None:
+        batch_job_done(batch, job.job_id, reason)
+
+
+async def process_download_queue(job: DownloadJob):
+    """ประมวลผลงาน 1 งานจากคิว (ถูกเรียกโดย worker ของ DOWNLOAD_SCHEDULER)"""
+    if job.started_at is not None:
+        JOB_STAGE_SECONDS.observe(job.started_at - job.enqueued_at, stage="queue_wait")
+    batch = BATCHES.get(job.batch_id) if job.batch_id is not None else None
+    try:
+        if batch is not None:
+            await run_batch_item(batch, job)
+        else:
+            await send_mp3_to_dm(job.user, job.url, job.custom_name, job.fmt, job.split, job.prefetched)
+    except JobCancelled:
+        # แจ้งผู้ใช้ไปแล้วใน send_mp3_to_dm (ไม่ต้องส่งว่าล้มเหลวซ้ำ)
+        pass
+    except Exception as e:
+        try:
+            dm = await job.user.create_dm()
+            await dm.send(f"❌ งานดาวน์โหลดของคุณล้มเหลว: {e}")
+        except Exception:
+            pass
+    finally:
+        STATE_STORE.remove_job(job.job_id)
+        JOB_STAGE_SECONDS.observe(time.monotonic() - job.enqueued_at, stage="total")
+
+
+async def prefetch_download_job(job: DownloadJob) -> Optional[dict]:
+    """อ่าน metadata ของงานระหว่างรอคิว (ข้ามถ้าไฟล์อยู่ในแคชแล้ว) โยน exception ถ้างานนี้ทำไม่ได้"""
+    options = encode_options_for(job.fmt, job.split)
+    video_id = extract_video_id(job.url)
+    if video_id and not job.split and MP3_CACHE.contains(options.cache_key(video_id)):
+        return None
+    started = time.monotonic()
+    try:
+        if REMOTE_RUNNER is not None:
+            return await REMOTE_RUNNER.prefetch(job.url, options)
+        return await run_prefetch(job.url, options)
+    finally:
+        JOB_STAGE_SECONDS.observe(time.monotonic() - started, stage="prefetch")
+
+
+async def reject_download_job(job: DownloadJob, error: Exception):
+    """แจ้งผู้ใช้ว่างานถูกปฏิเสธตั้งแต่ขั้นตรวจ metadata (ก่อนถึงคิวจริง)
+    งานย่อยของชุดงานจะไปอยู่ในสรุปท้ายชุดแทนการส่ง DM แยก"""
+    JOBS_TOTAL.inc(result="rejected")
+    if job.batch_id in BATCHES:
+        forget_job(job, str(error))
+        return
+    STATE_STORE.remove_job(job.job_id)
+    try:
+        dm = await job.user.create_dm()
+        if isinstance(error, TooLongForSingleFile):
+            await dm.send(
+                f"⚠️ งาน #{job.job_id}: {error}\nกดปุ่มด้านล่างถ้าต้องการให้แบ่งเป็น {error.parts} ไฟล์ย่อย",
+                view=_split_offer_view(error, job.user, job.url, job.custom_name, job.fmt),
+            )
+        else:
+            await dm.send(f"❌ งาน #{job.job_id} ถูกยกเลิกก่อนเริ่มดาวน์โหลด: {error}")
+    except discord.HTTPException:
+        pass
+
+
+DOWNLOAD_SCHEDULER = DownloadScheduler(
+    process_download_queue,
+    workers=DOWNLOAD_WORKERS,
+    max_depth=MAX_QUEUE_DEPTH,
+    prefetch=prefetch_download_job,
+    on_rejected=reject_download_job,
+    prefetch_concurrency=PREFETCH_CONCURRENCY,
+    per_user_concurrency=PER_USER_CONCURRENT_JOBS,
+    per_user_hourly=PER_USER_JOBS_PER_HOUR,
+)
 
 
 # ----------------- คำสั่งสำหรับดาวน์โหลด MP3 (Hybrid: ใช้ได้ทั้ง ! และ /) -----------------
 
 @bot.hybrid_command(name="ytmp3", description="ดาวน์โหลด YouTube เป็นไฟล์ MP3 และส่งทาง DM")
-@app_commands.describe(url="ลิงก์ YouTube (เฉพาะวิดีโอเดี่ยว ไม่ใช่เพลย์ลิสต์)")
-async def ytmp3(ctx: commands.Context, url: str):
+@app_commands.describe(
+    url="ลิงก์ YouTube (เฉพาะวิดีโอเดี่ยว ไม่ใช่เพลย์ลิสต์)",
+    fmt="รูปแบบไฟล์: mp3 / m4a / opus / original (ไฟล์ต้นฉบับ ไม่แปลง)",
+)
+@app_commands.choices(fmt=[app_commands.Choice(name=f, value=f) for f in OUTPUT_FORMATS])
+async def ytmp3(ctx: commands.Context, url: str, fmt: str = "mp3"):
     """ใช้ได้ทั้ง !ytmp3 และ /ytmp3"""
     if ctx.guild and not _check_ytmp3_channel(ctx.channel):
         await ctx.reply("❌ ห้องนี้ไม่ได้รับอนุญาตให้ใช้คำสั่งดาวน์โหลด mp3")
         return
 
-    PENDING_URL_BY_USER[ctx.author.id] = url
+    output_format = parse_output_format(fmt)
+    if output_format is None:
+        await ctx.reply(f"❌ รูปแบบไฟล์ต้องเป็น {' / '.join(OUTPUT_FORMATS)}")
+        return
+
+    PENDING_URL_BY_USER[ctx.author.id] = (url, output_format)
+    STATE_STORE.set_pending_url(ctx.author.id, url, output_format)
 
     # ถ้าใช้ใน DM ก็ถามใน DM เลย
     if isinstance(ctx.channel, discord.DMChannel):
@@ -303,74 +1328,304 @@ async def ytmp3(ctx: commands.Context, url: str):
         )
 
 
+@bot.hybrid_command(name="ytmp3_batch", description="โหลดทั้งเพลย์ลิสต์หรือหลายลิงก์ รวมส่งเป็นไฟล์ zip ทาง DM")
+@app_commands.describe(
+    urls="ลิงก์เพลย์ลิสต์ หรือหลายลิงก์คั่นด้วยช่องว่าง",
+    fmt="รูปแบบไฟล์: mp3 / m4a / opus / original (ไฟล์ต้นฉบับ ไม่แปลง)",
+    name="ชื่อไฟล์ zip (ไม่ใส่ = ใช้เลขชุดงาน)",
+)
+@app_commands.choices(fmt=[app_commands.Choice(name=f, value=f) for f in OUTPUT_FORMATS])
+async def ytmp3_batch(ctx: commands.Context, urls: str, fmt: str = "mp3", name: Optional[str] = None):
+    """ใช้ได้ทั้ง !ytmp3_batch และ /ytmp3_batch (แบบ ! ถ้ามีหลายลิงก์ให้ครอบด้วยเครื่องหมายคำพูด)"""
+    if ctx.guild and not _check_ytmp3_channel(ctx.channel):
+        await ctx.reply("❌ ห้องนี้ไม่ได้รับอนุญาตให้ใช้คำสั่งดาวน์โหลด mp3")
+        return
+
+    output_format = parse_output_format(fmt)
+    if output_format is None:
+        await ctx.reply(f"❌ รูปแบบไฟล์ต้องเป็น {' / '.join(OUTPUT_FORMATS)}")
+        return
+    url_list = parse_batch_urls(urls)
+    if not url_list:
+        await ctx.reply("❌ ไม่พบลิงก์ในข้อความ")
+        return
+
+    # อ่านเพลย์ลิสต์อาจนานเกิน 3 วินาที
+    await ctx.defer()
+    try:
+        text = await enqueue_batch(ctx.author, url_list, name, output_format)
+    except AdmissionError as e:
+        await ctx.reply(f"🚫 {e} กรุณาลองใหม่อีกครั้งภายหลัง")
+        return
+    await ctx.reply(text)
+
+
 # ----------------- คำสั่งเช็คคิว + ยกเลิกคิวดาวน์โหลด -----------------
 
 @bot.hybrid_command(name="queue_status", description="เช็คสถานะคิวดาวน์โหลด MP3")
 async def queue_status(ctx: commands.Context):
-    total = len(DOWNLOAD_QUEUE)
-    if IS_DOWNLOADING:
-        waiting = max(0, total - 1)
-        await ctx.reply(f"📥 ตอนนี้มีงานกำลังดาวน์โหลดอยู่ 1 งาน และมีคิวรออีก {waiting} งาน")
-    else:
-        if total > 0:
-            await ctx.reply(f"📥 มีคิวรอ {total} งาน แต่ยังไม่เริ่มดาวน์โหลด (กำลังเตรียมระบบ)")
-        else:
-            await ctx.reply("✅ ตอนนี้คิวว่าง ไม่มีงานดาวน์โหลดค้างอยู่")
+    await ctx.reply(get_queue_status_text(ctx.author.id))
 
 
 @bot.hybrid_command(name="cancel_downloads", description="ยกเลิกงานดาวน์โหลดทั้งหมด (เฉพาะแอดมิน)")
 async def cancel_downloads(ctx: commands.Context):
-    global CANCEL_ALL_DOWNLOADS
     if not is_admin(ctx.author):
         await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
         return
 
-    CANCEL_ALL_DOWNLOADS = True
-    cancelled = len(DOWNLOAD_QUEUE)
-    DOWNLOAD_QUEUE.clear()
-    await ctx.reply(f"🛑 ยกเลิกคิวดาวน์โหลดทั้งหมดแล้ว (ลบ {cancelled} งานที่รออยู่). งานที่กำลังดาวน์โหลดจะหยุดหลังจบขั้นตอนปัจจุบัน.")
+    drop_batch_backlog()
+    for job in DOWNLOAD_SCHEDULER.waiting_jobs():
+        forget_job(job)
+    cancelled = DOWNLOAD_SCHEDULER.clear()
+    stopped = DOWNLOAD_SCHEDULER.cancel_running()
+    await ctx.reply(f"🛑 ยกเลิกคิวดาวน์โหลดทั้งหมดแล้ว (ลบ {cancelled} งานที่รออยู่ และหยุด {stopped} งานที่กำลังดาวน์โหลด)")
+
+
+@bot.hybrid_command(name="cancel", description="ยกเลิกงานดาวน์โหลดของคุณ (ทั้งที่รอคิวและที่กำลังโหลด)")
+@app_commands.describe(job_id="เลขงาน (ไม่ใส่ = ยกเลิกทุกงานของคุณ)")
+async def cancel_job(ctx: commands.Context, job_id: Optional[int] = None):
+    if job_id is None:
+        drop_batch_backlog(ctx.author.id)
+        jobs = DOWNLOAD_SCHEDULER.jobs_for_user(ctx.author.id)
+    else:
+        job = DOWNLOAD_SCHEDULER.get_job(job_id)
+        if job is None or (job.user.id != ctx.author.id and not is_admin(ctx.author)):
+            await ctx.reply(f"❌ ไม่พบงาน #{job_id} ของคุณในคิว")
+            return
+        jobs = [job]
+
+    cancelled = []
+    for job in jobs:
+        if DOWNLOAD_SCHEDULER.cancel(job.job_id):
+            forget_job(job)
+            cancelled.append(f"#{job.job_id}")
+    if not cancelled:
+        await ctx.reply("ℹ️ คุณไม่มีงานดาวน์โหลดที่ยกเลิกได้")
+        return
+    await ctx.reply(f"🛑 ยกเลิกงาน {', '.join(cancelled)} แล้ว")
+
+@bot.hybrid_command(name="cache_stats", description="ดูสถิติแคชไฟล์ MP3 (เฉพาะแอดมิน)")
+async def cache_stats(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    stats = MP3_CACHE.stats()
+    cdn = ATTACHMENT_INDEX.stats()
+    if not MP3_CACHE.enabled:
+        await ctx.reply("ℹ️ ระบบแคชปิดอยู่ (CACHE_MAX_BYTES = 0)")
+        return
+    await ctx.reply(
+        "🗂️ สถิติแคช MP3\n"
+        f"• ไฟล์ในแคช: {stats['entries']} ไฟล์ ({stats['bytes'] / (1024*1024):.1f} / {stats['max_bytes'] / (1024*1024):.0f} MB)\n"
+        f"• hit: {stats['hits']} | miss: {stats['misses']} | ลบออก (eviction): {stats['evictions']}\n"
+        f"• ลิงก์ CDN ที่จำไว้: {cdn['entries']} | ส่งซ้ำด้วยลิงก์: {cdn['reused']} | ลิงก์หมดอายุ: {cdn['expired']}"
+    )
+
+@bot.hybrid_command(name="job_stats", description="ดูสถิติเวลา CPU ต่อรูปแบบไฟล์ (เฉพาะแอดมิน)")
+async def job_stats(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    lines = list(JOB_STATS.summary_lines())
+    if not lines:
+        await ctx.reply("ℹ️ ยังไม่มีงานแปลงไฟล์ที่เสร็จแล้ว")
+        return
+    await ctx.reply("📊 สถิติงานแปลงไฟล์ (remux = copy เสียงเดิม ไม่เข้ารหัสใหม่)\n" + "\n".join(lines))
+
+@bot.hybrid_command(name="sync_commands", description="ซิงค์ slash commands ใหม่ทันที (OWNER เท่านั้น)")
+async def sync_commands(ctx: commands.Context):
+    if not is_owner(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะ OWNER เท่านั้น")
+        return
+    try:
+        await sync_command_tree(force=True)
+    except discord.HTTPException as e:
+        await ctx.reply(f"❌ ซิงค์ไม่สำเร็จ: {e}")
+        return
+    await ctx.reply("✅ ซิงค์ slash commands แล้ว")
+
+
+@bot.hybrid_command(name="disk_usage", description="ดูพื้นที่ดิสก์ที่งานดาวน์โหลดและแคชใช้อยู่ (เฉพาะแอดมิน)")
+async def disk_usage(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    usage = await asyncio.get_running_loop().run_in_executor(None, TEMP_STORAGE.usage_blocking)
+    temp = TEMP_STORAGE.stats()
+    cache = MP3_CACHE.stats()
+    budget = _format_mb(temp["budget"]) if temp["budget"] else "ไม่จำกัด"
+    lines = [
+        "💽 พื้นที่ชั่วคราวของงานดาวน์โหลด",
+        f"• จองไว้: {_format_mb(temp['reserved'])} / {budget} | งานที่ถือพื้นที่: {temp['leases']} | รอพื้นที่: {temp['waiting']}",
+    ]
+    if temp["ram_budget"]:
+        lines.append(f"• RAM: จองไว้ {_format_mb(temp['ram_reserved'])} / {_format_mb(temp['ram_budget'])}")
+    for root, info in usage.items():
+        lines.append(
+            f"• `{root}`: ไฟล์งาน {_format_mb(info['used'])} | ดิสก์ว่าง {_format_mb(info['free'])} / {_format_mb(info['total'])}"
+        )
+    lines.append(f"• แคช: {_format_mb(cache['bytes'])} / {_format_mb(cache['max_bytes'])}")
+    if temp["swept_dirs"]:
+        lines.append(f"• กวาดโฟลเดอร์ค้างตอนเริ่มบอท: {temp['swept_dirs']} โฟลเดอร์ ({_format_mb(temp['swept_bytes'])})")
+    await ctx.reply("\n".join(lines))
+
+
+@bot.hybrid_command(name="memory", description="ดูการใช้หน่วยความจำของบอท (เฉพาะแอดมิน)")
+async def memory_usage(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    rss = process_rss_bytes()
+    lines = [
+        f"🧠 หน่วยความจำ (RSS) ตอนนี้: {_format_mb(rss)}"
+        + (f" | หลังพร้อมใช้งาน: {_format_mb(READY_RSS)}" if READY_RSS else ""),
+        f"• โหมดประหยัดหน่วยความจำ: {'เปิด' if LOW_MEMORY_MODE else 'ปิด'} | หน้า health: {'aiohttp' if HEALTH_SERVER else 'Flask'}",
+        f"• แคชข้อความ: {len(bot.cached_messages)} / {MESSAGE_CACHE_SIZE or 0} | ผู้ใช้ในแคช: {len(bot.users)} | เซิร์ฟเวอร์: {len(bot.guilds)}",
+        f"• รอชื่อไฟล์: {len(PENDING_URL_BY_USER)} (หมดอายุไปแล้ว {PENDING_URL_BY_USER.evicted_total})"
+        f" | ข้อความยกเว้น: {len(EXEMPT_MESSAGE_IDS)} / {EXEMPT_MAX_IDS or 'ไม่จำกัด'}",
+    ]
+    await ctx.reply("\n".join(lines))
+
+
+@bot.hybrid_command(name="shards", description="ดูความหน่วงและปริมาณ event ของแต่ละ shard (เฉพาะแอดมิน)")
+async def shards_status(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    update_shard_gauges()
+    guilds: Dict[int, int] = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+    lines = [f"🧩 shard ทั้งหมด {bot.shard_count or 1} | เซิร์ฟเวอร์ {len(bot.guilds)}"]
+    for shard_id, info in sorted(SHARD_STATS.shards.items()):
+        latency = f"{info.latency * 1000:.0f} ms" if info.latency is not None else "-"
+        ready = f"{info.last_ready_seconds:.1f} วินาที" if info.last_ready_seconds is not None else "-"
+        lines.append(
+            f"{'🟢' if info.connected else '🔴'} shard {shard_id}: ping {latency} | {info.events_per_sec:.2f} event/วินาที"
+            f" | ข้อความ {info.events.get('message', 0)} | interaction {info.events.get('interaction', 0)}"
+            f" | เซิร์ฟเวอร์ {guilds.get(shard_id, 0)} | resume {info.resume_count} | หลุด {info.disconnect_count}"
+            f" | ต่อจนพร้อม {ready}"
+        )
+    await ctx.reply("\n".join(lines))
+
+
+def format_profile_lines(profiles: List[dict]) -> List[str]:
+    lines = []
+    for p in profiles:
+        speed = f"{p['throughput'] / 1024:.0f} KB/s" if p["throughput"] else "-"
+        total = p["successes"] + p["failures"]
+        rate = f"{p['successes'] / total * 100:.0f}%" if total else "-"
+        line = (
+            f"{_PROFILE_STATE_ICON.get(p['state'], '⚪')} `{p['name']}` สำเร็จ {rate}"
+            f" ({p['successes']}/{total}) | {speed} | ช้า {p['slow_jobs']}"
+            f" | กำลังใช้ {p['in_flight']} | ถูกพัก {p['trips']} ครั้ง"
+        )
+        if p["cooldown_left"]:
+            line += f" | พักอีก {int(p['cooldown_left'])} วินาที"
+        if p["last_error"] and p["state"] != "closed":
+            line += f"\n   └ {p['last_error'][:120]}"
+        lines.append(line)
+    return lines
+
+
+@bot.hybrid_command(name="profiles", description="ดูสุขภาพของ extractor profile (client/คุกกี้) ที่ใช้โหลด (เฉพาะแอดมิน)")
+async def profiles_status(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+
+    if REMOTE_RUNNER is None:
+        lines = ["🪪 extractor profile", *format_profile_lines(PROFILE_POOL.snapshot())]
+    else:
+        # โหมด worker: แต่ละ worker มีสถิติของตัวเอง
+        lines = ["🪪 extractor profile ของแต่ละ worker"]
+        for worker_id, info in sorted((await REMOTE_RUNNER.workers()).items()):
+            lines.append(f"**{worker_id}**")
+            lines.extend(format_profile_lines(info.get("profiles") or []))
+    await ctx.reply("\n".join(lines)[:2000])
+
+
+@bot.hybrid_command(name="workers", description="ดูสถานะ worker ที่รับงานแปลงไฟล์ผ่าน broker (เฉพาะแอดมิน)")
+async def workers_status(ctx: commands.Context):
+    if not is_admin(ctx.author):
+        await ctx.reply("❌ คำสั่งนี้ใช้ได้เฉพาะแอดมินเท่านั้น")
+        return
+    if REMOTE_RUNNER is None:
+        await ctx.reply("ℹ️ ไม่ได้ตั้ง BROKER_URL งานทั้งหมดทำในบอทเอง")
+        return
+
+    workers = await REMOTE_RUNNER.workers()
+    queued = await REMOTE_RUNNER.queued_count()
+    now = time.time()
+    lines = [f"🛠️ worker ทั้งหมด {len(workers)} ตัว | งานรอใน broker: {queued}"]
+    for worker_id, info in sorted(workers.items()):
+        age = now - info.get("seen_at", 0)
+        state = "🟢" if age < WORKER_CLAIM_TIMEOUT else "🔴"
+        lines.append(
+            f"{state} `{worker_id}` ทำอยู่ {info.get('active', 0)}/{info.get('concurrency', '?')} "
+            f"| สำเร็จ {info.get('done', 0)} | ล้มเหลว {info.get('failed', 0)} | เห็นล่าสุด {int(age)} วินาทีก่อน"
+        )
+    await ctx.reply("\n".join(lines))
 
 # ----------------- ส่วนของแบบฟอร์มการ์ด + ปุ่มแปลงเป็น MP3 -----------------
 
-async def handle_form_submit(interaction: discord.Interaction, url: str, filename: str):
+async def handle_form_submit(interaction: discord.Interaction, url: str, filename: str, fmt: str):
     """callback ตอนผู้ใช้กรอกแบบฟอร์มเสร็จใน modal"""
     url = url.strip()
     filename = filename.strip()
+    output_format = parse_output_format(fmt)
+    urls = parse_batch_urls(url)
 
     if not url:
         await interaction.response.send_message("❌ กรุณาใส่ URL YouTube", ephemeral=True)
         return
 
-    if "youtu" not in url.lower():
+    if not urls or any("youtu" not in u.lower() for u in urls):
         await interaction.response.send_message("❌ URL ต้องเป็นของ YouTube เท่านั้น", ephemeral=True)
         return
 
+    if output_format is None:
+        await interaction.response.send_message(
+            f"❌ รูปแบบไฟล์ต้องเป็น {' / '.join(OUTPUT_FORMATS)}", ephemeral=True
+        )
+        return
+
     if filename.lower() == "no":
         custom_name = None
     else:
         custom_name = filename or None
 
-    # ตอบกลับแบบคิดงานสักครู่
+    # หลายลิงก์ / ลิงก์เพลย์ลิสต์ -> โหมดชุดงาน (ชื่อไฟล์ใช้เป็นชื่อไฟล์ zip)
+    if is_batch_request(urls):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            text = await enqueue_batch(interaction.user, urls, custom_name, output_format)
+        except AdmissionError as e:
+            text = f"🚫 {e} กรุณาลองใหม่อีกครั้งภายหลัง"
+        await interaction.followup.send(text, ephemeral=True)
+        return
+
+    # ใช้คิวเดียวกับ !ytmp3 (จำกัดงานพร้อมกัน + ปฏิเสธเมื่อคิวเต็ม)
+    try:
+        status_text = await enqueue_download(interaction.user, urls[0], custom_name, output_format)
+    except AdmissionError as e:
+        await interaction.response.send_message(f"🚫 {e} กรุณาลองใหม่อีกครั้งภายหลัง", ephemeral=True)
+        return
+
     await interaction.response.send_message(
-        "⏳ กำลังโหลดและแปลงเป็น MP3... ผมจะส่งไฟล์ให้ทาง DM นะครับ",
+        status_text + " ผมจะส่งไฟล์ให้ทาง DM นะครับ",
         ephemeral=True,
     )
 
-    await send_mp3_to_dm(interaction.user, url, custom_name)
-
-
 
 async def get_queue_status_text_for_interaction(interaction: discord.Interaction) -> str:
     """คืนข้อความสรุปสถานะคิว (ใช้กับปุ่มในแบบฟอร์ม)"""
-    total = len(DOWNLOAD_QUEUE)
-    if IS_DOWNLOADING:
-        waiting = max(0, total - 1)
-        return f"📥 ตอนนี้มีงานกำลังดาวน์โหลดอยู่ 1 งาน และมีคิวรออีก {waiting} งาน"
-    else:
-        if total > 0:
-            return f"📥 มีคิวรอ {total} งาน แต่ยังไม่เริ่มดาวน์โหลด (กำลังเตรียมระบบ)"
-        else:
-            return "✅ ตอนนี้คิวว่าง ไม่มีงานดาวน์โหลดค้างอยู่"
+    return get_queue_status_text(interaction.user.id)
 
 @bot.hybrid_command(
     name="ytmp3_form",
@@ -412,12 +1667,16 @@ async def autodel(ctx: commands.Context, mode: str):
     mode = mode.lower()
     if mode == "on":
         AUTO_DELETE_ENABLED = True
+        STATE_STORE.set_setting("autodel_enabled", "1")
         await ctx.reply(
             f"✅ เปิดระบบลบข้อความอัตโนมัติแล้ว (ลบหลัง {AUTO_DELETE_DELAY} วินาที)"
         )
     elif mode == "off":
         AUTO_DELETE_ENABLED = False
-        await ctx.reply("🟧 ปิดระบบลบข้อความอัตโนมัติแล้ว")
+        STATE_STORE.set_setting("autodel_enabled", "0")
+        cancelled = AUTO_DELETE_SCHEDULER.clear()
+        STATE_STORE.clear_deletions()
+        await ctx.reply(f"🟧 ปิดระบบลบข้อความอัตโนมัติแล้ว (ยกเลิกข้อความที่รอลบ {cancelled} ข้อความ)")
     else:
         await ctx.reply("❌ ให้ใช้คำว่า on หรือ off เท่านั้น")
 
@@ -441,6 +1700,7 @@ async def autodel_delay(ctx: commands.Context, seconds: int):
         return
 
     AUTO_DELETE_DELAY = seconds
+    STATE_STORE.set_setting("autodel_delay", seconds)
     await ctx.reply(f"✅ ตั้งเวลา autodel เป็น {seconds} วินาทีแล้ว")
 
 
@@ -452,6 +1712,9 @@ async def autodel_exempt_add(ctx: commands.Context, message_id: int):
         return
 
     EXEMPT_MESSAGE_IDS.add(message_id)
+    STATE_STORE.add_exempt(message_id)
+    if AUTO_DELETE_SCHEDULER.cancel(message_id):
+        STATE_STORE.remove_deletions([message_id])
     await ctx.reply(f"✅ เพิ่มข้อความ ID `{message_id}` เข้า list ยกเว้นแล้ว")
 
 
@@ -464,6 +1727,7 @@ async def autodel_exempt_remove(ctx: commands.Context, message_id: int):
 
     if message_id in EXEMPT_MESSAGE_IDS:
         EXEMPT_MESSAGE_IDS.remove(message_id)
+        STATE_STORE.remove_exempt(message_id)
         await ctx.reply(f"✅ ลบข้อความ ID `{message_id}` ออกจาก list ยกเว้นแล้ว")
     else:
         await ctx.reply("❌ ไม่พบข้อความ ID นี้ใน list ยกเว้น")
@@ -480,6 +1744,7 @@ async def add_admin(ctx: commands.Context, user_id: int):
         return
 
     ADMIN_IDS.add(user_id)
+    STATE_STORE.add_admin(user_id)
     await ctx.reply(f"✅ เพิ่ม `<@{user_id}>` เป็นแอดมินแล้ว")
 
 
@@ -492,6 +1757,7 @@ async def remove_admin(ctx: commands.Context, user_id: int):
 
     if user_id in ADMIN_IDS:
         ADMIN_IDS.remove(user_id)
+        STATE_STORE.remove_admin(user_id)
         await ctx.reply(f"✅ เอา `<@{user_id}>` ออกจากแอดมินแล้ว")
     else:
         await ctx.reply("❌ ผู้ใช้นี้ไม่ได้เป็นแอดมินอยู่แล้ว")
@@ -503,6 +1769,8 @@ if __name__ == "__main__":
     if TOKEN == "PUT_YOUR_TOKEN_HERE":
         raise SystemExit("กรุณาแก้ไขไฟล์ config.py แล้วใส่ TOKEN ก่อนรันบอท")
     # รันเว็บเล็กๆ ด้วย Flask เพื่อให้ Render เช็คสถานะ Web Service
-    keep_alive()
+    # (โหมดประหยัดหน่วยความจำเปิดด้วย aiohttp ใน setup_hook แทน)
+    if not LOW_MEMORY_MODE:
+        keep_alive(METRICS.render)
     # จากนั้นรันบอท Discord ตามปกติ
     bot.run(TOKEN)
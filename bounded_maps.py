@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""โครงสร้างข้อมูลในหน่วยความจำที่มีขอบเขต (ไม่โตไปเรื่อย ๆ ระหว่างที่บอทรันนาน)
+
+- TTLDict: dict ที่ค่ามีอายุ + จำนวนสูงสุด (ใช้กับสถานะรอชื่อไฟล์ของผู้ใช้ที่อาจไม่ตอบกลับ)
+- SnowflakeSet: set ของ id ข้อความ Discord จำกัดจำนวน ตัดตัวที่เก่าที่สุด (id น้อยสุด) ก่อน
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLDict(Generic[K, V]):
+    """dict ที่แต่ละค่าหมดอายุหลัง ttl วินาทีนับจากตอนตั้งค่า และเก็บได้ไม่เกิน max_items (ตัดตัวเก่าสุดก่อน)
+
+    ค่าที่หมดอายุถือว่าไม่มีอยู่ทันที (ลบจริงตอน prune หรือตอนถูกอ่าน)
+    on_evict(key) ถูกเรียกเมื่อค่าหลุดเพราะหมดอายุ/เกินจำนวน (ไม่เรียกตอน pop เอง) ใช้ลบสำเนาในฐานข้อมูลด้วย
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 0,
+        max_items: int = 0,
+        on_evict: Optional[Callable[[K], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl_seconds  # 0 = ไม่หมดอายุ
+        self.max_items = max_items  # 0 = ไม่จำกัด
+        self.on_evict = on_evict
+        self._clock = clock
+        # เรียงตามเวลาที่ตั้งค่า (ตัวแรก = เก่าสุด) -> prune หยุดได้ทันทีที่เจอตัวที่ยังไม่หมดอายุ
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.evicted_total = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - stored_at >= self.ttl
+
+    def _evict(self, key: K) -> None:
+        del self._data[key]
+        self.evicted_total += 1
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._data.pop(key, None)
+        self._data[key] = (self._clock(), value)
+        while self.max_items and len(self._data) > self.max_items:
+            self._evict(next(iter(self._data)))
+
+    def _live(self, key: K) -> bool:
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if self._expired(entry[0], self._clock()):
+            self._evict(key)
+            return False
+        return True
+
+    def __contains__(self, key: object) -> bool:
+        return self._live(key)  # type: ignore[arg-type]
+
+    def __getitem__(self, key: K) -> V:
+        if not self._live(key):
+            raise KeyError(key)
+        return self._data[key][1]
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        return self[key] if self._live(key) else default
+
+    def pop(self, key: K, *default):
+        if self._live(key):
+            return self._data.pop(key)[1]
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def update(self, items) -> None:
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def prune(self) -> List[K]:
+        """ลบค่าที่หมดอายุทั้งหมด คืนรายการ key ที่ถูกลบ"""
+        removed: List[K] = []
+        if not self.ttl:
+            return removed
+        now = self._clock()
+        while self._data:
+            key, (stored_at, _value) = next(iter(self._data.items()))
+            if not self._expired(stored_at, now):
+                break
+            self._evict(key)
+            removed.append(key)
+        return removed
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+
+class SnowflakeSet:
+    """set ของ id ข้อความ (snowflake) เก็บได้ไม่เกิน max_items ถ้าเกินจะตัด id ที่น้อยที่สุด (ข้อความเก่าสุด) ทิ้ง"""
+
+    def __init__(self, max_items: int = 0, on_evict: Optional[Callable[[int], None]] = None):
+        self.max_items = max_items  # 0 = ไม่จำกัด
+        self.on_evict = on_evict
+        self._ids: Set[int] = set()
+        self.evicted_total = 0
+
+    def _trim(self) -> None:
+        if not self.max_items or len(self._ids) <= self.max_items:
+            return
+        for old in sorted(self._ids)[: len(self._ids) - self.max_items]:
+            self._ids.discard(old)
+            self.evicted_total += 1
+            if self.on_evict is not None:
+                self.on_evict(old)
+
+    def add(self, message_id: int) -> None:
+        self._ids.add(message_id)
+        self._trim()
+
+    def update(self, ids: Iterable[int]) -> None:
+        self._ids.update(ids)
+        self._trim()
+
+    def remove(self, message_id: int) -> None:
+        self._ids.remove(message_id)
+
+    def discard(self, message_id: int) -> None:
+        self._ids.discard(message_id)
+
+    def prune_older_than(self, cutoff_id: int) -> int:
+        """ลบ id ที่เก่ากว่า cutoff (ข้อความที่สร้างก่อนเวลาของ snowflake นั้น) คืนจำนวนที่ลบ"""
+        old = [i for i in self._ids if i < cutoff_id]
+        self._ids.difference_update(old)
+        return len(old)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def __contains__(self, message_id: object) -> bool:
+        return message_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._ids))
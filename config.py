@@ -4,13 +4,15 @@
 """
 
 import os
+import tempfile
 
 # ===================== CONFIG =====================
 
 # ดึง TOKEN จาก Environment Variable บน Render
 TOKEN: str = os.getenv("DISCORD_TOKEN", "").strip()
 
-if not TOKEN:
+# worker.py ไม่ต่อ Discord จึงไม่ต้องมี TOKEN
+if not TOKEN and os.getenv("YTMP3_WORKER") != "1":
     raise SystemExit("❌ ERROR: ไม่พบค่า DISCORD_TOKEN ใน Environment ของ Render")
 
 # รายการห้อง (Text Channel ID) ที่ให้ระบบลบข้อความอัตโนมัติทำงาน
@@ -29,3 +31,128 @@ AUTO_DELETE_DEFAULT_DELAY: int = 10
 
 # จำกัดขนาดไฟล์สูงสุด (30 MB)
 MAX_FILE_SIZE_BYTES: int = 30 * 1024 * 1024
+
+# จำนวน worker ที่ใช้รัน yt-dlp/ffmpeg (ค่าเริ่มต้น = จำนวนคอร์ของเครื่อง)
+DOWNLOAD_POOL_SIZE: int = int(os.getenv("DOWNLOAD_POOL_SIZE", str(os.cpu_count() or 1)))
+
+# ชนิดของ pool: "thread" หรือ "process"
+DOWNLOAD_POOL_KIND: str = os.getenv("DOWNLOAD_POOL_KIND", "thread").strip().lower()
+
+# เวลาสูงสุดต่องานดาวน์โหลด+แปลงไฟล์ (วินาที, 0 = ไม่จำกัด)
+DOWNLOAD_JOB_TIMEOUT: int = int(os.getenv("DOWNLOAD_JOB_TIMEOUT", "600"))
+
+# จำนวนงานดาวน์โหลดที่ทำพร้อมกันได้ในคิว
+DOWNLOAD_WORKERS: int = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+
+# จำนวนงานที่รอคิวได้สูงสุด เกินนี้จะปฏิเสธงานใหม่ทันที (0 = ไม่จำกัด)
+MAX_QUEUE_DEPTH: int = int(os.getenv("MAX_QUEUE_DEPTH", "50"))
+
+# โควตาต่อผู้ใช้: จำนวนงานที่ทำพร้อมกันได้ และจำนวนงานที่ส่งได้ต่อชั่วโมง (0 = ไม่จำกัด, แอดมินไม่ติดโควตา)
+PER_USER_CONCURRENT_JOBS: int = int(os.getenv("PER_USER_CONCURRENT_JOBS", "1"))
+PER_USER_JOBS_PER_HOUR: int = int(os.getenv("PER_USER_JOBS_PER_HOUR", "20"))
+
+# โฟลเดอร์แคชไฟล์ที่แปลงแล้ว และขนาดรวมสูงสุด (ไบต์, 0 = ปิดแคช)
+CACHE_DIR: str = os.getenv("MP3_CACHE_DIR", "mp3_cache")
+CACHE_MAX_BYTES: int = int(os.getenv("MP3_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# ไฟล์เก็บลิงก์ไฟล์แนบบน Discord CDN ที่เคยอัปโหลดแล้ว
+ATTACHMENT_INDEX_FILE: str = os.getenv("ATTACHMENT_INDEX_FILE", "attachment_index.json")
+
+# สตรีมเสียงเข้า ffmpeg ระหว่างโหลด (โหลด+แปลงพร้อมกัน) ถ้า format รองรับ
+STREAMING_PIPELINE: bool = os.getenv("STREAMING_PIPELINE", "1").strip() == "1"
+
+# จำนวนช่วง (Range) / fragment ที่โหลดพร้อมกันต่องาน (1 = โหลดต่อเนื่องทีละ connection แบบเดิม)
+DOWNLOAD_FRAGMENTS: int = int(os.getenv("DOWNLOAD_FRAGMENTS", "4"))
+
+# ขนาดแต่ละช่วงที่ขอจากเซิร์ฟเวอร์ (ไบต์) หน่วยความจำต่องานราว DOWNLOAD_FRAGMENTS x ค่านี้
+HTTP_CHUNK_SIZE: int = int(os.getenv("HTTP_CHUNK_SIZE", str(2 * 1024 * 1024)))
+
+# แบนด์วิดท์ขาเข้ารวมทุกงาน (ไบต์/วินาที, 0 = ไม่จำกัด) และขนาด burst (0 = เท่ากับ 1 วินาที)
+BANDWIDTH_LIMIT_BYTES_PER_SEC: int = int(os.getenv("BANDWIDTH_LIMIT_BYTES_PER_SEC", "0"))
+BANDWIDTH_BURST_BYTES: int = int(os.getenv("BANDWIDTH_BURST_BYTES", "0"))
+
+# ขนาดไฟล์ต้นทางสูงสุดที่ยอมโหลด (ไฟล์ผลลัพธ์คุมด้วย bitrate ให้ไม่เกิน MAX_FILE_SIZE_BYTES)
+MAX_SOURCE_FILE_SIZE_BYTES: int = int(os.getenv("MAX_SOURCE_FILE_SIZE_BYTES", str(300 * 1024 * 1024)))
+
+# bitrate ต่ำสุด (kbps) ที่ยอมลดลงไปได้ ถ้ายังใหญ่เกินจะเสนอให้แบ่งเป็นหลายไฟล์
+MIN_AUDIO_BITRATE_KBPS: int = int(os.getenv("MIN_AUDIO_BITRATE_KBPS", "64"))
+
+# จำนวนงานที่อ่าน metadata ล่วงหน้าพร้อมกันได้ (ระหว่างรอคิว)
+PREFETCH_CONCURRENCY: int = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+
+# ความยาวคลิปสูงสุดที่รับ (วินาที, 0 = ไม่จำกัด)
+MAX_VIDEO_DURATION_SECONDS: int = int(os.getenv("MAX_VIDEO_DURATION_SECONDS", str(4 * 60 * 60)))
+
+# ไฟล์ฐานข้อมูลเก็บสถานะถาวร (คิว, autodel, แอดมิน) ให้รอดการรีสตาร์ท
+STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "bot_state.sqlite3")
+
+# เขียนสถานะลงดิสก์รวมเป็นชุดทุก ๆ กี่วินาที
+STATE_FLUSH_INTERVAL: float = float(os.getenv("STATE_FLUSH_INTERVAL", "0.5"))
+
+# ข้อความยกเว้นที่เก่ากว่านี้ (วัน) จะถูกล้างออกจากฐานข้อมูล
+EXEMPT_RETENTION_DAYS: int = int(os.getenv("EXEMPT_RETENTION_DAYS", "30"))
+
+# ความถี่ในการเก็บค่า metric (คิว/แคช/ความหน่วง event loop) สำหรับ /metrics (วินาที)
+METRICS_SAMPLE_INTERVAL: float = float(os.getenv("METRICS_SAMPLE_INTERVAL", "1.0"))
+
+# ระยะห่างขั้นต่ำ (วินาที) ระหว่างการแก้ข้อความสถานะความคืบหน้าในห้องเดียวกัน (0 = ไม่แสดงความคืบหน้า)
+PROGRESS_EDIT_INTERVAL: float = float(os.getenv("PROGRESS_EDIT_INTERVAL", "2.0"))
+
+# จำนวนคลิปสูงสุดต่อชุดงาน (เพลย์ลิสต์ / หลายลิงก์) แต่ละคลิปนับโควตาต่อชั่วโมงเหมือนงานปกติ
+BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+# งานย่อยของชุดงานเดียวที่อยู่ในคิวพร้อมกันได้สูงสุด (ที่เหลือรอป้อนเข้าคิวเมื่องานก่อนหน้าเสร็จ)
+# กันชุดงานใหญ่ชุดเดียวกินคิวรวม (MAX_QUEUE_DEPTH) จนผู้ใช้คนอื่นส่งงานไม่ได้
+BATCH_MAX_IN_QUEUE: int = int(os.getenv("BATCH_MAX_IN_QUEUE", "5"))
+
+# โฟลเดอร์ทำงานชั่วคราวของงานดาวน์โหลด และงบพื้นที่รวม (ไบต์, 0 = ไม่จำกัด) งานที่จองไม่ได้จะรอก่อนเริ่มโหลด
+TEMP_DIR: str = os.getenv("TEMP_DIR", os.path.join(tempfile.gettempdir(), "ytmp3-work"))
+TEMP_BUDGET_BYTES: int = int(os.getenv("TEMP_BUDGET_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# โฟลเดอร์ใน RAM (เช่น /dev/shm) สำหรับงานเล็ก ว่าง = ไม่ใช้ / งบรวม / ขนาดงานสูงสุดที่ใช้ RAM ได้ (ไบต์)
+TEMP_RAM_DIR: str = os.getenv("TEMP_RAM_DIR", "").strip()
+TEMP_RAM_BUDGET_BYTES: int = int(os.getenv("TEMP_RAM_BUDGET_BYTES", str(256 * 1024 * 1024)))
+TEMP_RAM_MAX_JOB_BYTES: int = int(os.getenv("TEMP_RAM_MAX_JOB_BYTES", str(48 * 1024 * 1024)))
+
+# แยกงานโหลด/แปลงไฟล์ไปให้ worker.py (process/เครื่องอื่น) ผ่าน broker ว่าง = ทำในบอทเอง
+# เช่น sqlite:///shared/broker.sqlite3 หรือ redis://host:6379/0 (ต้องติดตั้งแพ็กเกจ redis)
+BROKER_URL: str = os.getenv("BROKER_URL", "").strip()
+
+# อายุ lease ของงานที่ worker ถือ (วินาที) ถ้าไม่มี heartbeat เกินนี้ งานจะกลับเข้าคิว / ระยะห่าง heartbeat
+WORKER_LEASE_SECONDS: float = float(os.getenv("WORKER_LEASE_SECONDS", "30"))
+WORKER_HEARTBEAT_INTERVAL: float = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "2"))
+
+# จำนวนครั้งสูงสุดที่งานหนึ่งถูกหยิบ (worker ตายกลางงานแล้วให้ worker อื่นทำใหม่)
+WORKER_MAX_ATTEMPTS: int = int(os.getenv("WORKER_MAX_ATTEMPTS", "2"))
+
+# ถ้าไม่มี worker มารับงานภายในเวลานี้ (วินาที) ถือว่าล้มเหลว / ความถี่ที่บอทถามสถานะงาน (วินาที)
+WORKER_CLAIM_TIMEOUT: float = float(os.getenv("WORKER_CLAIM_TIMEOUT", "120"))
+BROKER_POLL_INTERVAL: float = float(os.getenv("BROKER_POLL_INTERVAL", "0.5"))
+
+# โหมดประหยัดหน่วยความจำ (เครื่องเล็ก เช่น 512 MB): ลด intents/แคชของ discord.py ให้เหลือเท่าที่คำสั่งใช้
+# และเปิดหน้า health/metrics ด้วย aiohttp บน event loop ของบอทแทน Flask ใน thread แยก
+LOW_MEMORY_MODE: bool = os.getenv("LOW_MEMORY_MODE", "0").strip() == "1"
+
+# จำนวนข้อความที่ discord.py จำไว้ในแคช (0 = ไม่เก็บ) บอทไม่ได้ใช้ข้อความเก่าจากแคช
+MESSAGE_CACHE_SIZE: int = int(os.getenv("MESSAGE_CACHE_SIZE", "0" if LOW_MEMORY_MODE else "1000"))
+
+# สถานะรอชื่อไฟล์ (!ytmp3) หมดอายุถ้าผู้ใช้ไม่ตอบภายในกี่วินาที / จำนวนผู้ใช้ที่รอได้พร้อมกันสูงสุด
+PENDING_URL_TTL_SECONDS: int = int(os.getenv("PENDING_URL_TTL_SECONDS", "900"))
+PENDING_URL_MAX: int = int(os.getenv("PENDING_URL_MAX", "1000"))
+
+# จำนวนข้อความยกเว้น (autodel) สูงสุดที่จำไว้ เกินนี้จะตัดข้อความที่เก่าที่สุดออก (0 = ไม่จำกัด)
+EXEMPT_MAX_IDS: int = int(os.getenv("EXEMPT_MAX_IDS", "5000"))
+
+# จำนวน shard ของ gateway: 0 = ไม่แบ่ง (ค่าเดิม), auto = ตามที่ Discord แนะนำ, ตัวเลข = กำหนดเอง
+# ทุก shard อยู่ใน process เดียวกัน จึงใช้คิวดาวน์โหลด/ตัวลบข้อความอัตโนมัติชุดเดียวกัน
+SHARD_COUNT: str = os.getenv("SHARD_COUNT", "0").strip().lower()
+
+# ไฟล์ JSON รายการตัวตนของ extractor (player client / header / ไฟล์คุกกี้) ไม่มีไฟล์ = ใช้ android + cookies.txt ตัวเดียว
+EXTRACTOR_PROFILES_FILE: str = os.getenv("EXTRACTOR_PROFILES_FILE", "extractor_profiles.json")
+
+# พัก profile หลังล้มเหลว (ถูกบล็อก/จำกัด) ติดกันกี่ครั้ง / นานกี่วินาที (ครั้งถัดไปนานขึ้นเป็นเท่าตัว)
+PROFILE_FAILURE_THRESHOLD: int = int(os.getenv("PROFILE_FAILURE_THRESHOLD", "3"))
+PROFILE_COOLDOWN_SECONDS: float = float(os.getenv("PROFILE_COOLDOWN_SECONDS", "600"))
+
+# ความเร็วโหลดต่ำกว่านี้ (ไบต์/วินาที) ถือว่า profile ถูกจำกัดความเร็ว นับเป็นความล้มเหลว (0 = ไม่ตรวจ)
+PROFILE_MIN_THROUGHPUT_BYTES: int = int(os.getenv("PROFILE_MIN_THROUGHPUT_BYTES", str(64 * 1024)))
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+"""ระบบคิวดาวน์โหลดแบบหลาย worker (asyncio.Queue)
+แต่ละงานมี job_id ของตัวเอง ใช้ลบ/เช็คลำดับคิวได้ตรงตัว แม้ผู้ใช้คนเดียวจะมีหลายงาน
+
+งานที่ขอไฟล์เดียวกัน (dedup_key เดียวกัน) จะถูกรวมไว้ใน "ช่องคิว" (flight) เดียว
+ใช้ worker ตัวเดียว และทำงานหนักเพียงครั้งเดียว แต่ส่งผลให้ผู้ขอทุกคน
+
+ระหว่างรอคิว ถ้าตั้ง prefetch ไว้ จะอ่าน metadata ของแต่ละช่องไว้ก่อน (พร้อมกันหลายช่อง)
+งานที่ใช้ไม่ได้แน่ ๆ จะถูกปฏิเสธตั้งแต่ตอนนั้น ไม่ต้องรอถึงคิว
+
+ลำดับการหยิบงานเป็นแบบแบ่งกันใช้ (fair share) ไม่ใช่ FIFO:
+- ช่องด่วน (priority) เช่นงานของแอดมิน หรืองานที่มีไฟล์ในแคชแล้ว หยิบก่อนเสมอ
+- ที่เหลือวนทีละผู้ใช้ (round-robin) คนที่ส่งมา 20 ลิงก์จะไม่กันคนอื่นจนหมด
+- ผู้ใช้แต่ละคนทำงานพร้อมกันได้ไม่เกิน per_user_concurrency ช่อง และส่งได้ไม่เกิน per_user_hourly งาน/ชั่วโมง
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+
+@dataclass
+class DownloadJob:
+    job_id: int
+    user: Any  # discord.User / discord.Member
+    url: str
+    custom_name: Optional[str]
+    fmt: str = "mp3"
+    split: bool = False  # แบ่งเป็นหลายไฟล์ (คลิปยาวเกินจะใส่ไฟล์เดียว)
+    dedup_key: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    prefetched: Any = None  # ผลจาก prefetch (เช่น info dict ของ yt-dlp)
+    batch_id: Optional[int] = None  # งานย่อยของชุดงาน (เพลย์ลิสต์/หลายลิงก์) ถ้ามี
+
+
+@dataclass
+class _Flight:
+    """ช่องคิว 1 ช่อง = งานหนัก 1 ครั้ง (อาจมีผู้ขอหลายคน)"""
+    slot_id: int
+    dedup_key: Optional[str]
+    owner: int = 0  # user id ของผู้ขอคนแรก (ใช้นับโควตาพร้อมกัน)
+    priority: bool = False
+    jobs: List[DownloadJob] = field(default_factory=list)
+    tasks: List[asyncio.Task] = field(default_factory=list)
+    started_at: Optional[float] = None
+    prefetch_task: Optional[asyncio.Task] = None
+    prefetched: Any = None
+    error: Optional[Exception] = None
+
+
+class AdmissionError(Exception):
+    """ไม่รับงานเข้าคิว (คิวเต็ม / เกินโควตา)"""
+
+
+class QueueFullError(AdmissionError):
+    """คิวเต็ม (เกิน max_depth) ปฏิเสธงานใหม่ทันที"""
+
+    def __init__(self, max_depth: int):
+        super().__init__(f"คิวเต็มแล้ว ({max_depth} งาน)")
+        self.max_depth = max_depth
+
+
+class QuotaExceededError(AdmissionError):
+    """ผู้ใช้ส่งงานเกินโควตาต่อชั่วโมง"""
+
+    def __init__(self, limit: int, retry_after: float):
+        minutes = max(1, int(retry_after // 60) + 1)
+        super().__init__(f"คุณส่งงานครบ {limit} งานต่อชั่วโมงแล้ว ส่งใหม่ได้ในอีก ~{minutes} นาที")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class _FairLanes:
+    """โครงสร้างลำดับการหยิบช่องคิว: ช่องด่วน + คิวย่อยต่อผู้ใช้ที่วนแบบ round-robin
+
+    เก็บแค่ slot id และลบแบบ lazy (ช่องที่ถูกลบไปแล้วจะถูกข้ามตอนหยิบ)
+    copy() ได้ เพื่อใช้จำลองลำดับจริงตอนคำนวณลำดับคิว/ETA
+    """
+
+    def __init__(self):
+        self.priority: Deque[int] = deque()
+        self.by_user: Dict[int, Deque[int]] = {}
+        self.rr: Deque[int] = deque()
+
+    def push(self, slot_id: int, owner: int, priority: bool) -> None:
+        if priority:
+            self.priority.append(slot_id)
+            return
+        lane = self.by_user.get(owner)
+        if lane is None:
+            lane = self.by_user[owner] = deque()
+            self.rr.append(owner)
+        lane.append(slot_id)
+
+    def copy(self) -> "_FairLanes":
+        other = _FairLanes()
+        other.priority = deque(self.priority)
+        other.by_user = {owner: deque(lane) for owner, lane in self.by_user.items()}
+        other.rr = deque(self.rr)
+        return other
+
+    def clear(self) -> None:
+        self.priority.clear()
+        self.by_user.clear()
+        self.rr.clear()
+
+    def select(
+        self, alive: Callable[..., bool], running: Dict[int, int], limit: int
+    ) -> Optional[int]:
+        """หยิบช่องถัดไป (ตัดออกจากโครงสร้าง) หรือ None ถ้าทุกคนที่รออยู่ติดโควตาพร้อมกัน
+
+        alive(slot_id, owner) = ช่องยังรออยู่และยังเป็นของผู้ใช้คนนี้ (ช่องที่ย้ายเจ้าของแล้วจะถูกข้ามในคิวย่อยเดิม)
+        """
+        while self.priority:
+            slot_id = self.priority.popleft()
+            if alive(slot_id):
+                return slot_id
+        for _ in range(len(self.rr)):
+            owner = self.rr[0]
+            lane = self.by_user[owner]
+            while lane and not alive(lane[0], owner):
+                lane.popleft()
+            if not lane:
+                self.rr.popleft()
+                del self.by_user[owner]
+                continue
+            if limit and running.get(owner, 0) >= limit:
+                self.rr.rotate(-1)
+                continue
+            slot_id = lane.popleft()
+            # ผู้ใช้ที่เพิ่งได้งานไปต่อท้ายรอบ
+            self.rr.rotate(-1)
+            if not lane:
+                self.rr.pop()
+                del self.by_user[owner]
+            return slot_id
+        return None
+
+
+JobRunner = Callable[[DownloadJob], Awaitable[None]]
+JobPrefetcher = Callable[[DownloadJob], Awaitable[Any]]
+JobRejecter = Callable[[DownloadJob, Exception], Awaitable[None]]
+
+# เวลาเฉลี่ยต่องานที่ใช้ประมาณ ETA ตอนยังไม่มีสถิติ (วินาที)
+DEFAULT_JOB_SECONDS: float = 60.0
+
+
+class DownloadScheduler:
+    """คิวงานดาวน์โหลด + worker N ตัว ทำงานพร้อมกัน"""
+
+    def __init__(
+        self,
+        run_job: JobRunner,
+        workers: int = 1,
+        max_depth: int = 0,
+        prefetch: Optional[JobPrefetcher] = None,
+        on_rejected: Optional[JobRejecter] = None,
+        prefetch_concurrency: int = 4,
+        per_user_concurrency: int = 0,
+        per_user_hourly: int = 0,
+    ):
+        self._run_job = run_job
+        self._prefetch = prefetch
+        self._on_rejected = on_rejected
+        self._prefetch_sem = asyncio.Semaphore(max(1, prefetch_concurrency))
+        self.workers = max(1, workers)
+        # จำนวนช่องคิวที่รอได้สูงสุด (0 = ไม่จำกัด)
+        self.max_depth = max(0, max_depth)
+        # โควตาต่อผู้ใช้ (0 = ไม่จำกัด) ไม่ใช้กับงานที่ส่งมาแบบ quota_exempt
+        self.per_user_concurrency = max(0, per_user_concurrency)
+        self.per_user_hourly = max(0, per_user_hourly)
+        self._lanes = _FairLanes()
+        self._wakeup = asyncio.Event()
+        self._submitted_at: Dict[int, Deque[float]] = {}
+        self._tasks: List[asyncio.Task] = []
+        # ช่องคิวที่รอ (dict รักษาลำดับการใส่) และช่องที่กำลังทำ
+        self._waiting: Dict[int, _Flight] = {}
+        self._running: Dict[int, _Flight] = {}
+        self._by_key: Dict[str, _Flight] = {}
+        self._flight_of: Dict[int, _Flight] = {}
+        # งานที่กำลังรัน -> task ของมัน (ใช้ยกเลิกกลางคัน)
+        self._job_tasks: Dict[int, asyncio.Task] = {}
+        self._ids = itertools.count(1)
+        self._slot_ids = itertools.count(1)
+        # เวลาที่ใช้จริงของงานล่าสุด ไว้คำนวณ ETA
+        self._durations: Deque[float] = deque(maxlen=20)
+        self.merged_total = 0
+        self.rejected_total = 0
+        self.quota_rejected_total = 0
+
+    # ----------------- จัดการ worker -----------------
+
+    def start(self) -> None:
+        """สตาร์ท worker (เรียกซ้ำได้ ถ้ารันอยู่แล้วจะไม่ทำอะไร)"""
+        if self._tasks and not all(t.done() for t in self._tasks):
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"ytmp3-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run_one(self, job: DownloadJob) -> None:
+        try:
+            await self._run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # กัน worker ตายเพราะงานเดียว
+            print("Download worker error:", e)
+
+    def _is_waiting(self, slot_id: int, owner: Optional[int] = None) -> bool:
+        flight = self._waiting.get(slot_id)
+        return flight is not None and bool(flight.jobs) and (owner is None or flight.owner == owner)
+
+    def _running_per_user(self) -> Dict[int, int]:
+        return Counter(f.owner for f in self._running.values() if not f.priority)
+
+    def _next_flight(self) -> Optional[_Flight]:
+        slot_id = self._lanes.select(self._is_waiting, self._running_per_user(), self.per_user_concurrency)
+        return self._waiting.pop(slot_id) if slot_id is not None else None
+
+    async def _worker(self) -> None:
+        while True:
+            flight = self._next_flight()
+            if flight is None:
+                # ไม่มีงาน หรือทุกคนที่รออยู่ติดโควตา -> รอจนมีงานใหม่/มีงานเสร็จ
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            flight.started_at = time.monotonic()
+            self._running[flight.slot_id] = flight
+            try:
+                # ถ้า prefetch ยังไม่เสร็จ รอผลเดิม (ไม่ resolve ซ้ำ)
+                if flight.prefetch_task is not None and not flight.prefetch_task.done():
+                    await asyncio.wait([flight.prefetch_task])
+                if flight.error is not None:
+                    await self._reject_flight(flight)
+                    continue
+                for job in flight.jobs:
+                    self._start_job(flight, job)
+                # รอจนทุกคำขอในช่องนี้เสร็จ (รวมคำขอที่เข้ามาสมทบระหว่างรัน)
+                while True:
+                    pending = [t for t in flight.tasks if not t.done()]
+                    if not pending:
+                        break
+                    await asyncio.wait(pending)
+            finally:
+                self._finish_flight(flight)
+
+    async def _prefetch_flight(self, flight: _Flight) -> None:
+        async with self._prefetch_sem:
+            in_queue = self._waiting.get(flight.slot_id) is flight or self._running.get(flight.slot_id) is flight
+            if not flight.jobs or not in_queue:
+                # ช่องนี้ถูกลบ/ยกเลิกไปแล้วระหว่างรอ
+                return
+            try:
+                flight.prefetched = await self._prefetch(flight.jobs[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                flight.error = e
+                # ยังรอคิวอยู่ -> ปฏิเสธเลย (ถ้า worker หยิบไปแล้ว worker จะปฏิเสธเอง)
+                if self._waiting.get(flight.slot_id) is flight:
+                    del self._waiting[flight.slot_id]
+                    await self._reject_flight(flight)
+                return
+            for job in flight.jobs:
+                job.prefetched = flight.prefetched
+
+    async def _reject_flight(self, flight: _Flight) -> None:
+        if flight.dedup_key and self._by_key.get(flight.dedup_key) is flight:
+            del self._by_key[flight.dedup_key]
+        jobs = list(flight.jobs)
+        for job in jobs:
+            self._flight_of.pop(job.job_id, None)
+        self.rejected_total += len(jobs)
+        if self._on_rejected is None:
+            return
+        for job in jobs:
+            try:
+                await self._on_rejected(job, flight.error)
+            except Exception as e:
+                print("Reject job callback error:", e)
+
+    def _start_job(self, flight: _Flight, job: DownloadJob) -> None:
+        job.started_at = time.monotonic()
+        task = asyncio.create_task(self._run_one(job))
+        self._job_tasks[job.job_id] = task
+        task.add_done_callback(lambda _t, job_id=job.job_id: self._job_tasks.pop(job_id, None))
+        flight.tasks.append(task)
+
+    def _finish_flight(self, flight: _Flight) -> None:
+        self._running.pop(flight.slot_id, None)
+        if flight.dedup_key and self._by_key.get(flight.dedup_key) is flight:
+            del self._by_key[flight.dedup_key]
+        for job in flight.jobs:
+            self._flight_of.pop(job.job_id, None)
+        if flight.started_at is not None and flight.error is None:
+            self._durations.append(time.monotonic() - flight.started_at)
+        # โควตาพร้อมกันของเจ้าของช่องว่างลง -> ปลุก worker ที่รออยู่
+        self._wakeup.set()
+
+    # ----------------- จัดการงานในคิว -----------------
+
+    def submit(
+        self,
+        user: Any,
+        url: str,
+        custom_name: Optional[str],
+        fmt: str = "mp3",
+        split: bool = False,
+        dedup_key: Optional[str] = None,
+        priority: bool = False,
+        quota_exempt: bool = False,
+        batch_id: Optional[int] = None,
+    ) -> DownloadJob:
+        """ใส่งานเข้าคิว คืน DownloadJob ที่ได้ job_id แล้ว
+
+        ถ้ามีงาน dedup_key เดียวกันรออยู่หรือกำลังทำ จะรวมเข้าช่องเดียวกัน
+        priority = เข้าช่องด่วน (ไม่ติดโควตาพร้อมกัน) เช่นงานแอดมิน หรืองานที่มีไฟล์ในแคชแล้ว
+        quota_exempt = ไม่นับโควตาต่อชั่วโมง (เช่นงานต่อจากปุ่มแบ่งไฟล์ที่นับโควตาไปแล้วตอนส่งครั้งแรก)
+        ถ้าคิวเต็มจะโยน QueueFullError ถ้าเกินโควตาจะโยน QuotaExceededError ทันที (ไม่รอ)
+        งานที่ถูกปฏิเสธเพราะคิวเต็มไม่นับโควตา
+        """
+        flight = self._by_key.get(dedup_key) if dedup_key else None
+        if flight is None and self.max_depth and len(self._waiting) >= self.max_depth:
+            raise QueueFullError(self.max_depth)
+        if not quota_exempt:
+            self.charge_quota(user.id)
+        job = DownloadJob(
+            job_id=next(self._ids),
+            user=user,
+            url=url,
+            custom_name=custom_name,
+            fmt=fmt,
+            split=split,
+            dedup_key=dedup_key,
+            batch_id=batch_id,
+        )
+        if flight is not None:
+            job.prefetched = flight.prefetched
+            flight.jobs.append(job)
+            self._flight_of[job.job_id] = flight
+            self.merged_total += 1
+            if flight.slot_id in self._running:
+                self._start_job(flight, job)
+            return job
+
+        flight = _Flight(
+            slot_id=next(self._slot_ids), dedup_key=dedup_key, owner=user.id, priority=priority, jobs=[job]
+        )
+        self._waiting[flight.slot_id] = flight
+        self._lanes.push(flight.slot_id, flight.owner, priority)
+        self._flight_of[job.job_id] = flight
+        if dedup_key:
+            self._by_key[dedup_key] = flight
+        if self._prefetch is not None:
+            flight.prefetch_task = asyncio.create_task(self._prefetch_flight(flight))
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def check_quota(self, user_id: int) -> None:
+        """โยน QuotaExceededError ถ้าผู้ใช้ส่งงานครบโควตาต่อชั่วโมงแล้ว (ไม่บันทึกการส่ง)"""
+        if not self.per_user_hourly:
+            return
+        now = time.monotonic()
+        recent = self._submitted_at.setdefault(user_id, deque())
+        while recent and now - recent[0] >= 3600:
+            recent.popleft()
+        if len(recent) >= self.per_user_hourly:
+            self.quota_rejected_total += 1
+            raise QuotaExceededError(self.per_user_hourly, 3600 - (now - recent[0]))
+
+    def charge_quota(self, user_id: int) -> None:
+        """นับงานที่ผู้ใช้ส่งในชั่วโมงที่ผ่านมา (เกินโควตาโยน QuotaExceededError) แล้วบันทึกครั้งนี้"""
+        if not self.per_user_hourly:
+            return
+        self.check_quota(user_id)
+        self._submitted_at[user_id].append(time.monotonic())
+
+    def remove(self, job_id: int) -> bool:
+        """ลบงานที่ยังรอคิวอยู่ตาม job_id (ถ้าช่องว่าง worker จะข้ามไปเอง)"""
+        flight = self._flight_of.get(job_id)
+        if flight is None or flight.slot_id not in self._waiting:
+            return False
+        flight.jobs = [j for j in flight.jobs if j.job_id != job_id]
+        del self._flight_of[job_id]
+        if not flight.jobs:
+            del self._waiting[flight.slot_id]
+            if flight.dedup_key and self._by_key.get(flight.dedup_key) is flight:
+                del self._by_key[flight.dedup_key]
+            self._cancel_prefetch(flight)
+        elif all(j.user.id != flight.owner for j in flight.jobs):
+            # เจ้าของช่องถอนงานออกไปแล้ว -> ยกช่องให้ผู้ขอคนถัดไป (นับโควตาพร้อมกัน/ลำดับรอบของคนนั้นแทน)
+            flight.owner = flight.jobs[0].user.id
+            if not flight.priority:
+                self._lanes.push(flight.slot_id, flight.owner, False)
+        return True
+
+    @staticmethod
+    def _cancel_prefetch(flight: _Flight) -> None:
+        """ช่องถูกลบทั้งช่อง -> ไม่ต้องอ่าน metadata ต่อ"""
+        if flight.prefetch_task is not None and not flight.prefetch_task.done():
+            flight.prefetch_task.cancel()
+
+    def cancel(self, job_id: int) -> bool:
+        """ยกเลิกงาน: ถ้ายังรอคิวจะลบออก ถ้ากำลังทำจะ cancel task ของงานนั้นทันที
+        (ฝั่งผู้รันงานได้ CancelledError ไปหยุดงานหนัก/ลบไฟล์ชั่วคราวเอง)"""
+        if self.remove(job_id):
+            return True
+        task = self._job_tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def cancel_running(self) -> int:
+        """cancel ทุกงานที่กำลังทำ คืนจำนวนงานที่ cancel"""
+        tasks = [t for t in self._job_tasks.values() if not t.done()]
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    def clear(self) -> int:
+        """ลบงานที่รอคิวทั้งหมด คืนจำนวนงาน (คำขอ) ที่ลบ"""
+        count = 0
+        for flight in self._waiting.values():
+            count += len(flight.jobs)
+            for job in flight.jobs:
+                self._flight_of.pop(job.job_id, None)
+            if flight.dedup_key and self._by_key.get(flight.dedup_key) is flight:
+                del self._by_key[flight.dedup_key]
+            self._cancel_prefetch(flight)
+        self._waiting.clear()
+        self._lanes.clear()
+        return count
+
+    def get_job(self, job_id: int) -> Optional[DownloadJob]:
+        flight = self._flight_of.get(job_id)
+        if flight is None:
+            return None
+        return next((j for j in flight.jobs if j.job_id == job_id), None)
+
+    def waiting_jobs(self) -> List[DownloadJob]:
+        """งาน (คำขอ) ทั้งหมดที่ยังรอคิว ตามลำดับที่จะถูกหยิบจริง"""
+        return [j for f, _start in self._dispatch_plan() for j in f.jobs]
+
+    def jobs_for_user(self, user_id: int) -> List[DownloadJob]:
+        flights = list(self._running.values()) + [f for f, _start in self._dispatch_plan()]
+        return [j for f in flights for j in f.jobs if j.user.id == user_id]
+
+    def running_for_user(self, user_id: int) -> int:
+        """จำนวนช่องที่ผู้ใช้นี้เป็นเจ้าของและกำลังทำอยู่"""
+        return sum(1 for f in self._running.values() if f.owner == user_id)
+
+    def merged_count(self, job_id: int) -> int:
+        """จำนวนคำขออื่นที่ใช้ช่องคิวเดียวกับงานนี้"""
+        flight = self._flight_of.get(job_id)
+        return len(flight.jobs) - 1 if flight is not None else 0
+
+    # ----------------- สถานะคิว -----------------
+
+    @property
+    def waiting_count(self) -> int:
+        """จำนวนช่องคิวที่รอ (คำขอที่ถูกรวมนับเป็นช่องเดียว)"""
+        return len(self._waiting)
+
+    @property
+    def waiting_requests(self) -> int:
+        return sum(len(f.jobs) for f in self._waiting.values())
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def _dispatch_plan(self) -> List[Tuple[_Flight, float]]:
+        """จำลองการหยิบงานของ worker ด้วยกติกาเดียวกับของจริง (ช่องด่วน, round-robin, โควตาพร้อมกัน)
+        คืนรายการ (ช่องที่รอ, เวลาที่คาดว่าจะเริ่ม นับจากตอนนี้) ตามลำดับที่จะถูกหยิบ"""
+        avg = self.average_job_seconds()
+        now = time.monotonic()
+        lanes = self._lanes.copy()
+        running = self._running_per_user()
+        # (เวลาที่คาดว่าจะเสร็จ, เจ้าของ หรือ None ถ้าไม่นับโควตา)
+        busy: List[Tuple[float, int, Optional[int]]] = []
+        order = itertools.count()
+        for f in self._running.values():
+            end = max(0.0, avg - (now - (f.started_at or now)))
+            heapq.heappush(busy, (end, next(order), None if f.priority else f.owner))
+        free = max(0, self.workers - len(self._running))
+        clock = 0.0
+        plan: List[Tuple[_Flight, float]] = []
+        while True:
+            slot_id = lanes.select(self._is_waiting, running, self.per_user_concurrency) if free else None
+            if slot_id is not None:
+                flight = self._waiting[slot_id]
+                plan.append((flight, clock))
+                owner = None if flight.priority else flight.owner
+                if owner is not None:
+                    running[owner] = running.get(owner, 0) + 1
+                heapq.heappush(busy, (clock + avg, next(order), owner))
+                free -= 1
+                continue
+            if not busy or not any(self._is_waiting(s) for s in self._remaining(lanes)):
+                break
+            # ไม่มีช่องที่หยิบได้ตอนนี้ -> เลื่อนเวลาไปจนมีงานเสร็จ
+            end, _n, owner = heapq.heappop(busy)
+            clock = max(clock, end)
+            if owner is not None:
+                running[owner] -= 1
+            free += 1
+        return plan
+
+    @staticmethod
+    def _remaining(lanes: _FairLanes):
+        yield from lanes.priority
+        for lane in lanes.by_user.values():
+            yield from lane
+
+    def position(self, job_id: int) -> Optional[int]:
+        """ลำดับคิว (เริ่มที่ 1) ของงานที่รออยู่ ตามลำดับที่จะถูกหยิบจริง, 0 = กำลังทำ, None = ไม่พบ"""
+        flight = self._flight_of.get(job_id)
+        if flight is None:
+            return None
+        if flight.slot_id in self._running:
+            return 0
+        for index, (planned, _start) in enumerate(self._dispatch_plan()):
+            if planned is flight:
+                return index + 1
+        return None
+
+    def average_job_seconds(self) -> float:
+        if not self._durations:
+            return DEFAULT_JOB_SECONDS
+        return sum(self._durations) / len(self._durations)
+
+    def eta_seconds(self, job_id: int) -> Optional[float]:
+        """ประมาณเวลาที่งานนี้จะเสร็จ (วินาทีจากตอนนี้)
+
+        จำลองการแจกงานให้ worker ตามกติกาเดียวกับของจริง (ดู _dispatch_plan)
+        """
+        flight = self._flight_of.get(job_id)
+        if flight is None:
+            return None
+        avg = self.average_job_seconds()
+        now = time.monotonic()
+        if flight.slot_id in self._running:
+            return max(0.0, avg - (now - (flight.started_at or now)))
+        for planned, start in self._dispatch_plan():
+            if planned is flight:
+                return start + avg
+        return None
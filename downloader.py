@@ -0,0 +1,990 @@
+# -*- coding: utf-8 -*-
+"""ส่วนดาวน์โหลด + แปลงไฟล์ (yt-dlp / ffmpeg)
+งานพวกนี้เป็นงาน blocking ทั้งหมด จึงต้องรันใน thread/process pool แยก
+ไม่ให้ event loop ของบอท (heartbeat, slash command, modal) ค้าง
+"""
+
+import asyncio
+import glob
+import itertools
+import math
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import (
+    MAX_FILE_SIZE_BYTES,
+    MAX_SOURCE_FILE_SIZE_BYTES,
+    MIN_AUDIO_BITRATE_KBPS,
+    MAX_VIDEO_DURATION_SECONDS,
+    PREFETCH_CONCURRENCY,
+    DOWNLOAD_POOL_KIND,
+    DOWNLOAD_POOL_SIZE,
+    DOWNLOAD_JOB_TIMEOUT,
+    STREAMING_PIPELINE,
+    DOWNLOAD_FRAGMENTS,
+    HTTP_CHUNK_SIZE,
+    BANDWIDTH_LIMIT_BYTES_PER_SEC,
+    BANDWIDTH_BURST_BYTES,
+    EXTRACTOR_PROFILES_FILE,
+    PROFILE_FAILURE_THRESHOLD,
+    PROFILE_COOLDOWN_SECONDS,
+    PROFILE_MIN_THROUGHPUT_BYTES,
+)
+from extractor_profiles import DEFAULT_PROFILE, ExtractorProfile, ProfilePool, load_profiles
+from http_fetch import ConnectionPool, FetchError, TokenBucket, iter_ranges
+
+_EXECUTOR: Optional[Executor] = None
+_PREFETCH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_RANGE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+# connection ที่ใช้ซ้ำข้ามงาน + งบแบนด์วิดท์รวมของทุกงานใน process นี้
+# (pool แบบ process / worker.py แต่ละ process มีงบของตัวเอง)
+HTTP_POOL = ConnectionPool(max_idle_per_host=max(2, DOWNLOAD_FRAGMENTS * max(1, DOWNLOAD_POOL_SIZE)))
+BANDWIDTH = TokenBucket(BANDWIDTH_LIMIT_BYTES_PER_SEC, BANDWIDTH_BURST_BYTES or None)
+
+# ตัวตนของ extractor ที่หมุนใช้ตามสุขภาพ (พักตัวที่ถูกบล็อก/จำกัดความเร็ว)
+PROFILE_POOL = ProfilePool(
+    load_profiles(EXTRACTOR_PROFILES_FILE),
+    failure_threshold=PROFILE_FAILURE_THRESHOLD,
+    cooldown_seconds=PROFILE_COOLDOWN_SECONDS,
+    min_throughput=PROFILE_MIN_THROUGHPUT_BYTES,
+)
+# key ใน info ที่ prefetch ไว้ บอกว่าใช้ profile ไหนอ่าน (URL ของ format ผูกกับ client นั้น)
+_PROFILE_INFO_KEY = "_ytmp3_profile"
+
+# รูปแบบ URL YouTube ที่ดึง video id (11 ตัวอักษร) ออกมาได้
+_VIDEO_ID_RE = re.compile(
+    r"(?:youtu\.be/|youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/))"
+    r"([0-9A-Za-z_-]{11})"
+)
+
+
+# รูปแบบไฟล์ที่ผู้ใช้เลือกได้ ("original" = ส่งไฟล์เสียงต้นฉบับ ไม่แปลง)
+OUTPUT_FORMATS = ("mp3", "m4a", "opus", "original")
+
+# format selector ของ yt-dlp ต่อรูปแบบไฟล์ (เลือกต้นทางที่ remux ได้ก่อน จะได้ไม่ต้องเข้ารหัสใหม่)
+_FORMAT_SELECTORS = {
+    "mp3": "bestaudio* / bestaudio / best / ba",
+    "m4a": "bestaudio[ext=m4a] / bestaudio* / best / ba",
+    "opus": "bestaudio[acodec=opus] / bestaudio* / best / ba",
+    "original": "bestaudio / bestaudio* / best / ba",
+}
+
+# codec ที่ yt-dlp รายงาน (ตัดเลข profile ออกแล้ว) ที่ copy ลง container ปลายทางได้เลย
+_REMUX_SOURCE_CODECS = {
+    "mp3": ("mp3",),
+    "m4a": ("mp4a", "aac"),
+    "opus": ("opus",),
+}
+
+
+# bitrate (kbps) ที่ระบบเลือกใช้ได้ เรียงจากสูงไปต่ำ
+BITRATE_LADDER = (320, 256, 192, 160, 128, 112, 96, 80, 64, 48, 32)
+
+# เผื่อพื้นที่ให้ header/container ของไฟล์ (ใช้แค่ 95% ของขนาดสูงสุด)
+_SIZE_SAFETY = 0.95
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """ค่าการเข้ารหัสเสียง (ใช้เป็นส่วนหนึ่งของ key แคชด้วย)
+
+    bitrate คือเพดาน ถ้าคลิปยาวจนไฟล์จะเกิน MAX_FILE_SIZE_BYTES ระบบจะลด bitrate ลงเอง
+    split = แบ่งเป็นหลายไฟล์ (ใช้เมื่อคลิปยาวเกินกว่าจะใส่ไฟล์เดียวได้)
+    """
+    codec: str = "mp3"
+    bitrate: str = "192"
+    split: bool = False
+
+    def cache_key(self, video_id: str) -> str:
+        if self.codec == "original":
+            return f"{video_id}-original"
+        key = f"{video_id}-{self.codec}-{self.bitrate}"
+        return key + "-split" if self.split else key
+
+
+class TooLongForSingleFile(Exception):
+    """คลิปยาวเกินกว่าจะใส่ไฟล์เดียวได้ แม้ใช้ bitrate ต่ำสุดแล้ว (รู้ตั้งแต่ก่อนโหลด)"""
+
+    def __init__(self, parts: int, duration: float):
+        super().__init__(parts, duration)
+        self.parts = parts
+        self.duration = duration
+
+    def __str__(self) -> str:
+        return (
+            f"คลิปยาว {int(self.duration // 60)} นาที ใส่ไฟล์เดียวไม่ได้ "
+            f"(ต้องแบ่งเป็น {self.parts} ไฟล์)"
+        )
+
+
+def fit_bitrate(duration: float, max_kbps: int, limit_bytes: int = MAX_FILE_SIZE_BYTES) -> Optional[int]:
+    """bitrate สูงสุดในขั้นบันได ที่ไม่เกิน max_kbps และทำให้ไฟล์ไม่เกิน limit_bytes
+    คืน None ถ้าแม้ MIN_AUDIO_BITRATE_KBPS ก็ยังใหญ่เกิน"""
+    if duration <= 0:
+        return max_kbps
+    budget_kbps = limit_bytes * _SIZE_SAFETY * 8 / 1000 / duration
+    for kbps in BITRATE_LADDER:
+        if kbps <= max_kbps and kbps <= budget_kbps and kbps >= MIN_AUDIO_BITRATE_KBPS:
+            return kbps
+    return None
+
+
+def split_plan(duration: float, kbps: int, limit_bytes: int = MAX_FILE_SIZE_BYTES):
+    """คืน (ความยาวต่อไฟล์เป็นวินาที, จำนวนไฟล์) เมื่อแบ่งไฟล์ที่ bitrate นี้"""
+    segment_seconds = max(1, int(limit_bytes * _SIZE_SAFETY * 8 / 1000 / kbps))
+    return segment_seconds, max(1, math.ceil(duration / segment_seconds))
+
+
+def _estimated_source_bytes(info: dict) -> Optional[float]:
+    size = info.get("filesize") or info.get("filesize_approx")
+    if size:
+        return float(size)
+    kbps = info.get("abr") or info.get("tbr")
+    duration = info.get("duration")
+    if kbps and duration:
+        return float(kbps) * 1000 / 8 * float(duration)
+    return None
+
+
+def estimate_work_bytes(info: Optional[dict], options: EncodeOptions) -> int:
+    """ประเมินพื้นที่ชั่วคราวสูงสุดที่งานนี้ใช้ (ไฟล์ต้นทาง + ไฟล์ผลลัพธ์) สำหรับจองพื้นที่ก่อนโหลด
+    ไม่มี metadata (หรือประเมินไม่ได้) ใช้ค่าเผื่อ 2 เท่าของขนาดไฟล์สูงสุด"""
+    source = _estimated_source_bytes(info) if info else None
+    if not source:
+        return 2 * MAX_FILE_SIZE_BYTES
+    source = min(source, MAX_SOURCE_FILE_SIZE_BYTES)
+    if options.codec == "original":
+        return int(source)
+    duration = float(info.get("duration") or 0)
+    output = duration * int(options.bitrate) * 1000 / 8 if duration else source
+    if not options.split:
+        output = min(output, MAX_FILE_SIZE_BYTES)
+    return int(source + output)
+
+
+@dataclass
+class DownloadOutcome:
+    """ผลของงานโหลด/แปลง 1 ครั้ง (ส่งกลับข้าม process ได้)"""
+    path: str
+    title: str
+    codec: str
+    mode: str  # "stream" / "download"
+    remuxed: bool  # True = copy เสียงต้นฉบับ ไม่ได้เข้ารหัสใหม่
+    cpu_seconds: float  # เวลา CPU ของ ffmpeg
+    media_seconds: float  # ความยาวคลิป
+    bitrate: str = ""  # bitrate ที่ใช้จริง (หลังปรับให้พอดีขนาดไฟล์)
+    parts: List[str] = field(default_factory=list)  # ไฟล์ย่อยเมื่อ split (ไม่ split = [path])
+    # เวลาที่ใช้ต่อขั้น (metadata / download / transcode / split) หน่วยวินาที
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    source_bytes: int = 0  # ขนาดข้อมูลต้นทางที่โหลดมา
+
+
+@dataclass
+class Progress:
+    """ความคืบหน้าของงาน (ส่งจาก thread ของ pool ไปให้บอทแสดงผล)"""
+    stage: str  # "download" / "transcode" / "split"
+    fraction: Optional[float] = None  # 0-1 หรือ None ถ้าไม่รู้ขนาดรวม
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    speed: Optional[float] = None  # ไบต์ต่อวินาที
+
+
+ProgressCallback = Callable[[Progress], None]
+
+
+class _ProgressForwarder:
+    """กรองความถี่ของ progress ก่อนส่งออกจาก thread (hook ของ yt-dlp ถูกเรียกทุก chunk)
+    ส่งต่อเมื่อเปลี่ยนขั้น หรือห่างจากครั้งก่อนอย่างน้อย min_interval วินาที"""
+
+    def __init__(self, callback: Optional[ProgressCallback], min_interval: float = 0.5):
+        self._callback = callback
+        self._min_interval = min_interval
+        self._last_at = 0.0
+        self._last_stage = ""
+
+    def __call__(self, update: Progress) -> None:
+        if self._callback is None:
+            return
+        now = time.monotonic()
+        if update.stage == self._last_stage and now - self._last_at < self._min_interval:
+            return
+        self._last_at = now
+        self._last_stage = update.stage
+        try:
+            self._callback(update)
+        except Exception:
+            pass  # แสดงผลไม่ได้ไม่ควรทำให้งานล้ม
+
+
+def _watch_ffmpeg_progress(pipe, duration: float, report: _ProgressForwarder) -> None:
+    """อ่านผลของ ffmpeg -progress (key=value ทีละบรรทัด) แล้วแปลงเป็นสัดส่วนจากความยาวคลิป"""
+    for raw in iter(pipe.readline, b""):
+        key, _sep, value = raw.decode("ascii", "replace").strip().partition("=")
+        if key == "out_time_us" and duration > 0:
+            try:
+                seconds = int(value) / 1_000_000
+            except ValueError:
+                continue
+            report(Progress("transcode", fraction=min(1.0, max(0.0, seconds / duration))))
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """ดึง video id ของ YouTube จาก URL (คืน None ถ้าไม่ใช่ลิงก์วิดีโอ)"""
+    match = _VIDEO_ID_RE.search(url.strip())
+    return match.group(1) if match else None
+
+
+def build_filename(custom_name: Optional[str], title: str, ext: str, suffix: str = "") -> str:
+    """ชื่อไฟล์ที่ใช้ตอนส่ง (ชื่อที่ผู้ใช้ตั้ง หรือชื่อคลิป)"""
+    name = (custom_name or "").replace("/", "_").replace("\\", "_").strip()
+    if not name:
+        name = title.replace("/", "_").replace("\\", "_").strip() or "audio"
+    return name + suffix + ext
+
+
+# codec -> (encoder ของ ffmpeg, container) สำหรับโหมด streaming
+_STREAM_ENCODERS = {
+    "mp3": ("libmp3lame", "mp3"),
+    "m4a": ("aac", "ipod"),
+    "opus": ("libopus", "opus"),
+}
+# ขนาด chunk ที่อ่านจากเน็ตแล้วส่งเข้า ffmpeg
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingNotPossible(Exception):
+    """สตรีมเข้า ffmpeg ไม่ได้ (ให้ถอยไปใช้วิธีโหลดไฟล์ก่อนแล้วค่อยแปลง)"""
+
+
+class JobCancelled(Exception):
+    """งานถูกยกเลิกระหว่างทำ"""
+
+    def __str__(self) -> str:
+        return "งานถูกยกเลิกแล้ว"
+
+
+def _kill_child_processes(marker: str) -> None:
+    """kill process ลูกของเรา (เช่น ffmpeg ที่ yt-dlp เรียก) ที่มี marker อยู่ใน command line
+    อ่านจาก /proc จึงใช้ได้เฉพาะ Linux (ระบบอื่นจะข้ามไป)"""
+    my_pid = os.getpid()
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                # รูปแบบ: pid (comm) state ppid ... (comm อาจมีช่องว่าง จึงตัดจาก ')' ตัวสุดท้าย)
+                ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+            if ppid != my_pid:
+                continue
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if marker.encode() not in f.read():
+                    continue
+            os.kill(pid, signal.SIGKILL)
+        except (OSError, ValueError, IndexError):
+            continue
+
+
+class CancelToken:
+    """ตัวยกเลิกงานข้าม thread: ตั้งค่าจาก event loop แล้ว thread ที่ทำงานอยู่จะหยุดที่จุดตรวจถัดไป
+    ตอนยกเลิกจะ kill ffmpeg ที่ผูกไว้ (และ ffmpeg ของ yt-dlp ที่ทำงานในโฟลเดอร์ของงานนี้) ทันที"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._procs: List[subprocess.Popen] = []
+        self.work_dir: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def attach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.append(proc)
+        if self.cancelled:
+            proc.kill()
+
+    def detach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            if proc in self._procs:
+                self._procs.remove(proc)
+
+    def cancel(self) -> None:
+        self._event.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        if self.work_dir:
+            _kill_child_processes(self.work_dir)
+
+
+def get_executor() -> Executor:
+    """คืน pool สำหรับงานดาวน์โหลด (สร้างครั้งแรกตอนเรียกใช้)"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        workers = max(1, DOWNLOAD_POOL_SIZE)
+        if DOWNLOAD_POOL_KIND == "process":
+            _EXECUTOR = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytmp3")
+    return _EXECUTOR
+
+
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    """pool แยกสำหรับอ่าน metadata (งานเบา ไม่ควรไปแย่งช่องกับงานโหลดจริง)"""
+    global _PREFETCH_EXECUTOR
+    if _PREFETCH_EXECUTOR is None:
+        _PREFETCH_EXECUTOR = ThreadPoolExecutor(
+            max_workers=max(1, PREFETCH_CONCURRENCY), thread_name_prefix="ytmp3-meta"
+        )
+    return _PREFETCH_EXECUTOR
+
+
+def get_range_executor() -> ThreadPoolExecutor:
+    """pool สำหรับโหลดช่วงของไฟล์พร้อมกัน (ใช้ร่วมทุกงาน ช่วงละ thread)"""
+    global _RANGE_EXECUTOR
+    if _RANGE_EXECUTOR is None:
+        _RANGE_EXECUTOR = ThreadPoolExecutor(
+            max_workers=max(1, DOWNLOAD_FRAGMENTS * max(1, DOWNLOAD_POOL_SIZE)), thread_name_prefix="ytmp3-range"
+        )
+    return _RANGE_EXECUTOR
+
+
+def shutdown_executor() -> None:
+    """ปิด pool (ใช้ตอนปิดบอท)"""
+    global _EXECUTOR, _PREFETCH_EXECUTOR, _RANGE_EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR = None
+    if _PREFETCH_EXECUTOR is not None:
+        _PREFETCH_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _PREFETCH_EXECUTOR = None
+    if _RANGE_EXECUTOR is not None:
+        _RANGE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _RANGE_EXECUTOR = None
+    HTTP_POOL.close()
+
+
+def _can_remux(info: dict, options: EncodeOptions) -> bool:
+    """เสียงต้นทางเป็น codec เดียวกับที่ต้องการอยู่แล้ว (copy ได้ ไม่ต้องเข้ารหัสใหม่)"""
+    acodec = (info.get("acodec") or "").split(".")[0].lower()
+    return acodec in _REMUX_SOURCE_CODECS.get(options.codec, ())
+
+
+def _can_stream(info: dict, options: EncodeOptions) -> bool:
+    """format ที่เลือกเป็นไฟล์เดียวผ่าน http ธรรมดา (ไม่ใช่ DASH แยกชิ้น / m3u8 / รวมหลาย format)"""
+    if options.codec not in _STREAM_ENCODERS:
+        return False
+    if info.get("requested_formats") or not info.get("url"):
+        return False
+    return info.get("protocol") in ("http", "https")
+
+
+def _children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _open_source(ydl, info: dict, cancel: CancelToken) -> Iterator[bytes]:
+    """เปิดสตรีมไฟล์ต้นทาง คืน iterator ของก้อนข้อมูลตามลำดับไฟล์ (หักงบแบนด์วิดท์รวมแล้ว)
+
+    ถ้า DOWNLOAD_FRAGMENTS > 1 จะโหลดหลายช่วงพร้อมกันผ่าน connection ที่ใช้ซ้ำได้
+    (googlevideo จำกัดความเร็วต่อ connection จึงเร็วขึ้นตามจำนวนช่วง) เปิดไม่ได้จะโยน StreamingNotPossible
+    """
+    from yt_dlp.networking import Request
+    from yt_dlp.networking.exceptions import RequestError
+
+    headers = dict(info.get("http_headers") or {})
+    if DOWNLOAD_FRAGMENTS > 1:
+        chunks = iter_ranges(
+            info["url"], headers, get_range_executor(), HTTP_POOL, BANDWIDTH,
+            HTTP_CHUNK_SIZE, DOWNLOAD_FRAGMENTS, cancel.check, MAX_SOURCE_FILE_SIZE_BYTES,
+        )
+        try:
+            # คำขอแรกล้มเหลว = ยังไม่ได้ส่งอะไรเข้า ffmpeg -> ถอยไปใช้วิธีเดิมได้
+            first = next(chunks, b"")
+        except FetchError as e:
+            raise StreamingNotPossible(f"เปิดสตรีมไม่ได้: {e}") from e
+        return itertools.chain((first,), chunks)
+
+    try:
+        resp = ydl.urlopen(Request(info["url"], headers=headers))
+    except Exception as e:
+        raise StreamingNotPossible(f"เปิดสตรีมไม่ได้: {e}") from e
+
+    def read_all() -> Iterator[bytes]:
+        with resp:
+            while True:
+                cancel.check()
+                try:
+                    chunk = resp.read(_STREAM_CHUNK_SIZE)
+                except (OSError, RequestError) as e:
+                    raise FetchError(f"อ่านสตรีมไม่สำเร็จ: {e}") from e
+                if not chunk:
+                    return
+                BANDWIDTH.consume(len(chunk), cancel.check)
+                yield chunk
+
+    return read_all()
+
+
+def _stream_transcode(
+    ydl,
+    info: dict,
+    out_path: str,
+    options: EncodeOptions,
+    remux: bool,
+    stages: Dict[str, float],
+    report: _ProgressForwarder,
+    cancel: CancelToken,
+) -> float:
+    """อ่านสตรีมเสียงจากเน็ตแล้วส่งเข้า ffmpeg ทาง stdin ทันที (โหลดกับแปลงทำไปพร้อมกัน)
+    คืนเวลา CPU ที่ ffmpeg ใช้ (วินาที) และบันทึกเวลาแต่ละขั้นลง stages
+    (download = จนอ่านสตรีมหมด, transcode = เวลาที่ ffmpeg ใช้ต่อหลังจากนั้น)"""
+    encoder, container = _STREAM_ENCODERS[options.codec]
+    if remux:
+        codec_args = ["-c:a", "copy"]
+    else:
+        codec_args = ["-ac", "2", "-c:a", encoder, "-b:a", f"{options.bitrate}k"]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-nostats", "-progress", "pipe:1",
+        "-i", "pipe:0",
+        "-vn", *codec_args,
+        "-f", container, out_path,
+    ]
+    total = info.get("filesize") or info.get("filesize_approx")
+    duration = float(info.get("duration") or 0)
+    started = time.monotonic()
+    chunks = _open_source(ydl, info, cancel)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    cancel.attach(proc)
+    # ต้องอ่าน stdout ตลอด ไม่งั้น pipe เต็มแล้ว ffmpeg จะค้าง
+    watcher = threading.Thread(target=_watch_ffmpeg_progress, args=(proc.stdout, duration, report), daemon=True)
+    watcher.start()
+    received = 0
+    try:
+        for chunk in chunks:
+            cancel.check()
+            received += len(chunk)
+            if received > MAX_SOURCE_FILE_SIZE_BYTES:
+                raise ValueError(f"ไฟล์ต้นทางใหญ่เกิน {MAX_SOURCE_FILE_SIZE_BYTES // (1024*1024)} MB")
+            proc.stdin.write(chunk)
+            elapsed = time.monotonic() - started
+            report(Progress(
+                "download",
+                fraction=received / total if total else None,
+                downloaded_bytes=received,
+                total_bytes=int(total) if total else None,
+                speed=received / elapsed if elapsed > 0 else None,
+            ))
+        proc.stdin.close()
+        read_done = time.monotonic()
+        stages["download"] = read_done - started
+        stages["source_bytes"] = received
+        stderr = proc.stderr.read()
+        # ใช้ wait4 เพื่อได้เวลา CPU ของ ffmpeg ตัวนี้ตัวเดียว
+        _pid, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cancel.check()
+        if proc.returncode != 0:
+            raise StreamingNotPossible(stderr.decode("utf-8", "replace").strip() or "ffmpeg error")
+        stages["transcode"] = time.monotonic() - read_done
+        return usage.ru_utime + usage.ru_stime
+    except BrokenPipeError as e:
+        cancel.check()
+        # ffmpeg ปิดตัวไปก่อน (มักเป็นเพราะ container ที่ต้อง seek ย้อนหลัง เช่น mp4 ที่ moov อยู่ท้ายไฟล์)
+        raise StreamingNotPossible("ffmpeg อ่านสตรีมนี้ไม่ได้") from e
+    except FetchError as e:
+        cancel.check()
+        raise StreamingNotPossible(f"สตรีมขาดกลางทาง: {e}") from e
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        if proc.returncode is None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        cancel.detach(proc)
+        watcher.join(timeout=5)
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            try:
+                pipe.close()
+            except (OSError, ValueError):
+                pass
+
+
+def _ydl_opts(
+    temp_dir: str, options: EncodeOptions, remux: bool, profile: ExtractorProfile = DEFAULT_PROFILE
+) -> dict:
+    ydl_opts = {
+        # ใช้ตัวเลือก format แบบยืดหยุ่นขึ้น เผื่อกรณีบางคลิปไม่มี bestaudio/best แบบเดิม
+        # yt-dlp จะลอง bestaudio*, best, ba ตามลำดับ (แต่ละรูปแบบไฟล์เลือกต้นทางที่ remux ได้ก่อน)
+        "format": _FORMAT_SELECTORS.get(options.codec, _FORMAT_SELECTORS["mp3"]),
+
+        "outtmpl": os.path.join(temp_dir, "%(title)s.%(ext)s"),
+        "noplaylist": True,
+        "quiet": True,
+        "no_warnings": True,
+        # กันไว้ ถ้าไฟล์ต้นทางใหญ่เกินกำหนด จะหยุดโหลดตั้งแต่ต้น (ขนาดไฟล์ผลลัพธ์คุมด้วย bitrate แทน)
+        "max_filesize": MAX_SOURCE_FILE_SIZE_BYTES,
+        # โหลด fragment (DASH/HLS) พร้อมกันหลายชิ้น และขอไฟล์ทีละช่วง (เลี่ยงการจำกัดความเร็วของ connection ยาว ๆ)
+        "concurrent_fragment_downloads": max(1, DOWNLOAD_FRAGMENTS),
+        "http_chunk_size": HTTP_CHUNK_SIZE or None,
+    }
+    # player client / User-Agent / คุกกี้ มาจาก profile (ค่าเริ่มต้น = client Android + cookies.txt)
+    profile.apply(ydl_opts)
+    if options.codec == "original":
+        return ydl_opts
+
+    # FFmpegExtractAudio จะใช้ -acodec copy เองถ้า codec ต้นทางตรงกับปลายทาง
+    ydl_opts["postprocessors"] = [
+        {
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": options.codec,
+            "preferredquality": options.bitrate,
+        }
+    ]
+    if not remux:
+        # บังคับให้ ffmpeg ทำเสียงเป็น 2 แชนแนล (กันปัญหา track แปลก ๆ) ใช้ได้เฉพาะตอนเข้ารหัสใหม่
+        ydl_opts["postprocessor_args"] = ["-ac", "2"]
+    return ydl_opts
+
+
+def _split_audio(path: str, segment_seconds: int) -> List[str]:
+    """ตัดไฟล์เสียงเป็นหลายไฟล์ยาวไม่เกิน segment_seconds (copy ไม่เข้ารหัสใหม่)"""
+    base, ext = os.path.splitext(path)
+    pattern = f"{base}_part%03d{ext}"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", path,
+        "-f", "segment", "-segment_time", str(segment_seconds),
+        "-c", "copy", "-reset_timestamps", "1",
+        pattern,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError("แบ่งไฟล์ไม่สำเร็จ: " + proc.stderr.decode("utf-8", "replace").strip())
+    os.remove(path)
+    return sorted(glob.glob(glob.escape(base) + "_part*" + glob.escape(ext)))
+
+
+def _plan_encode(info: dict, options: EncodeOptions):
+    """เลือก bitrate/remux จาก metadata ก่อนเริ่มโหลด คืน (options ที่ใช้จริง, remux, ความยาวต่อไฟล์ถ้า split)
+
+    โยน TooLongForSingleFile ถ้าไม่ได้ขอ split แต่คลิปยาวเกินจะใส่ไฟล์เดียว
+    และ ValueError ถ้าเป็นคลิปที่โหลดไม่ได้แน่ ๆ (ไลฟ์สด / ยาวเกิน MAX_VIDEO_DURATION_SECONDS)
+    """
+    if info.get("_type") == "playlist":
+        raise ValueError("ลิงก์นี้เป็นเพลย์ลิสต์ ใช้ได้เฉพาะวิดีโอเดี่ยว")
+    if info.get("is_live") or info.get("live_status") in ("is_live", "is_upcoming"):
+        raise ValueError("คลิปนี้เป็นไลฟ์สด/ยังไม่เริ่ม โหลดไม่ได้")
+    duration = float(info.get("duration") or 0)
+    if MAX_VIDEO_DURATION_SECONDS and duration > MAX_VIDEO_DURATION_SECONDS:
+        raise ValueError(f"คลิปยาวเกิน {MAX_VIDEO_DURATION_SECONDS // 60} นาที")
+    source_bytes = _estimated_source_bytes(info)
+    if options.codec == "original":
+        if source_bytes and source_bytes > MAX_FILE_SIZE_BYTES:
+            raise ValueError(
+                f"ไฟล์ต้นฉบับใหญ่เกิน {MAX_FILE_SIZE_BYTES // (1024*1024)} MB "
+                "ลองเลือกรูปแบบ mp3/m4a/opus แทน"
+            )
+        return options, True, None
+
+    remux = _can_remux(info, options)
+    if options.split:
+        # แบ่งไฟล์: ใช้ bitrate ตามที่ขอ แล้วตัดเป็นท่อน ๆ ให้แต่ละท่อนไม่เกินขนาดสูงสุด
+        kbps = int(options.bitrate)
+        segment_seconds, _parts = split_plan(duration, kbps)
+        return options, False, segment_seconds
+
+    if not duration:
+        return options, remux, None
+
+    # remux ได้เฉพาะเมื่อไฟล์ต้นทางเล็กพอ ไม่งั้นต้องเข้ารหัสใหม่ที่ bitrate ต่ำลง
+    if remux and source_bytes and source_bytes <= MAX_FILE_SIZE_BYTES * _SIZE_SAFETY:
+        return options, True, None
+
+    kbps = fit_bitrate(duration, int(options.bitrate))
+    if kbps is None:
+        _segment, parts = split_plan(duration, int(options.bitrate))
+        raise TooLongForSingleFile(parts, duration)
+    return replace(options, bitrate=str(kbps)), False, None
+
+
+def warm_up_blocking() -> None:
+    """import yt_dlp และสร้าง extractor ของ YouTube ไว้ล่วงหน้า งานแรกหลังบอทเริ่มจะได้ไม่ต้องรอ (blocking)"""
+    import yt_dlp
+
+    opts = _ydl_opts(tempfile.gettempdir(), EncodeOptions(), remux=False)
+    # ไม่ต้องโหลด/เขียนไฟล์คุกกี้ตอนอุ่นเครื่อง
+    opts.pop("cookiefile", None)
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        for key in ("Youtube", "YoutubeTab"):
+            ydl.get_info_extractor(key)
+
+
+def prefetch_info_blocking(url: str, options: EncodeOptions) -> dict:
+    """อ่าน metadata + เลือก format ล่วงหน้า (ไม่โหลดไฟล์) และตรวจว่างานนี้ทำได้จริง (blocking)
+
+    คืน info dict ที่ sanitize แล้ว (ส่งข้าม process ได้) เพื่อให้ขั้นโหลดจริงใช้ต่อได้เลย
+    """
+    import yt_dlp
+
+    profile = PROFILE_POOL.acquire()
+    try:
+        with yt_dlp.YoutubeDL(_ydl_opts(tempfile.gettempdir(), options, remux=False, profile=profile)) as ydl:
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+    except Exception as e:
+        PROFILE_POOL.report_failure(profile, e)
+        raise
+    PROFILE_POOL.report_success(profile)
+    info[_PROFILE_INFO_KEY] = profile.name
+    _plan_encode(info, options)
+    return info
+
+
+def expand_playlist_blocking(url: str, limit: int) -> List[Tuple[str, str]]:
+    """อ่านรายการคลิปในเพลย์ลิสต์แบบ flat (ไม่ resolve format ทีละคลิป) คืน [(url, ชื่อคลิป)] ไม่เกิน limit รายการ
+
+    ถ้า URL เป็นคลิปเดี่ยว คืนรายการเดียว (blocking)
+    """
+    import yt_dlp
+
+    profile = PROFILE_POOL.acquire()
+    opts = profile.apply({
+        "quiet": True,
+        "no_warnings": True,
+        "extract_flat": "in_playlist",
+        "playlistend": limit,
+    })
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        PROFILE_POOL.report_failure(profile, e)
+        raise
+    PROFILE_POOL.report_success(profile)
+    if info.get("_type") not in ("playlist", "multi_video"):
+        return [(info.get("webpage_url") or url, info.get("title") or "")]
+    items: List[Tuple[str, str]] = []
+    for entry in info.get("entries") or []:
+        if not entry:
+            continue
+        entry_url = entry.get("url") or entry.get("webpage_url")
+        if not entry_url:
+            continue
+        if entry.get("ie_key") == "Youtube" and not entry_url.startswith("http"):
+            entry_url = f"https://www.youtube.com/watch?v={entry_url}"
+        items.append((entry_url, entry.get("title") or ""))
+        if len(items) >= limit:
+            break
+    return items
+
+
+# ค่าเผื่อ header ของ zip ต่อไฟล์ (local header + central directory, ไม่รวมชื่อไฟล์) และท้ายไฟล์
+_ZIP_ENTRY_OVERHEAD = 30 + 46 + 64
+_ZIP_END_OVERHEAD = 22 + 1024
+
+
+def zip_files_blocking(
+    files: Sequence[Tuple[str, str]],
+    out_dir: str,
+    base_name: str,
+    limit_bytes: int = MAX_FILE_SIZE_BYTES,
+) -> List[str]:
+    """รวมไฟล์ [(path, ชื่อในไฟล์ zip)] เป็นไฟล์ zip หลายไฟล์ที่แต่ละไฟล์ไม่เกิน limit_bytes (blocking)
+
+    ไฟล์เสียงบีบอัดมาแล้ว จึงเก็บแบบ ZIP_STORED (ไม่เสีย CPU บีบซ้ำ) ขนาดจึงคำนวณล่วงหน้าได้
+    แบ่งตามลำดับเดิม ไฟล์ที่ใหญ่เกินจะใส่ zip ใดได้จะอยู่ zip ของตัวเอง (ผู้เรียกต้องตรวจขนาดเอง)
+    """
+    groups: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    current_size = _ZIP_END_OVERHEAD
+    for path, arcname in files:
+        size = os.path.getsize(path) + _ZIP_ENTRY_OVERHEAD + 2 * len(arcname.encode("utf-8"))
+        if current and current_size + size > limit_bytes:
+            groups.append(current)
+            current, current_size = [], _ZIP_END_OVERHEAD
+        current.append((path, arcname))
+        current_size += size
+    if current:
+        groups.append(current)
+
+    archives = []
+    for index, group in enumerate(groups, start=1):
+        suffix = f" ({index}-{len(groups)})" if len(groups) > 1 else ""
+        archive = os.path.join(out_dir, build_filename(base_name, "", ".zip", suffix=suffix))
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+            for path, arcname in group:
+                zf.write(path, arcname)
+        archives.append(archive)
+    return archives
+
+
+def download_mp3_blocking(
+    url: str,
+    options: EncodeOptions,
+    info: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[CancelToken] = None,
+    work_root: Optional[str] = None,
+) -> DownloadOutcome:
+    """โหลดและแปลง YouTube เป็นไฟล์เสียงตามรูปแบบที่เลือก (blocking)
+
+    อ่านความยาวคลิปจาก metadata ก่อนโหลด แล้วเลือก bitrate สูงสุดที่ไฟล์ไม่เกิน MAX_FILE_SIZE_BYTES
+    ถ้าเสียงต้นทางเป็น codec เดียวกับที่ขอ จะ copy ลง container ใหม่ (remux) ไม่เข้ารหัสซ้ำ
+    ถ้าเปิด STREAMING_PIPELINE และ format ที่เลือกสตรีมได้ จะส่งข้อมูลเข้า ffmpeg ระหว่างโหลดเลย
+    ไม่อย่างนั้น (หรือสตรีมล้มเหลว) จะโหลดไฟล์ลงดิสก์ก่อนแล้วให้ FFmpegExtractAudio แปลงตามเดิม
+    ถ้าส่ง info ที่ prefetch ไว้แล้วมาด้วย จะไม่ resolve format ซ้ำ
+    progress (ถ้ามี) จะถูกเรียกจาก thread นี้ด้วย Progress ของแต่ละขั้น
+    cancel (ถ้ามี) ถูกตรวจทุก chunk ที่โหลด ถ้ายกเลิกจะโยน JobCancelled
+    work_root = โฟลเดอร์ที่จองพื้นที่ไว้ (จาก TempStorage) ไม่ระบุ = โฟลเดอร์ชั่วคราวของระบบ
+
+    ถ้าล้มเหลวหรือถูกยกเลิก จะลบโฟลเดอร์ชั่วคราวของงานนี้ทิ้งก่อนโยน exception ต่อ
+    """
+    cancel = cancel or CancelToken()
+    preferred = info.get(_PROFILE_INFO_KEY) if info else None
+    profile = PROFILE_POOL.acquire(preferred)
+    if preferred is not None and profile.name != preferred:
+        # profile ที่อ่าน metadata ไว้ถูกพักไปแล้ว -> URL ของ format ใช้กับตัวตนใหม่ไม่ได้ ต้อง resolve ใหม่
+        info = None
+    temp_dir = tempfile.mkdtemp(prefix="ytmp3_", dir=work_root)
+    cancel.work_dir = temp_dir
+    throttled_before = BANDWIDTH.throttled_seconds
+    try:
+        cancel.check()
+        outcome = _download_into(temp_dir, url, options, info, _ProgressForwarder(progress), cancel, profile)
+    except BaseException as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        # yt-dlp อาจห่อ exception จาก hook ไว้เป็น DownloadError -> ดูจาก token แทน
+        if cancel.cancelled and not isinstance(e, JobCancelled):
+            PROFILE_POOL.release(profile)
+            raise JobCancelled() from None
+        if isinstance(e, Exception) and not isinstance(e, JobCancelled):
+            PROFILE_POOL.report_failure(profile, e)
+        else:
+            PROFILE_POOL.release(profile)
+        raise
+    # ตัวจำกัดแบนด์วิดท์รวมหน่วงงานในช่วงนี้ -> ความเร็วที่วัดได้ไม่ได้บอกอะไรเรื่องตัวตน (ไม่ใช้วัด throughput)
+    PROFILE_POOL.report_success(
+        profile,
+        outcome.source_bytes,
+        outcome.stage_seconds.get("download", 0.0),
+        throttled=BANDWIDTH.throttled_seconds > throttled_before,
+    )
+    return outcome
+
+
+def _download_into(
+    temp_dir: str,
+    url: str,
+    options: EncodeOptions,
+    info: Optional[dict],
+    report: _ProgressForwarder,
+    cancel: CancelToken,
+    profile: ExtractorProfile = DEFAULT_PROFILE,
+) -> DownloadOutcome:
+    import yt_dlp  # นำเข้าในฟังก์ชัน เพื่อลดโอกาส import error ตอนยังไม่ติดตั้ง
+
+    stages: Dict[str, float] = {}
+
+    # แยกขั้น resolve format ออกมาก่อน จะได้เลือกได้ว่าจะ remux/สตรีม หรือโหลดไฟล์
+    with yt_dlp.YoutubeDL(_ydl_opts(temp_dir, options, remux=False, profile=profile)) as ydl:
+        if info is None:
+            started = time.monotonic()
+            info = ydl.extract_info(url, download=False)
+            stages["metadata"] = time.monotonic() - started
+        title = info.get("title", "audio")
+        media_seconds = float(info.get("duration") or 0)
+        # วางแผนก่อนโหลดจริง: คลิปที่ยาวเกินจะถูกปฏิเสธตรงนี้ ไม่เสียเน็ต/CPU เปล่า
+        options, remux, segment_seconds = _plan_encode(info, options)
+
+        audio_path = None
+        if STREAMING_PIPELINE and options.codec != "original" and _can_stream(info, options):
+            base, _ext = os.path.splitext(ydl.prepare_filename(info))
+            audio_path = base + "." + options.codec
+            try:
+                cpu = _stream_transcode(ydl, info, audio_path, options, remux, stages, report, cancel)
+                mode = "stream"
+            except StreamingNotPossible:
+                stages.pop("download", None)
+                try:
+                    os.remove(audio_path)
+                except OSError:
+                    pass
+                audio_path = None
+
+    if audio_path is None:
+        # วิธีเดิม: โหลดไฟล์ต้นทางลงดิสก์ -> FFmpegExtractAudio (ใช้ info ที่ resolve แล้ว ไม่ต้องถามซ้ำ)
+        # หมายเหตุ: เวลา CPU วัดจาก RUSAGE_CHILDREN ถ้ามีหลายงานในโหมด thread พร้อมกันจะเป็นค่าประมาณ
+        cpu_before = _children_cpu_seconds()
+        started = time.monotonic()
+        finished: Dict[str, float] = {}
+        counted: Dict[str, int] = {}
+
+        def on_progress(d: dict) -> None:
+            cancel.check()
+            # หักงบแบนด์วิดท์รวมตามไบต์ที่เพิ่มขึ้น (hook นี้รันใน thread ที่โหลด การรอจึงชะลอการโหลดจริง)
+            done = d.get("downloaded_bytes") or 0
+            name = d.get("filename") or ""
+            BANDWIDTH.consume(done - counted.get(name, 0), cancel.check)
+            counted[name] = max(done, counted.get(name, 0))
+            # status "finished" = โหลดไฟล์ต้นทางเสร็จ ต่อจากนี้คือเวลาของ postprocessor (ffmpeg)
+            if d.get("status") == "finished":
+                finished["at"] = time.monotonic()
+                finished["bytes"] = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+            elif d.get("status") == "downloading":
+                total = d.get("total_bytes") or d.get("total_bytes_estimate")
+                done = d.get("downloaded_bytes") or 0
+                report(Progress(
+                    "download",
+                    fraction=done / total if total else None,
+                    downloaded_bytes=done,
+                    total_bytes=int(total) if total else None,
+                    speed=d.get("speed"),
+                ))
+
+        def on_postprocess(d: dict) -> None:
+            cancel.check()
+            if d.get("status") == "started":
+                report(Progress("transcode"))
+
+        opts = _ydl_opts(temp_dir, options, remux, profile)
+        opts["progress_hooks"] = [on_progress]
+        opts["postprocessor_hooks"] = [on_postprocess]
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.process_ie_result(info, download=True)
+            if options.codec == "original":
+                audio_path = ydl.prepare_filename(info)
+            else:
+                base, _ext = os.path.splitext(ydl.prepare_filename(info))
+                audio_path = base + "." + options.codec
+        cancel.check()
+        cpu = max(0.0, _children_cpu_seconds() - cpu_before)
+        mode = "download"
+        done = time.monotonic()
+        download_done = finished.get("at", done)
+        stages["download"] = download_done - started
+        stages["transcode"] = done - download_done
+        stages["source_bytes"] = finished.get("bytes", 0)
+
+    parts = [audio_path]
+    if segment_seconds:
+        cancel.check()
+        report(Progress("split"))
+        started = time.monotonic()
+        parts = _split_audio(audio_path, segment_seconds)
+        audio_path = parts[0]
+        stages["split"] = time.monotonic() - started
+
+    source_bytes = int(stages.pop("source_bytes", 0))
+    return DownloadOutcome(
+        audio_path, title, options.codec, mode, remux, cpu, media_seconds,
+        bitrate=options.bitrate, parts=parts, stage_seconds=stages, source_bytes=source_bytes,
+    )
+
+
+async def warm_up() -> None:
+    """อุ่นเครื่อง yt_dlp ใน pool ของ metadata และ (ถ้าเป็น pool แบบ process) ในทุก process ของงานโหลด"""
+    loop = asyncio.get_running_loop()
+    jobs = [loop.run_in_executor(get_prefetch_executor(), warm_up_blocking)]
+    executor = get_executor()
+    if isinstance(executor, ProcessPoolExecutor):
+        # process แยกมี import ของตัวเอง (ส่งงานเท่าจำนวน worker ให้กระจายไปทุก process)
+        jobs += [loop.run_in_executor(executor, warm_up_blocking) for _ in range(max(1, DOWNLOAD_POOL_SIZE))]
+    await asyncio.gather(*jobs)
+
+
+async def run_prefetch(url: str, options: EncodeOptions) -> dict:
+    """รัน prefetch_info_blocking ใน pool ของ metadata"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_prefetch_executor(), prefetch_info_blocking, url, options)
+
+
+async def run_expand_playlist(url: str, limit: int) -> List[Tuple[str, str]]:
+    """รัน expand_playlist_blocking ใน pool ของ metadata"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_prefetch_executor(), expand_playlist_blocking, url, limit)
+
+
+async def run_download(
+    url: str,
+    options: EncodeOptions,
+    info: Optional[dict] = None,
+    progress: Optional[ProgressCallback] = None,
+    work_root: Optional[str] = None,
+    on_failure_settled: Optional[Callable[[], None]] = None,
+) -> DownloadOutcome:
+    """รัน download_mp3_blocking ใน pool พร้อม timeout ต่องาน
+
+    progress ถูกเรียกจาก thread ของ pool (ผู้เรียกต้องส่งต่อเข้า event loop เอง)
+    ใช้ได้เฉพาะ pool แบบ thread เพราะ callback ส่งข้าม process ไม่ได้ (โหมด process จะไม่มี progress)
+
+    ถ้า task ที่รออยู่ถูก cancel หรือหมดเวลา จะยกเลิกงานใน thread ด้วย (kill ffmpeg + ลบไฟล์ชั่วคราว)
+    หมายเหตุ: โหมด process ส่ง token ข้าม process ไม่ได้ งานเดิมจะทำต่อจนจบขั้นตอนของมันเอง
+
+    on_failure_settled: ถ้าฟังก์ชันนี้โยน exception จะถูกเรียกบน event loop หลังงานใน pool จบจริงแล้ว
+    (ตอน timeout/cancel งานใน thread ยังเขียนไฟล์อยู่ได้อีกครู่ ผู้เรียกจึงควรคืนพื้นที่ชั่วคราวผ่านตัวนี้)
+    """
+    loop = asyncio.get_running_loop()
+    cfut: Optional[Future] = None
+    cancel: Optional[CancelToken] = None
+    try:
+        executor = get_executor()
+        if isinstance(executor, ThreadPoolExecutor):
+            cancel = CancelToken()
+        else:
+            progress = None
+        cfut = executor.submit(download_mp3_blocking, url, options, info, progress, cancel, work_root)
+        timeout = DOWNLOAD_JOB_TIMEOUT if DOWNLOAD_JOB_TIMEOUT > 0 else None
+        return await asyncio.wait_for(asyncio.wrap_future(cfut, loop=loop), timeout=timeout)
+    except BaseException as e:
+        if cancel is not None:
+            cancel.cancel()
+        if on_failure_settled is not None:
+            _call_when_settled(loop, cfut, on_failure_settled)
+        if isinstance(e, asyncio.TimeoutError):
+            raise TimeoutError(f"ดาวน์โหลดเกินเวลา {DOWNLOAD_JOB_TIMEOUT} วินาที") from None
+        raise
+
+
+def _call_when_settled(
+    loop: asyncio.AbstractEventLoop,
+    cfut: Optional[Future],
+    callback: Callable[[], None],
+) -> None:
+    """เรียก callback บน event loop เมื่อ cfut จบจริง (ถ้าไม่มีงานหรือจบแล้วเรียกทันที)"""
+    if cfut is None or cfut.done():
+        callback()
+        return
+
+    def _done(_f: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # loop ปิดไปแล้ว (กำลัง shutdown) เรียกตรงจาก thread นี้แทน
+            callback()
+
+    cfut.add_done_callback(_done)
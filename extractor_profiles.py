@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""ชุดตัวตนของ extractor (player client + header + ไฟล์คุกกี้) พร้อมติดตามสุขภาพและตัดวงจร (circuit breaker)
+
+เวลา YouTube จำกัดความเร็วหรือถามว่าเป็นบอทกับตัวตนหนึ่ง งานที่เหลือในคิวจะไม่พังตามกันทั้งหมด:
+- งานใหม่ถูกส่งไปที่ profile ที่สุขภาพดีที่สุด (อัตราสำเร็จ x ความเร็วโหลด หารด้วยงานที่กำลังใช้อยู่)
+- profile ที่ล้มเหลวติดกันหลายครั้ง หรือโหลดช้าผิดปกติ (throughput ตก) จะถูกพักตามเวลา cool-down
+  พักครั้งถัด ๆ ไปนานขึ้นเป็นเท่าตัว (สูงสุด 8 เท่า) หมดเวลาพักแล้วให้ลองได้ทีละงาน (half-open)
+  ถ้างานทดลองสำเร็จจึงกลับมาใช้ตามปกติ
+- ถ้าทุก profile ถูกพักหมด จะใช้ตัวที่ใกล้หมดเวลาพักที่สุด (งานไม่ถูกปฏิเสธเพราะ profile)
+
+ไฟล์ตั้งค่า (JSON) เป็นรายการ profile เช่น
+    [{"name": "android", "player_client": ["android"], "user_agent": "...", "cookie_file": "cookies.txt"},
+     {"name": "web-b", "player_client": ["web"], "cookie_file": "cookies_b.txt", "headers": {"Accept-Language": "th"}}]
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+# สถานะของวงจร
+CLOSED = "closed"  # ใช้ได้ปกติ
+OPEN = "open"  # ถูกพัก
+HALF_OPEN = "half_open"  # หมดเวลาพักแล้ว กำลังมีงานทดลอง 1 งาน
+
+# น้ำหนักของค่าใหม่ในค่าเฉลี่ย throughput
+_THROUGHPUT_ALPHA = 0.3
+
+# ข้อความ error ที่บ่งว่าตัวตนนี้ถูกจำกัด/ถูกสงสัยว่าเป็นบอท (ไม่ใช่ปัญหาของคลิปเอง)
+# "requested format is not available" ไม่นับ: ส่วนใหญ่เป็นเพราะคลิปนั้นไม่มีรูปแบบที่ขอ ไม่ใช่ตัวตนถูกบล็อก
+_IDENTITY_ERROR_RE = re.compile(
+    r"sign in to confirm|not a bot|http error 403|http error 429|too many requests|rate.?limit"
+    r"|throttl|captcha|unable to download api page",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class ExtractorProfile:
+    name: str
+    player_client: Sequence[str] = ("android",)
+    user_agent: Optional[str] = None
+    cookie_file: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict, hash=False, compare=False)
+
+    def apply(self, ydl_opts: dict) -> dict:
+        """ใส่ตัวตนนี้ลงในตัวเลือกของ yt-dlp (แก้ dict เดิมแล้วคืนกลับ)"""
+        ydl_opts["extractor_args"] = {"youtube": {"player_client": list(self.player_client)}}
+        headers = dict(self.headers)
+        if self.user_agent:
+            headers["User-Agent"] = self.user_agent
+        if headers:
+            ydl_opts["http_headers"] = headers
+        else:
+            ydl_opts.pop("http_headers", None)
+        if self.cookie_file:
+            ydl_opts["cookiefile"] = self.cookie_file
+        else:
+            ydl_opts.pop("cookiefile", None)
+        return ydl_opts
+
+
+# ตัวตนเดิมของบอท (ใช้เมื่อไม่มีไฟล์ตั้งค่า)
+DEFAULT_PROFILE = ExtractorProfile(
+    name="android",
+    player_client=("android",),
+    # ปลอม User-Agent ให้เหมือนแอป YouTube บน Android
+    user_agent="com.google.android.youtube/18.14.37 (Linux; U; Android 11)",
+    # ใช้คุกกี้จากไฟล์ cookies.txt เพื่อผ่าน “Sign in to confirm you’re not a bot”
+    cookie_file="cookies.txt",
+)
+
+
+def load_profiles(path: str) -> List[ExtractorProfile]:
+    """อ่านรายการ profile จากไฟล์ JSON ไม่มีไฟล์ = ใช้ DEFAULT_PROFILE ตัวเดียว"""
+    if not path or not os.path.exists(path):
+        return [DEFAULT_PROFILE]
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    profiles = []
+    for index, item in enumerate(raw):
+        profiles.append(ExtractorProfile(
+            name=str(item.get("name") or f"profile-{index}"),
+            player_client=tuple(item.get("player_client") or DEFAULT_PROFILE.player_client),
+            user_agent=item.get("user_agent"),
+            cookie_file=item.get("cookie_file"),
+            headers=dict(item.get("headers") or {}),
+        ))
+    if len({p.name for p in profiles}) != len(profiles):
+        raise ValueError("ชื่อ extractor profile ต้องไม่ซ้ำกัน")
+    return profiles or [DEFAULT_PROFILE]
+
+
+def is_identity_failure(error: BaseException) -> bool:
+    """error นี้เป็นเพราะตัวตนถูกจำกัด/บล็อก (ควรนับเป็นความล้มเหลวของ profile) หรือไม่"""
+    return bool(_IDENTITY_ERROR_RE.search(str(error)))
+
+
+@dataclass
+class ProfileHealth:
+    profile: ExtractorProfile
+    successes: int = 0
+    failures: int = 0
+    slow_jobs: int = 0
+    consecutive_failures: int = 0
+    throughput: Optional[float] = None  # ไบต์/วินาที (ค่าเฉลี่ยเคลื่อนที่)
+    in_flight: int = 0
+    state: str = CLOSED
+    open_until: float = 0.0
+    trips: int = 0
+    consecutive_trips: int = 0
+    last_error: str = ""
+
+    def success_rate(self) -> float:
+        # ปรับด้วย prior (1 สำเร็จ / 2 ครั้ง) ไม่ให้ profile ที่เพิ่งลอง 1 ครั้งได้คะแนนสุดโต่ง
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+
+class ProfilePool:
+    """เลือก profile ให้แต่ละงาน + รับผลกลับมาอัปเดตสุขภาพ (thread-safe เพราะงานโหลดรันใน thread pool)"""
+
+    def __init__(
+        self,
+        profiles: Sequence[ExtractorProfile],
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 600.0,
+        min_throughput: float = 0.0,
+        min_sample_bytes: int = 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not profiles:
+            raise ValueError("ต้องมี extractor profile อย่างน้อย 1 ตัว")
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.min_throughput = min_throughput  # ต่ำกว่านี้ = throughput ตก (นับเป็นความล้มเหลว) 0 = ไม่ตรวจ
+        self.min_sample_bytes = min_sample_bytes  # งานเล็กกว่านี้ไม่ใช้วัดความเร็ว
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.health: Dict[str, ProfileHealth] = {p.name: ProfileHealth(p) for p in profiles}
+
+    def _score(self, h: ProfileHealth, best_throughput: float) -> float:
+        speed = 1.0
+        if h.throughput is not None and best_throughput > 0:
+            speed = 0.25 + 0.75 * h.throughput / best_throughput
+        return h.success_rate() * speed / (1 + h.in_flight)
+
+    def acquire(self, preferred: Optional[str] = None) -> ExtractorProfile:
+        """จอง profile ให้งาน 1 งาน (ต้องเรียก report_* ตามมาเสมอ)
+
+        preferred = profile ที่งานนี้ใช้อ่าน metadata ไว้แล้ว (ใช้ต่อถ้ายังไม่ถูกพัก)
+        """
+        with self._lock:
+            now = self._clock()
+            for h in self.health.values():
+                if h.state == OPEN and now >= h.open_until:
+                    h.state = HALF_OPEN
+            # half-open: ให้ทดลองได้ทีละงาน
+            usable = [
+                h for h in self.health.values()
+                if h.state == CLOSED or (h.state == HALF_OPEN and h.in_flight == 0)
+            ]
+            chosen: Optional[ProfileHealth] = None
+            if preferred is not None:
+                chosen = next((h for h in usable if h.profile.name == preferred), None)
+            if chosen is None and usable:
+                best = max((h.throughput or 0.0) for h in usable)
+                chosen = max(usable, key=lambda h: self._score(h, best))
+            if chosen is None:
+                # ถูกพักหมดทุกตัว -> ใช้ตัวที่ใกล้หมดเวลาพักที่สุด
+                chosen = min(self.health.values(), key=lambda h: h.open_until)
+            chosen.in_flight += 1
+            return chosen.profile
+
+    def _trip(self, h: ProfileHealth, now: float) -> None:
+        h.consecutive_trips += 1
+        h.trips += 1
+        h.state = OPEN
+        h.open_until = now + self.cooldown_seconds * min(8, 2 ** (h.consecutive_trips - 1))
+        h.consecutive_failures = 0
+
+    def report_success(
+        self, profile: ExtractorProfile, nbytes: int = 0, seconds: float = 0.0, throttled: bool = False
+    ) -> None:
+        """งานสำเร็จ (nbytes/seconds = ขนาดและเวลาที่โหลดไฟล์ต้นทาง ถ้ามี ใช้วัด throughput)
+
+        throttled = ตัวจำกัดแบนด์วิดท์ของเราเองหน่วงงานนี้ -> ไม่ใช้วัด throughput (ไม่นับว่าช้าเพราะตัวตน)
+        """
+        with self._lock:
+            h = self.health[profile.name]
+            h.in_flight = max(0, h.in_flight - 1)
+            now = self._clock()
+            if nbytes >= self.min_sample_bytes and seconds > 0 and not throttled:
+                rate = nbytes / seconds
+                h.throughput = rate if h.throughput is None else h.throughput + _THROUGHPUT_ALPHA * (rate - h.throughput)
+                if self.min_throughput and rate < self.min_throughput:
+                    # งานผ่านแต่ช้าผิดปกติ = สัญญาณว่าตัวตนนี้ถูกจำกัดความเร็ว
+                    h.slow_jobs += 1
+                    self._strike(h, now, f"throughput ตกเหลือ {rate / 1024:.0f} KB/s")
+                    return
+            h.successes += 1
+            h.consecutive_failures = 0
+            if h.state != CLOSED:
+                h.state = CLOSED
+                h.consecutive_trips = 0
+
+    def _strike(self, h: ProfileHealth, now: float, reason: str) -> None:
+        h.failures += 1
+        h.consecutive_failures += 1
+        h.last_error = reason[:200]
+        # งานทดลองตอน half-open ล้มเหลว = พักต่อทันที
+        if h.state == HALF_OPEN or h.consecutive_failures >= self.failure_threshold:
+            self._trip(h, now)
+
+    def report_failure(self, profile: ExtractorProfile, error: BaseException) -> None:
+        """งานล้มเหลว: นับเป็นความผิดของ profile เฉพาะ error ที่บ่งว่าตัวตนถูกจำกัด/บล็อก"""
+        with self._lock:
+            h = self.health[profile.name]
+            h.in_flight = max(0, h.in_flight - 1)
+            # error อื่น (เช่นคลิปถูกลบ) ไม่บอกอะไรเรื่องตัวตน -> ไม่นับ งาน half-open ถัดไปได้ลองใหม่
+            if is_identity_failure(error):
+                self._strike(h, self._clock(), str(error))
+
+    def release(self, profile: ExtractorProfile) -> None:
+        """คืน profile โดยไม่นับผล (งานถูกยกเลิก / error ที่ไม่เกี่ยวกับตัวตน)"""
+        with self._lock:
+            h = self.health[profile.name]
+            h.in_flight = max(0, h.in_flight - 1)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "name": h.profile.name,
+                    "state": h.state,
+                    "success_rate": round(h.success_rate(), 3),
+                    "successes": h.successes,
+                    "failures": h.failures,
+                    "slow_jobs": h.slow_jobs,
+                    "throughput": h.throughput,
+                    "in_flight": h.in_flight,
+                    "trips": h.trips,
+                    "cooldown_left": max(0.0, h.open_until - now) if h.state == OPEN else 0.0,
+                    "last_error": h.last_error,
+                }
+                for h in self.health.values()
+            ]
@@ -5,7 +5,7 @@ from typing import Callable, Awaitable, Optional
 
 import discord
 
-FormCallback = Callable[[discord.Interaction, str, str], Awaitable[None]]
+FormCallback = Callable[[discord.Interaction, str, str, str], Awaitable[None]]
 QueueStatusCallback = Callable[[discord.Interaction], Awaitable[str]]
 
 
@@ -23,13 +23,13 @@ class YTMP3Modal(discord.ui.Modal):
         super().__init__(title="โหลด MP3", timeout=None)
         self._on_submit_cb = on_submit
 
-        # ช่องกรอก URL (label สั้นแน่นอน < 45 ตัว)
+        # ช่องกรอก URL (label สั้นแน่นอน < 45 ตัว) ใส่หลายบรรทัด/ลิงก์เพลย์ลิสต์ = โหมดชุดงาน
         self.url_input: discord.ui.TextInput = discord.ui.TextInput(
-            label="URL YouTube",
-            placeholder="เช่น https://youtu.be/xxxxxxxxxxx",
-            style=discord.TextStyle.short,
+            label="URL YouTube (หลายลิงก์/เพลย์ลิสต์ได้)",
+            placeholder="เช่น https://youtu.be/xxxxxxxxxxx (หลายลิงก์ให้ขึ้นบรรทัดใหม่ ได้ไฟล์ zip)",
+            style=discord.TextStyle.paragraph,
             required=True,
-            max_length=400,
+            max_length=4000,
         )
 
         # ช่องกรอกชื่อไฟล์ (label สั้นแน่นอน < 45 ตัว)
@@ -41,14 +41,25 @@ class YTMP3Modal(discord.ui.Modal):
             max_length=100,
         )
 
+        # ช่องเลือกรูปแบบไฟล์ (ไม่กรอก = mp3)
+        self.format_input: discord.ui.TextInput = discord.ui.TextInput(
+            label="รูปแบบไฟล์ (mp3/m4a/opus/original)",
+            placeholder="เว้นว่างไว้ = mp3, original = ไฟล์เสียงต้นฉบับไม่แปลง",
+            style=discord.TextStyle.short,
+            required=False,
+            max_length=10,
+        )
+
         self.add_item(self.url_input)
         self.add_item(self.file_name_input)
+        self.add_item(self.format_input)
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
         await self._on_submit_cb(
             interaction,
             str(self.url_input.value),
             str(self.file_name_input.value),
+            str(self.format_input.value),
         )
 
 
@@ -87,3 +98,31 @@ class YTMP3View(discord.ui.View):
             return
         text = await self._on_check_queue(interaction)
         await interaction.response.send_message(text, ephemeral=True)
+
+
+SplitAcceptCallback = Callable[[discord.Interaction], Awaitable[None]]
+
+
+class SplitOfferView(discord.ui.View):
+    """ปุ่มเสนอให้แบ่งไฟล์ (ใช้เมื่อคลิปยาวเกินกว่าจะใส่ไฟล์เดียวได้)"""
+
+    def __init__(self, parts: int, on_accept: SplitAcceptCallback):
+        super().__init__(timeout=15 * 60)
+        self._on_accept = on_accept
+        self.accept_button.label = f"แบ่งเป็น {parts} ไฟล์"
+
+    @discord.ui.button(
+        label="แบ่งเป็นหลายไฟล์",
+        style=discord.ButtonStyle.primary,
+        emoji="✂️",
+    )
+    async def accept_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button,
+    ):
+        """กดแล้วส่งงานแบบแบ่งไฟล์เข้าคิว (กดได้ครั้งเดียว)"""
+        button.disabled = True
+        self.stop()
+        await interaction.message.edit(view=self)
+        await self._on_accept(interaction)
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""โหลดไฟล์ต้นทางทาง HTTP แบบแบ่งช่วง (Range) หลายช่วงพร้อมกัน + ใช้ connection ซ้ำข้ามงาน + จำกัดแบนด์วิดท์รวม
+
+- ConnectionPool: เก็บ connection แบบ keep-alive ต่อ host ไว้ใช้ซ้ำ (งานถัดไปไม่ต้อง handshake TCP/TLS ใหม่)
+- TokenBucket: งบไบต์ต่อวินาทีที่ทุกงานใน process ใช้ร่วมกัน หักทีละก้อนเล็ก ๆ ตามลำดับที่ขอ
+  งานใหญ่จึงกินแบนด์วิดท์ได้แค่ตามสัดส่วนจำนวนก้อนที่ขอพร้อมกัน ไม่แย่งจนงานอื่นหยุด
+- iter_ranges: โหลดช่วงละ chunk_size ไบต์ พร้อมกันไม่เกิน concurrency ช่วง แล้วส่งออกตามลำดับ
+  (ต่อท่อเข้า ffmpeg ได้เลย) ถ้าเซิร์ฟเวอร์ไม่รองรับ Range จะอ่านต่อเนื่องจากคำขอแรก
+"""
+
+import http.client
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+# ขนาดก้อนที่อ่านจาก socket / หักจาก TokenBucket แต่ละครั้ง
+READ_SIZE = 64 * 1024
+
+# จำนวน redirect สูงสุดที่ตามให้
+_MAX_REDIRECTS = 5
+
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class FetchError(Exception):
+    """โหลดผ่านเส้นทางนี้ไม่ได้ (ผู้เรียกควรถอยไปใช้วิธีเดิม)"""
+
+
+class TokenBucket:
+    """จำกัดอัตราไบต์ต่อวินาทีร่วมกันทุก thread (rate = 0 คือไม่จำกัด)
+
+    consume จองไบต์ทันทีแม้ยอดจะติดลบ แล้วนอนรอนอก lock ตามยอดที่ติดค้าง
+    ผู้ขอก่อนจึงได้ก่อนเสมอ (ไม่มีใครแซงคิวได้ด้วยการขอก้อนใหญ่)
+    """
+
+    def __init__(self, rate_bytes_per_sec: float = 0, burst_bytes: Optional[float] = None):
+        self.rate = max(0.0, float(rate_bytes_per_sec))
+        self.burst = float(burst_bytes) if burst_bytes else max(self.rate, READ_SIZE)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.consumed_bytes = 0
+        self.throttled_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def consume(self, nbytes: int, check: Optional[Callable[[], None]] = None) -> None:
+        if nbytes <= 0:
+            return
+        with self._lock:
+            self.consumed_bytes += nbytes
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.throttled_seconds += wait
+        # นอนเป็นช่วงสั้น ๆ เพื่อให้ยกเลิกงานได้ระหว่างรอ
+        deadline = time.monotonic() + wait
+        while True:
+            if check is not None:
+                check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.25))
+
+
+class ConnectionPool:
+    """connection HTTP/HTTPS แบบ keep-alive ต่อ (scheme, host, port) ใช้ร่วมกันทุกงานใน process"""
+
+    def __init__(self, max_idle_per_host: int = 8, timeout: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], Deque[http.client.HTTPConnection]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        with self._lock:
+            self.opened += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout)
+
+    def _get(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        """คืน (connection, เป็นของเดิมใน pool หรือไม่)"""
+        with self._lock:
+            idle = self._idle[key]
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _put(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, url: str, headers: Dict[str, str]) -> "PooledResponse":
+        """ส่ง GET (ตาม redirect ให้) คืน response ที่ต้องอ่านจนจบหรือ close เพื่อคืน connection"""
+        for _ in range(_MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme not in ("http", "https"):
+                raise FetchError(f"ไม่รองรับ URL แบบ {scheme}")
+            key = (scheme, parts.hostname or "", parts.port or (443 if scheme == "https" else 80))
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            conn, reused = self._get(key)
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+                # connection ที่ค้างใน pool อาจถูกฝั่งเซิร์ฟเวอร์ปิดไปแล้ว -> ลองใหม่ด้วย connection ใหม่ครั้งเดียว
+                conn = self._connect(key)
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                resp.read()
+                self._put(key, conn)
+                url = urljoin(url, resp.getheader("Location"))
+                continue
+            return PooledResponse(self, key, conn, resp)
+        raise FetchError("redirect มากเกินไป")
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            idle = sum(len(v) for v in self._idle.values())
+        return {"opened": self.opened, "reused": self.reused, "idle": idle}
+
+
+class PooledResponse:
+    def __init__(self, pool: ConnectionPool, key, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.resp = resp
+        self.status = resp.status
+        self._closed = False
+
+    def getheader(self, name: str) -> Optional[str]:
+        return self.resp.getheader(name)
+
+    def read(self, n: int) -> bytes:
+        return self.resp.read(n)
+
+    def close(self) -> None:
+        """คืน connection เข้า pool ถ้าอ่าน body ครบแล้ว ไม่ครบ = ปิดทิ้ง"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.resp.isclosed() and not self.resp.will_close:
+            self._pool._put(self._key, self._conn)
+        else:
+            self.resp.close()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_chunk(resp: PooledResponse, n: int) -> bytes:
+    """อ่านจาก socket แปลง error ของเครือข่ายเป็น FetchError (ผู้เรียกถอยไปใช้วิธีเดิมได้ทางเดียว)"""
+    try:
+        return resp.read(n)
+    except (OSError, http.client.HTTPException) as e:
+        raise FetchError(f"อ่านข้อมูลไม่สำเร็จ: {e}") from e
+
+
+def _read_body(
+    resp: PooledResponse,
+    expected: int,
+    bucket: TokenBucket,
+    check: Callable[[], None],
+) -> bytes:
+    buf = bytearray()
+    while len(buf) < expected:
+        check()
+        chunk = _read_chunk(resp, min(READ_SIZE, expected - len(buf)))
+        if not chunk:
+            raise FetchError("การเชื่อมต่อปิดก่อนได้ข้อมูลครบ")
+        bucket.consume(len(chunk), check)
+        buf += chunk
+    return bytes(buf)
+
+
+def _fetch_range(
+    pool: ConnectionPool,
+    url: str,
+    headers: Dict[str, str],
+    start: int,
+    end: int,
+    bucket: TokenBucket,
+    check: Callable[[], None],
+    retries: int = 2,
+) -> bytes:
+    """โหลดช่วง [start, end] (รวมปลาย) ลองใหม่ได้ retries ครั้งถ้าเน็ตสะดุด ครบแล้วยังไม่ได้โยน FetchError"""
+    for attempt in range(retries + 1):
+        try:
+            with pool.request(url, dict(headers, Range=f"bytes={start}-{end}")) as resp:
+                if resp.status != 206:
+                    raise FetchError(f"เซิร์ฟเวอร์ตอบ {resp.status} กับคำขอช่วง")
+                return _read_body(resp, end - start + 1, bucket, check)
+        except FetchError:
+            if attempt == retries:
+                raise
+        except (OSError, http.client.HTTPException) as e:
+            if attempt == retries:
+                raise FetchError(f"โหลดช่วง {start}-{end} ไม่สำเร็จ: {e}") from e
+    raise AssertionError("unreachable")
+
+
+def iter_ranges(
+    url: str,
+    headers: Dict[str, str],
+    executor: ThreadPoolExecutor,
+    pool: ConnectionPool,
+    bucket: TokenBucket,
+    chunk_size: int,
+    concurrency: int,
+    check: Callable[[], None] = lambda: None,
+    max_bytes: int = 0,
+) -> Iterator[bytes]:
+    """โหลด url เป็นช่วง ๆ ละ chunk_size ไบต์ พร้อมกันไม่เกิน concurrency ช่วง ส่งออกตามลำดับไฟล์ (blocking)
+
+    ใช้หน่วยความจำไม่เกินราว chunk_size * concurrency ต่องาน
+    เป็น generator: คำขอแรกถูกส่งตอนขอก้อนแรก (next ครั้งแรก) ถ้าใช้ไม่ได้จะโยน FetchError ตอนนั้น
+    (ผู้เรียกถอยไปใช้วิธีเดิมได้ เพราะยังไม่ได้ส่งข้อมูลออกไป) error ของเครือข่ายระหว่างทางก็เป็น FetchError เสมอ
+    """
+    chunk_size = max(READ_SIZE, chunk_size)
+    try:
+        first = pool.request(url, dict(headers, Range=f"bytes=0-{chunk_size - 1}"))
+    except (OSError, http.client.HTTPException) as e:
+        raise FetchError(f"เปิดการเชื่อมต่อไม่ได้: {e}") from e
+    total = None
+    if first.status == 206:
+        match = _CONTENT_RANGE_RE.match(first.getheader("Content-Range") or "")
+        if match and match.group(3) != "*":
+            total = int(match.group(3))
+    elif first.status != 200:
+        first.close()
+        raise FetchError(f"เซิร์ฟเวอร์ตอบ {first.status}")
+    if max_bytes and total and total > max_bytes:
+        first.close()
+        raise ValueError(f"ไฟล์ต้นทางใหญ่เกิน {max_bytes // (1024 * 1024)} MB")
+
+    if total is None:
+        # ไม่รองรับ Range (หรือไม่รู้ขนาด) -> อ่านต่อเนื่องจากคำขอแรกจนจบ
+        with first:
+            while True:
+                check()
+                chunk = _read_chunk(first, READ_SIZE)
+                if not chunk:
+                    return
+                bucket.consume(len(chunk), check)
+                yield chunk
+
+    with first:
+        head = _read_body(first, min(chunk_size, total), bucket, check)
+    yield head
+
+    # ช่วงที่เหลือ: ส่งคำขอล่วงหน้าไม่เกิน concurrency ช่วง แล้วรอผลตามลำดับ
+    pending: Deque[Future] = deque()
+    next_start = len(head)
+    try:
+        while next_start < total or pending:
+            while next_start < total and len(pending) < max(1, concurrency):
+                end = min(next_start + chunk_size, total) - 1
+                pending.append(executor.submit(_fetch_range, pool, url, headers, next_start, end, bucket, check))
+                next_start = end + 1
+            data = pending.popleft().result()
+            check()
+            yield data
+    finally:
+        for fut in pending:
+            fut.cancel()
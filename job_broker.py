@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+"""คิวงานข้าม process/เครื่อง ระหว่างบอท (frontend) กับ worker ที่รัน yt-dlp/ffmpeg (worker.py)
+
+บอทส่งงาน (โหลด / อ่าน metadata / แตกเพลย์ลิสต์) เข้า broker แล้วรอผล
+worker ดึงงานไปทำโดยถือ lease ไว้ และต่ออายุด้วย heartbeat ระหว่างทำ
+ถ้า worker ล่มจน lease หมดอายุ งานจะกลับเข้าคิวให้ worker อื่นทำต่อ (จำกัดจำนวนครั้ง)
+ไฟล์ผลลัพธ์ถูกเก็บใน broker เป็น blob จึงไม่ต้องมีดิสก์ร่วมกันระหว่างเครื่อง
+
+broker มีสองแบบ เลือกจาก URL (open_broker):
+- sqlite:///path/to/broker.sqlite3  ใช้ได้หลาย process ในเครื่องเดียว (WAL)
+- redis://host:6379/0               ข้ามเครื่อง (ต้องติดตั้งแพ็กเกจ redis เพิ่ม)
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from downloader import (
+    DownloadOutcome,
+    EncodeOptions,
+    JobCancelled,
+    Progress,
+    ProgressCallback,
+    TooLongForSingleFile,
+)
+
+# สถานะของงานใน broker
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# งานที่จบแล้วแต่ไม่มีใครมารับผล (เช่นบอทรีสตาร์ท) เก็บไว้นานเท่านี้แล้วลบทิ้ง
+RESULT_TTL_SECONDS = 3600
+
+Task = Tuple[str, Dict[str, Any]]
+
+
+class Broker(ABC):
+    """ส่วนต่อประสานของ broker (ทุกเมธอดเป็น blocking ผู้เรียกฝั่ง asyncio ต้องรันใน thread)"""
+
+    max_attempts = 2
+
+    @abstractmethod
+    def submit(self, task_id: str, payload: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Task]:
+        """หยิบงานที่รอนานที่สุด (หรืองานที่ lease หมดอายุ) คืน None ถ้าไม่มีงาน"""
+        ...
+
+    @abstractmethod
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float, progress: Optional[dict]) -> bool:
+        """ต่ออายุ lease + บันทึกความคืบหน้า คืน False ถ้างานถูกยกเลิกหรือถูก worker อื่นเอาไปแล้ว"""
+        ...
+
+    @abstractmethod
+    def complete(self, task_id: str, worker_id: str, result: Dict[str, Any], blobs: List[bytes]) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, task_id: str, worker_id: str, error: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def poll(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """คืน {"status", "progress", "result", "error"} หรือ None ถ้าไม่พบงาน"""
+        ...
+
+    @abstractmethod
+    def fetch_blob(self, task_id: str, index: int) -> bytes:
+        ...
+
+    @abstractmethod
+    def cancel(self, task_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge(self, task_id: str) -> None:
+        """ลบงานและ blob ของงาน (ฝั่งบอทเรียกหลังรับผลแล้ว)"""
+        ...
+
+    def purge_stale(self) -> int:
+        """ลบงานที่จบไปนานแล้วแต่ไม่มีใครมารับผล"""
+        return 0
+
+    @abstractmethod
+    def report_worker(self, worker_id: str, info: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def workers(self) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def queued_count(self) -> int:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+# ----------------- SQLite -----------------
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL,
+    worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0,
+    progress TEXT, result TEXT, error TEXT,
+    created_at REAL NOT NULL, updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created_at);
+CREATE TABLE IF NOT EXISTS blobs (
+    task_id TEXT NOT NULL, idx INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, info TEXT NOT NULL, seen_at REAL NOT NULL);
+"""
+
+
+class SqliteBroker(Broker):
+    def __init__(self, path: str):
+        self.path = path
+        # autocommit + BEGIN IMMEDIATE เอง เพื่อให้การหยิบงานเป็น atomic ข้าม process
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _write(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def submit(self, task_id, payload):
+        now = time.time()
+        self._write(lambda c: c.execute(
+            "INSERT INTO tasks (task_id, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (task_id, json.dumps(payload), QUEUED, now, now),
+        ))
+
+    def claim(self, worker_id, lease_seconds):
+        def take(c: sqlite3.Connection) -> Optional[Task]:
+            now = time.time()
+            while True:
+                row = c.execute(
+                    "SELECT task_id, payload, attempts FROM tasks "
+                    "WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                task_id, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    error = {"kind": "runtime", "message": "worker หยุดทำงานกลางคันซ้ำหลายครั้ง"}
+                    c.execute(
+                        "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE task_id = ?",
+                        (FAILED, json.dumps(error), now, task_id),
+                    )
+                    continue
+                c.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE task_id = ?",
+                    (RUNNING, worker_id, now + lease_seconds, now, task_id),
+                )
+                return task_id, json.loads(payload)
+
+        return self._write(take)
+
+    def heartbeat(self, task_id, worker_id, lease_seconds, progress):
+        now = time.time()
+        cur = self._write(lambda c: c.execute(
+            "UPDATE tasks SET lease_until = ?, progress = ?, updated_at = ? "
+            "WHERE task_id = ? AND status = ? AND worker = ?",
+            (now + lease_seconds, json.dumps(progress) if progress else None, now, task_id, RUNNING, worker_id),
+        ))
+        return cur.rowcount == 1
+
+    def complete(self, task_id, worker_id, result, blobs):
+        def done(c: sqlite3.Connection):
+            owned = c.execute(
+                "UPDATE tasks SET status = ?, result = ?, updated_at = ? WHERE task_id = ? AND status = ? AND worker = ?",
+                (DONE, json.dumps(result), time.time(), task_id, RUNNING, worker_id),
+            ).rowcount
+            if owned:
+                c.executemany(
+                    "INSERT OR REPLACE INTO blobs (task_id, idx, data) VALUES (?, ?, ?)",
+                    [(task_id, i, sqlite3.Binary(data)) for i, data in enumerate(blobs)],
+                )
+
+        self._write(done)
+
+    def fail(self, task_id, worker_id, error):
+        self._write(lambda c: c.execute(
+            "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE task_id = ? AND status = ? AND worker = ?",
+            (FAILED, json.dumps(error), time.time(), task_id, RUNNING, worker_id),
+        ))
+
+    def poll(self, task_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, progress, result, error FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, progress, result, error = row
+        return {
+            "status": status,
+            "progress": json.loads(progress) if progress else None,
+            "result": json.loads(result) if result else None,
+            "error": json.loads(error) if error else None,
+        }
+
+    def fetch_blob(self, task_id, index):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE task_id = ? AND idx = ?", (task_id, index)
+            ).fetchone()
+        if row is None:
+            raise RuntimeError("ไม่พบไฟล์ผลลัพธ์ของงานใน broker")
+        return bytes(row[0])
+
+    def cancel(self, task_id):
+        self._write(lambda c: c.execute(
+            "UPDATE tasks SET status = ?, updated_at = ? WHERE task_id = ? AND status IN (?, ?)",
+            (CANCELLED, time.time(), task_id, QUEUED, RUNNING),
+        ))
+
+    def purge(self, task_id):
+        def delete(c: sqlite3.Connection):
+            c.execute("DELETE FROM blobs WHERE task_id = ?", (task_id,))
+            c.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+        self._write(delete)
+
+    def purge_stale(self):
+        cutoff = time.time() - RESULT_TTL_SECONDS
+
+        def delete(c: sqlite3.Connection) -> int:
+            c.execute(
+                "DELETE FROM blobs WHERE task_id IN "
+                "(SELECT task_id FROM tasks WHERE status IN (?, ?, ?) AND updated_at < ?)",
+                (DONE, FAILED, CANCELLED, cutoff),
+            )
+            return c.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?, ?) AND updated_at < ?",
+                (DONE, FAILED, CANCELLED, cutoff),
+            ).rowcount
+
+        return self._write(delete)
+
+    def report_worker(self, worker_id, info):
+        self._write(lambda c: c.execute(
+            "INSERT OR REPLACE INTO workers (worker_id, info, seen_at) VALUES (?, ?, ?)",
+            (worker_id, json.dumps(info), time.time()),
+        ))
+
+    def workers(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT worker_id, info, seen_at FROM workers").fetchall()
+        return {worker_id: dict(json.loads(info), seen_at=seen_at) for worker_id, info, seen_at in rows}
+
+    def queued_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------- Redis (หรือเซิร์ฟเวอร์ที่ใช้โปรโตคอลเดียวกัน) -----------------
+
+
+# หยิบงานจากคิว + ตั้งสถานะ running + จอง lease ในขั้นเดียว (atomic)
+# ถ้า worker ตายระหว่างนั้น งานจะไม่ค้างแบบไม่อยู่ทั้งในคิวและใน running
+# KEYS: คิว, running  ARGV: prefix ของ key งาน, worker_id, lease_until, max_attempts, error (json), ttl,
+#       QUEUED, RUNNING, FAILED
+_REDIS_CLAIM_LUA = """
+while true do
+  local task_id = redis.call('LPOP', KEYS[1])
+  if not task_id then
+    return false
+  end
+  local key = ARGV[1] .. task_id
+  local fields = redis.call('HMGET', key, 'status', 'payload')
+  if fields[1] == ARGV[7] and fields[2] then
+    local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+    if attempts > tonumber(ARGV[4]) then
+      redis.call('HSET', key, 'status', ARGV[9], 'error', ARGV[5])
+      redis.call('EXPIRE', key, ARGV[6])
+    else
+      redis.call('HSET', key, 'status', ARGV[8], 'worker', ARGV[2])
+      redis.call('ZADD', KEYS[2], ARGV[3], task_id)
+      return {task_id, fields[2]}
+    end
+  end
+end
+"""
+
+# คืนงานที่ lease หมดอายุเข้าคิว (atomic เหมือนกัน) KEYS: คิว, running  ARGV: prefix, now, QUEUED, RUNNING
+_REDIS_REQUEUE_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+for _, task_id in ipairs(expired) do
+  redis.call('ZREM', KEYS[2], task_id)
+  local key = ARGV[1] .. task_id
+  if redis.call('HGET', key, 'status') == ARGV[4] then
+    redis.call('HSET', key, 'status', ARGV[3])
+    redis.call('LPUSH', KEYS[1], task_id)
+  end
+end
+return #expired
+"""
+
+
+class RedisBroker(Broker):
+    """เก็บงานเป็น hash ต่องาน + list คิว + sorted set ของ lease ที่กำลังทำ
+    การหยิบงานและคืนงานที่ lease หมดอายุทำใน Lua script (atomic ฝั่ง redis)"""
+
+    def __init__(self, url: str, prefix: str = "ytmp3"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("ใช้ broker แบบ redis ต้องติดตั้งแพ็กเกจ redis ก่อน (pip install redis)") from None
+        self._r = redis.Redis.from_url(url)
+        self._p = prefix
+        self._claim_script = self._r.register_script(_REDIS_CLAIM_LUA)
+        self._requeue_script = self._r.register_script(_REDIS_REQUEUE_LUA)
+
+    def _task(self, task_id: str) -> str:
+        return f"{self._p}:task:{task_id}"
+
+    def _blob(self, task_id: str, index: int) -> str:
+        return f"{self._p}:blob:{task_id}:{index}"
+
+    @property
+    def _queue(self) -> str:
+        return f"{self._p}:queue"
+
+    @property
+    def _running(self) -> str:
+        return f"{self._p}:running"
+
+    def submit(self, task_id, payload):
+        pipe = self._r.pipeline()
+        pipe.hset(self._task(task_id), mapping={"payload": json.dumps(payload), "status": QUEUED, "attempts": 0})
+        pipe.rpush(self._queue, task_id)
+        pipe.execute()
+
+    def _requeue_expired(self) -> None:
+        self._requeue_script(
+            keys=[self._queue, self._running],
+            args=[self._task(""), time.time(), QUEUED, RUNNING],
+        )
+
+    def claim(self, worker_id, lease_seconds):
+        self._requeue_expired()
+        error = {"kind": "runtime", "message": "worker หยุดทำงานกลางคันซ้ำหลายครั้ง"}
+        # งานที่ถูกยกเลิกระหว่างรอ / เกินจำนวนครั้ง ถูกข้ามใน script
+        claimed = self._claim_script(
+            keys=[self._queue, self._running],
+            args=[
+                self._task(""), worker_id, time.time() + lease_seconds, self.max_attempts,
+                json.dumps(error), RESULT_TTL_SECONDS, QUEUED, RUNNING, FAILED,
+            ],
+        )
+        if not claimed:
+            return None
+        task_id, payload = claimed
+        return task_id.decode(), json.loads(payload)
+
+    def heartbeat(self, task_id, worker_id, lease_seconds, progress):
+        key = self._task(task_id)
+        status, worker = self._r.hmget(key, "status", "worker")
+        if status != RUNNING.encode() or worker != worker_id.encode():
+            return False
+        if progress:
+            self._r.hset(key, "progress", json.dumps(progress))
+        self._r.zadd(self._running, {task_id: time.time() + lease_seconds})
+        return True
+
+    def _finish(self, task_id: str, worker_id: str, mapping: Dict[str, str], blobs: List[bytes] = ()) -> None:
+        key = self._task(task_id)
+        status, worker = self._r.hmget(key, "status", "worker")
+        if status != RUNNING.encode() or worker != worker_id.encode():
+            return
+        pipe = self._r.pipeline()
+        for index, data in enumerate(blobs):
+            pipe.set(self._blob(task_id, index), data, ex=RESULT_TTL_SECONDS)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, RESULT_TTL_SECONDS)
+        pipe.zrem(self._running, task_id)
+        pipe.execute()
+
+    def complete(self, task_id, worker_id, result, blobs):
+        self._finish(task_id, worker_id, {"status": DONE, "result": json.dumps(result)}, blobs)
+
+    def fail(self, task_id, worker_id, error):
+        self._finish(task_id, worker_id, {"status": FAILED, "error": json.dumps(error)})
+
+    def poll(self, task_id):
+        status, progress, result, error = self._r.hmget(self._task(task_id), "status", "progress", "result", "error")
+        if status is None:
+            return None
+        return {
+            "status": status.decode(),
+            "progress": json.loads(progress) if progress else None,
+            "result": json.loads(result) if result else None,
+            "error": json.loads(error) if error else None,
+        }
+
+    def fetch_blob(self, task_id, index):
+        data = self._r.get(self._blob(task_id, index))
+        if data is None:
+            raise RuntimeError("ไม่พบไฟล์ผลลัพธ์ของงานใน broker")
+        return data
+
+    def cancel(self, task_id):
+        key = self._task(task_id)
+        if self._r.hget(key, "status") in (QUEUED.encode(), RUNNING.encode()):
+            self._r.hset(key, "status", CANCELLED)
+            self._r.expire(key, RESULT_TTL_SECONDS)
+            self._r.zrem(self._running, task_id)
+
+    def purge(self, task_id):
+        # จำนวน blob ไม่ได้เก็บแยก -> ลบตาม pattern (มีไม่กี่ key ต่องาน)
+        keys = list(self._r.scan_iter(self._blob(task_id, "*")))
+        self._r.delete(self._task(task_id), *keys)
+
+    def report_worker(self, worker_id, info):
+        self._r.hset(f"{self._p}:workers", worker_id, json.dumps(dict(info, seen_at=time.time())))
+
+    def workers(self):
+        raw = self._r.hgetall(f"{self._p}:workers")
+        return {k.decode(): json.loads(v) for k, v in raw.items()}
+
+    def queued_count(self):
+        return self._r.llen(self._queue)
+
+    def close(self):
+        self._r.close()
+
+
+def open_broker(url: str) -> Broker:
+    """เปิด broker ตาม URL (sqlite:///path หรือ redis://...) ถ้าไม่มี scheme ถือเป็น path ของ SQLite"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SqliteBroker(url)
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+# ----------------- แปลง exception / ผลลัพธ์ให้ส่งผ่าน broker ได้ -----------------
+
+
+def encode_error(e: BaseException) -> Dict[str, Any]:
+    if isinstance(e, TooLongForSingleFile):
+        return {"kind": "too_long", "parts": e.parts, "duration": e.duration, "message": str(e)}
+    if isinstance(e, JobCancelled):
+        return {"kind": "cancelled", "message": str(e)}
+    if isinstance(e, ValueError):
+        return {"kind": "value", "message": str(e)}
+    if isinstance(e, TimeoutError):
+        return {"kind": "timeout", "message": str(e)}
+    return {"kind": "runtime", "message": str(e) or type(e).__name__}
+
+
+def decode_error(error: Optional[Dict[str, Any]]) -> Exception:
+    error = error or {}
+    kind = error.get("kind")
+    message = error.get("message") or "worker ทำงานไม่สำเร็จ"
+    if kind == "too_long":
+        return TooLongForSingleFile(int(error["parts"]), float(error["duration"]))
+    if kind == "cancelled":
+        return JobCancelled()
+    if kind == "value":
+        return ValueError(message)
+    if kind == "timeout":
+        return TimeoutError(message)
+    return RuntimeError(message)
+
+
+def encode_outcome(outcome: DownloadOutcome) -> Dict[str, Any]:
+    """DownloadOutcome -> dict (ไม่รวม path ของเครื่อง worker เหลือแค่ชื่อไฟล์)"""
+    data = asdict(outcome)
+    data["path"] = os.path.basename(outcome.path)
+    data["parts"] = [os.path.basename(p) for p in outcome.parts]
+    return data
+
+
+# ----------------- ฝั่งบอท: ส่งงานแล้วรอผล -----------------
+
+
+class RemoteRunner:
+    """ส่งงานหนักให้ worker ผ่าน broker แทนการรันใน pool ของบอทเอง
+    เมธอด download / prefetch / expand_playlist ใช้แทน run_download / run_prefetch / run_expand_playlist"""
+
+    def __init__(
+        self,
+        broker: Broker,
+        poll_interval: float = 0.5,
+        claim_timeout: float = 120.0,
+        job_timeout: float = 0.0,
+    ):
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout  # ไม่มี worker มารับงานภายในเวลานี้ = ล้มเหลว
+        self.job_timeout = job_timeout  # นับตั้งแต่ worker เริ่มทำ (0 = ไม่จำกัด)
+        # broker แบบ SQLite ใช้ connection เดียว -> เรียกจาก thread เดียวพอ
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broker")
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _run(self, kind: str, payload: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+        """ส่งงานแล้วรอจนจบ คืน (task_id, result) โยน exception เดียวกับที่ worker เจอ"""
+        task_id = uuid.uuid4().hex
+        await self._call(self.broker.submit, task_id, dict(payload, kind=kind))
+        submitted = time.monotonic()
+        started: Optional[float] = None
+        last_progress = None
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                state = await self._call(self.broker.poll, task_id)
+                if state is None:
+                    raise RuntimeError("งานหายไปจาก broker")
+                status = state["status"]
+                if status == DONE:
+                    return task_id, state["result"]
+                if status in (FAILED, CANCELLED):
+                    raise decode_error(state["error"] if status == FAILED else {"kind": "cancelled"})
+                now = time.monotonic()
+                if status == RUNNING:
+                    started = started or now
+                    if progress is not None and state["progress"] and state["progress"] != last_progress:
+                        last_progress = state["progress"]
+                        progress(Progress(**last_progress))
+                    if self.job_timeout and now - started > self.job_timeout:
+                        raise TimeoutError(f"ดาวน์โหลดเกินเวลา {int(self.job_timeout)} วินาที")
+                elif started is None and self.claim_timeout and now - submitted > self.claim_timeout:
+                    raise RuntimeError("ไม่มี worker ว่างรับงาน กรุณาลองใหม่ภายหลัง")
+        except BaseException:
+            # ยกเลิก / หมดเวลา / ล้มเหลว -> บอก worker ให้หยุด แล้วลบงานทิ้ง
+            await asyncio.shield(self._abandon(task_id))
+            raise
+
+    async def _abandon(self, task_id: str) -> None:
+        try:
+            await self._call(self.broker.cancel, task_id)
+            await self._call(self.broker.purge, task_id)
+        except Exception as e:
+            print("Broker cleanup error:", e)
+
+    def _save_blob(self, task_id: str, index: int, path: str) -> None:
+        """โหลดไฟล์ผลลัพธ์จาก broker แล้วเขียนลงดิสก์ (blocking: ไฟล์ใหญ่ได้ถึง MAX_FILE_SIZE_BYTES)"""
+        data = self.broker.fetch_blob(task_id, index)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    async def download(
+        self,
+        url: str,
+        options: EncodeOptions,
+        info: Optional[dict] = None,
+        progress: Optional[ProgressCallback] = None,
+        work_root: Optional[str] = None,
+    ) -> DownloadOutcome:
+        payload = {"url": url, "options": asdict(options), "info": info}
+        task_id, result = await self._run("download", payload, progress)
+        # เขียนไฟล์ผลลัพธ์ลงโฟลเดอร์งานของบอท (ส่งต่อ/เข้าแคชได้เหมือนงานที่รันเอง)
+        temp_dir = tempfile.mkdtemp(prefix="ytmp3_", dir=work_root)
+        try:
+            paths = []
+            for index, name in enumerate(result["parts"]):
+                path = os.path.join(temp_dir, name)
+                await self._call(self._save_blob, task_id, index, path)
+                paths.append(path)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            await asyncio.shield(self._abandon(task_id))
+            raise
+        await self._call(self.broker.purge, task_id)
+        result.update(path=paths[0], parts=paths)
+        return DownloadOutcome(**result)
+
+    async def prefetch(self, url: str, options: EncodeOptions) -> dict:
+        task_id, result = await self._run("prefetch", {"url": url, "options": asdict(options)})
+        await self._call(self.broker.purge, task_id)
+        return result
+
+    async def expand_playlist(self, url: str, limit: int) -> List[Tuple[str, str]]:
+        task_id, result = await self._run("expand", {"url": url, "limit": limit})
+        await self._call(self.broker.purge, task_id)
+        return [tuple(item) for item in result]
+
+    async def workers(self) -> Dict[str, Dict[str, Any]]:
+        return await self._call(self.broker.workers)
+
+    async def queued_count(self) -> int:
+        return await self._call(self.broker.queued_count)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""สถิติงานแปลงไฟล์แยกตามรูปแบบไฟล์ (ใช้ดูว่าการ remux ช่วยประหยัด CPU ไปเท่าไร)"""
+
+from dataclasses import dataclass
+from typing import Dict
+
+# เวลา CPU ต่อความยาวเสียง 1 วินาที ที่ใช้ประมาณตอนยังไม่มีงานเข้ารหัสจริงให้เทียบ
+DEFAULT_CPU_PER_MEDIA_SECOND: float = 0.02
+
+
+@dataclass
+class FormatStats:
+    jobs: int = 0
+    remuxed_jobs: int = 0
+    transcode_cpu_seconds: float = 0.0
+    transcode_media_seconds: float = 0.0
+    remux_cpu_seconds: float = 0.0
+    cpu_seconds_saved: float = 0.0
+
+    def cpu_per_media_second(self) -> float:
+        if self.transcode_media_seconds <= 0:
+            return DEFAULT_CPU_PER_MEDIA_SECOND
+        return self.transcode_cpu_seconds / self.transcode_media_seconds
+
+
+class JobStats:
+    def __init__(self):
+        self.by_format: Dict[str, FormatStats] = {}
+
+    def _cpu_rate(self, codec: str) -> float:
+        """ต้นทุนเข้ารหัสต่อวินาทีเสียง ของรูปแบบนี้ (ถ้าไม่มีข้อมูลใช้ค่าเฉลี่ยทุกรูปแบบ)"""
+        stats = self.by_format.get(codec)
+        if stats is not None and stats.transcode_media_seconds > 0:
+            return stats.cpu_per_media_second()
+        cpu = sum(s.transcode_cpu_seconds for s in self.by_format.values())
+        media = sum(s.transcode_media_seconds for s in self.by_format.values())
+        return cpu / media if media > 0 else DEFAULT_CPU_PER_MEDIA_SECOND
+
+    def record(self, codec: str, remuxed: bool, cpu_seconds: float, media_seconds: float) -> None:
+        stats = self.by_format.setdefault(codec, FormatStats())
+        stats.jobs += 1
+        if remuxed:
+            # ประหยัดได้ = ต้นทุนเข้ารหัสเฉลี่ยของรูปแบบนี้ x ความยาวคลิป - CPU ที่ใช้ remux จริง
+            stats.remuxed_jobs += 1
+            stats.remux_cpu_seconds += cpu_seconds
+            estimated = self._cpu_rate(codec) * media_seconds
+            stats.cpu_seconds_saved += max(0.0, estimated - cpu_seconds)
+        else:
+            stats.transcode_cpu_seconds += cpu_seconds
+            stats.transcode_media_seconds += media_seconds
+
+    def summary_lines(self):
+        for codec, stats in sorted(self.by_format.items()):
+            yield (
+                f"• {codec}: {stats.jobs} งาน (remux {stats.remuxed_jobs}) | "
+                f"CPU เข้ารหัส {stats.transcode_cpu_seconds:.1f}s | "
+                f"ประหยัดได้ ~{stats.cpu_seconds_saved:.1f}s"
+            )
@@ -1,21 +1,71 @@
 # keep_alive.py
 # เว็บเล็กๆ สำหรับให้ Render ใช้เช็คว่า service ยังไม่ดับ
+# มีสองแบบ: Flask ใน thread แยก (keep_alive) หรือ aiohttp บน event loop ของบอทเอง (start_health_server)
+# แบบหลังไม่ต้อง import Flask/werkzeug และไม่มี thread เพิ่ม (ใช้ในโหมดประหยัดหน่วยความจำ)
 
 import os
 from threading import Thread
-from flask import Flask
+from typing import Callable, Optional
 
-app = Flask(__name__)
+HOME_TEXT = "Discord MP3 bot is running."
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# ฟังก์ชันที่คืนข้อความ metric รูปแบบ Prometheus (บอทเป็นคนตั้งให้ตอนเรียก keep_alive)
+_metrics_provider: Optional[Callable[[], str]] = None
+
+
+def _port() -> int:
+    return int(os.environ.get("PORT", 10000))
+
+
+def _create_flask_app():
+    from flask import Flask, Response
+
+    app = Flask(__name__)
+
+    @app.route("/")
+    def home():
+        return HOME_TEXT, 200
+
+    @app.route("/metrics")
+    def metrics():
+        if _metrics_provider is None:
+            return "metrics not configured\n", 404
+        return Response(_metrics_provider(), mimetype=METRICS_CONTENT_TYPE)
+
+    return app
 
-@app.route("/")
-def home():
-    return "Discord MP3 bot is running.", 200
 
 def _run():
-    port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port)
+    _create_flask_app().run(host="0.0.0.0", port=_port())
+
 
-def keep_alive():
-    """เรียกฟังก์ชันนี้ก่อน bot.run() เพื่อให้ Flask รันในอีก thread"""
+def keep_alive(metrics_provider: Optional[Callable[[], str]] = None):
+    """เรียกฟังก์ชันนี้ก่อน bot.run() เพื่อให้ Flask รันในอีก thread
+    ถ้าส่ง metrics_provider มา จะเปิด /metrics ให้ Prometheus ดึงค่าได้"""
+    global _metrics_provider
+    _metrics_provider = metrics_provider
     t = Thread(target=_run, daemon=True)
     t.start()
+
+
+async def start_health_server(metrics_provider: Optional[Callable[[], str]] = None):
+    """เปิด / และ /metrics ด้วย aiohttp บน event loop ที่กำลังรัน (เรียกจาก setup_hook)
+    คืน AppRunner (เรียก cleanup() ตอนปิด)"""
+    from aiohttp import web
+
+    async def home(_request):
+        return web.Response(text=HOME_TEXT)
+
+    async def metrics(_request):
+        if metrics_provider is None:
+            return web.Response(text="metrics not configured\n", status=404)
+        return web.Response(body=metrics_provider().encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", _port()).start()
+    return runner
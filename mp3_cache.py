@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""แคชไฟล์เสียงที่แปลงแล้วบนดิสก์ (key = video id + ค่าการเข้ารหัส)
+จำกัดขนาดรวมเป็นไบต์ และไล่ไฟล์ที่ไม่ได้ใช้นานที่สุดออกก่อน (LRU)
+
+การเอาไฟล์เข้าแคชจาก event loop ใช้ put_async: ย้ายไฟล์ (อาจเป็นการ copy ข้ามดิสก์) เข้าโฟลเดอร์แคช
+ในชื่อชั่วคราวบน thread ก่อน แล้วจึง rename (atomic) + ลงทะเบียนบน loop
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# ไฟล์ที่ย้ายเข้าโฟลเดอร์แคชแล้วแต่ยังไม่ได้ลงทะเบียน (ค้างได้ถ้าบอทล่มกลางทาง -> ลบตอนเริ่ม)
+_STAGING_SUFFIX = ".part"
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: str
+    title: str
+    size: int
+    pins: int = 0  # จำนวนงานที่กำลังใช้ไฟล์นี้อยู่ (ห้ามลบระหว่างส่ง)
+
+
+class Mp3Cache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, key + ".json")
+
+    def _load_index(self) -> None:
+        """สร้าง index ใหม่จากไฟล์ในโฟลเดอร์ (เรียงตามเวลาใช้งานล่าสุด)"""
+        found = []
+        for name in os.listdir(self.root):
+            if name.endswith(_STAGING_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".json"):
+                continue
+            key = name[: -len(".json")]
+            try:
+                with open(os.path.join(self.root, name), encoding="utf-8") as f:
+                    meta = json.load(f)
+                path = os.path.join(self.root, meta["file"])
+                st = os.stat(path)
+            except (OSError, ValueError, KeyError):
+                # sidecar เสีย หรือไฟล์เสียงหายไปแล้ว -> ทิ้ง
+                self._remove_files(key, None)
+                continue
+            found.append((st.st_mtime, CacheEntry(key, path, meta.get("title", "audio"), st.st_size)))
+
+        for _mtime, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[entry.key] = entry
+            self.total_bytes += entry.size
+        self._evict()
+
+    def _remove_files(self, key: str, path: Optional[str]) -> None:
+        for p in (path, self._meta_path(key)):
+            if p:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def _evict(self) -> None:
+        """ลบไฟล์ที่ไม่ได้ใช้นานที่สุดจนขนาดรวมไม่เกิน max_bytes (ข้ามไฟล์ที่ถูก pin)"""
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.pins > 0:
+                continue
+            del self._entries[key]
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            self._remove_files(key, entry.path)
+
+    def contains(self, key: str) -> bool:
+        """มีไฟล์นี้ในแคชไหม (ไม่นับเป็น hit/miss และไม่ pin)"""
+        entry = self._entries.get(key)
+        return entry is not None and os.path.isfile(entry.path)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """หาไฟล์ในแคช ถ้าเจอจะ pin ไว้ (ต้องเรียก release เมื่อใช้เสร็จ)"""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or not os.path.isfile(entry.path):
+            if entry is not None:
+                self._entries.pop(key, None)
+                self.total_bytes -= entry.size
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.pins += 1
+        self.hits += 1
+        try:
+            # อัปเดตเวลาใช้งาน เพื่อให้ลำดับ LRU อยู่รอดหลังรีสตาร์ท
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry
+
+    def _reuse_existing(self, key: str) -> Optional[CacheEntry]:
+        """มีไฟล์ของ key นี้อยู่แล้ว -> pin ของเดิมให้ผู้เรียก (ไม่ทับไฟล์ที่งานอื่นอาจกำลังส่งอยู่)"""
+        old = self._entries.get(key)
+        if old is None or not os.path.isfile(old.path):
+            return None
+        self._entries.move_to_end(key)
+        old.pins += 1
+        return old
+
+    def _stage_blocking(self, key: str, src_path: str, title: str) -> Optional[Tuple[str, str, int]]:
+        """ย้ายไฟล์ + sidecar เข้าโฟลเดอร์แคชในชื่อชั่วคราว คืน (ไฟล์, sidecar, ขนาด) หรือ None ถ้าใหญ่เกิน (blocking)"""
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            return None
+        _base, ext = os.path.splitext(src_path)
+        token = uuid.uuid4().hex[:8]
+        staged = os.path.join(self.root, f"{key}.{token}{ext}{_STAGING_SUFFIX}")
+        staged_meta = os.path.join(self.root, f"{key}.{token}.json{_STAGING_SUFFIX}")
+        shutil.move(src_path, staged)
+        with open(staged_meta, "w", encoding="utf-8") as f:
+            json.dump({"file": key + ext, "title": title, "created": time.time()}, f, ensure_ascii=False)
+        return staged, staged_meta, size
+
+    def _commit(self, key: str, title: str, staged: str, staged_meta: str, size: int) -> CacheEntry:
+        """ลงทะเบียนไฟล์ที่ stage ไว้ (rename ในดิสก์เดียวกัน ไม่ต้อง copy)"""
+        existing = self._reuse_existing(key)
+        if existing is not None:
+            # งานอื่นเอาไฟล์เดียวกันเข้าแคชไปก่อนระหว่างที่เรา stage อยู่
+            for path in (staged, staged_meta):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return existing
+        _base, ext = os.path.splitext(staged[: -len(_STAGING_SUFFIX)])
+        dest = os.path.join(self.root, key + ext)
+        pins = 0
+        old = self._entries.pop(key, None)
+        if old is not None:
+            # ไฟล์เดิมหายไปแล้ว -> แทนที่ แต่คง pin ของงานที่ยังถือ entry เดิมอยู่ (release จะลดให้ถูกตัว)
+            self.total_bytes -= old.size
+            pins = old.pins
+        os.replace(staged, dest)
+        os.replace(staged_meta, self._meta_path(key))
+        entry = CacheEntry(key, dest, title, size, pins=pins + 1)
+        self._entries[key] = entry
+        self.total_bytes += size
+        self._evict()
+        return entry
+
+    def put(self, key: str, src_path: str, title: str) -> Optional[CacheEntry]:
+        """ย้ายไฟล์ที่แปลงเสร็จเข้าแคช (pin ไว้ให้ผู้เรียก) คืน None ถ้าเก็บไม่ได้ (blocking: ใช้ put_async บน event loop)
+
+        ถ้ามีไฟล์ของ key นี้อยู่แล้ว จะใช้ของเดิมแทน (ลบ src_path ทิ้ง) ไม่ทับไฟล์ที่งานอื่นอาจกำลังส่งอยู่
+        """
+        if not self.enabled:
+            return None
+        existing = self._reuse_existing(key)
+        if existing is not None:
+            try:
+                os.remove(src_path)
+            except OSError:
+                pass
+            return existing
+        staged = self._stage_blocking(key, src_path, title)
+        return self._commit(key, title, *staged) if staged is not None else None
+
+    async def put_async(self, key: str, src_path: str, title: str) -> Optional[CacheEntry]:
+        """เหมือน put แต่ย้ายไฟล์บน thread (ไฟล์ temp กับแคชมักอยู่คนละดิสก์ = copy ทั้งไฟล์) ลงทะเบียนบน loop"""
+        if not self.enabled:
+            return None
+        existing = self._reuse_existing(key)
+        if existing is not None:
+            return existing  # ผู้เรียกลบโฟลเดอร์ temp ที่มี src_path อยู่แล้ว
+        loop = asyncio.get_running_loop()
+        staged = await loop.run_in_executor(None, self._stage_blocking, key, src_path, title)
+        return self._commit(key, title, *staged) if staged is not None else None
+
+    def release(self, key: str) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.pins > 0:
+            entry.pins -= 1
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""แก้ข้อความสถานะ (progress) แบบรวมชุด ไม่ให้ชน rate limit ของ Discord
+
+Discord จำกัดการแก้ข้อความต่อห้อง (DM หนึ่งห้องอาจมีหลายงานของผู้ใช้คนเดียวกัน)
+จึงเก็บ "สถานะล่าสุด" ของแต่ละข้อความไว้ แล้วมี task ละห้องคอยแก้ข้อความ
+ห่างกันอย่างน้อย min_interval วินาที สถานะเก่าที่ยังไม่ได้ส่งจะถูกแทนด้วยสถานะใหม่ (latest-state-wins)
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import discord
+
+
+@dataclass
+class _ChannelSlot:
+    # id ข้อความ -> (ข้อความ, เนื้อหาล่าสุดที่ยังไม่ได้ส่ง) เรียงตามลำดับที่มีการอัปเดต
+    pending: Dict[int, tuple] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    task: Optional[asyncio.Task] = None
+    last_edit_at: float = 0.0
+
+
+class ProgressEditor:
+    def __init__(self, min_interval: float = 2.0):
+        self.min_interval = min_interval
+        self._slots: Dict[int, _ChannelSlot] = {}
+        self.edits_sent = 0
+        self.updates_dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_interval > 0
+
+    def update(self, message: discord.Message, content: str) -> None:
+        """ตั้งสถานะล่าสุดของข้อความ (ไม่รอ) การแก้จริงจะเกิดตามรอบของห้องนั้น"""
+        if not self.enabled:
+            return
+        channel_id = message.channel.id
+        slot = self._slots.get(channel_id)
+        if slot is None:
+            slot = self._slots[channel_id] = _ChannelSlot()
+        if message.id in slot.pending:
+            # ทับสถานะเดิมที่ยังไม่ได้ส่ง (คงลำดับคิวเดิมไว้ ข้อความอื่นในห้องจะได้ไม่ถูกแซง)
+            self.updates_dropped += 1
+        slot.pending[message.id] = (message, content)
+        if slot.task is None or slot.task.done():
+            slot.task = asyncio.create_task(self._drain(channel_id, slot))
+
+    async def _drain(self, channel_id: int, slot: _ChannelSlot) -> None:
+        # หลังแก้ครั้งสุดท้ายยังรอครบ min_interval ก่อนปิด task เพื่อให้สถานะที่ตามมาติดเพดานเดิม
+        while True:
+            wait = slot.last_edit_at + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if not slot.pending:
+                break
+            message_id = next(iter(slot.pending))
+            message, content = slot.pending.pop(message_id)
+            async with slot.lock:
+                slot.last_edit_at = time.monotonic()
+                try:
+                    await message.edit(content=content)
+                    self.edits_sent += 1
+                except discord.HTTPException:
+                    pass
+        if self._slots.get(channel_id) is slot and not slot.pending:
+            del self._slots[channel_id]
+
+    async def finish(self, message: discord.Message) -> None:
+        """ทิ้งสถานะที่ยังไม่ได้ส่งของข้อความนี้ และรอให้การแก้ที่กำลังส่งอยู่เสร็จ
+        เรียกก่อนแก้ข้อความเป็นผลลัพธ์สุดท้าย เพื่อไม่ให้ progress เก่ามาทับทีหลัง"""
+        slot = self._slots.get(message.channel.id)
+        if slot is None:
+            return
+        slot.pending.pop(message.id, None)
+        async with slot.lock:
+            pass
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""สถิติต่อ shard ของ gateway (ใช้ตัดสินใจว่าควรใช้กี่ shard)
+
+เก็บจำนวน event ที่บอทจัดการ (ข้อความ / interaction) ต่อ shard, อัตราต่อวินาทีแบบเฉลี่ยเคลื่อนที่,
+ความหน่วง heartbeat ล่าสุด และจำนวนครั้งที่ต่อใหม่/หลุด ทุกค่าอัปเดตบน event loop ของบอท
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# น้ำหนักของค่าใหม่ในค่าเฉลี่ยอัตรา event (ยิ่งมากยิ่งไวต่อการเปลี่ยนแปลง)
+_RATE_ALPHA = 0.2
+
+
+def shard_for_guild(guild_id: Optional[int], shard_count: int) -> int:
+    """shard ที่ดูแลเซิร์ฟเวอร์นี้ตามสูตรของ Discord (DM อยู่ shard 0 เสมอ)"""
+    if not guild_id or shard_count <= 1:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+@dataclass
+class ShardInfo:
+    events: Dict[str, int] = field(default_factory=dict)
+    events_per_sec: float = 0.0
+    latency: Optional[float] = None
+    ready_count: int = 0
+    resume_count: int = 0
+    disconnect_count: int = 0
+    connected: bool = False
+    last_ready_at: Optional[float] = None
+    connect_started: Optional[float] = None
+    last_ready_seconds: Optional[float] = None  # เวลาตั้งแต่เริ่มต่อจนพร้อม ครั้งล่าสุด
+    _last_total: int = 0
+
+    @property
+    def total_events(self) -> int:
+        return sum(self.events.values())
+
+
+class ShardStats:
+    def __init__(self):
+        self.shards: Dict[int, ShardInfo] = {}
+        self._last_sample = time.monotonic()
+
+    def _shard(self, shard_id: Optional[int]) -> ShardInfo:
+        return self.shards.setdefault(shard_id or 0, ShardInfo())
+
+    def record_event(self, shard_id: Optional[int], kind: str) -> None:
+        info = self._shard(shard_id)
+        info.events[kind] = info.events.get(kind, 0) + 1
+
+    def on_connect(self, shard_id: Optional[int]) -> None:
+        info = self._shard(shard_id)
+        info.connect_started = time.monotonic()
+
+    def on_ready(self, shard_id: Optional[int]) -> None:
+        info = self._shard(shard_id)
+        info.ready_count += 1
+        info.connected = True
+        info.last_ready_at = time.time()
+        if info.connect_started is not None:
+            info.last_ready_seconds = time.monotonic() - info.connect_started
+            info.connect_started = None
+
+    def on_resumed(self, shard_id: Optional[int]) -> None:
+        info = self._shard(shard_id)
+        info.resume_count += 1
+        info.connected = True
+
+    def on_disconnect(self, shard_id: Optional[int]) -> None:
+        info = self._shard(shard_id)
+        info.disconnect_count += 1
+        info.connected = False
+
+    def sample(self, latencies: Dict[int, float]) -> None:
+        """เรียกเป็นระยะ: อัปเดตความหน่วงล่าสุด และอัตรา event ต่อวินาทีของทุก shard"""
+        now = time.monotonic()
+        elapsed = max(1e-6, now - self._last_sample)
+        self._last_sample = now
+        for shard_id, latency in latencies.items():
+            # ยังไม่เคยได้ heartbeat ACK -> latency เป็น inf
+            self._shard(shard_id).latency = latency if latency == latency and latency != float("inf") else None
+        for info in self.shards.values():
+            total = info.total_events
+            rate = (total - info._last_total) / elapsed
+            info._last_total = total
+            info.events_per_sec += _RATE_ALPHA * (rate - info.events_per_sec)
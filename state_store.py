@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""ที่เก็บสถานะถาวรของบอท (SQLite โหมด WAL)
+เก็บคิวงาน, ข้อความที่รอลบ, ข้อความยกเว้น, แอดมิน และค่าตั้ง autodel ให้รอดการรีสตาร์ท
+
+การเขียนทุกครั้งแค่ต่อคิวไว้ในหน่วยความจำ แล้วมี task เดียวเขียนรวมเป็น transaction เดียว
+ทุก ๆ flush_interval วินาที (รันใน thread แยก) จึงไม่เพิ่ม latency ให้การตอบข้อความ
+"""
+
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import discord
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS admins (user_id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS exempt (message_id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS pending_urls (
+    user_id INTEGER PRIMARY KEY, url TEXT NOT NULL, fmt TEXT NOT NULL, created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, url TEXT NOT NULL,
+    custom_name TEXT, fmt TEXT NOT NULL, split INTEGER NOT NULL, enqueued_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deletions (
+    message_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, due_at REAL NOT NULL
+);
+"""
+
+# ข้อความรอลบที่เลยกำหนดมานานเกินนี้ถือว่าหมดความหมาย (ลบไม่ได้แล้ว/ถูกลบไปแล้ว)
+_STALE_DELETION = timedelta(days=14)
+# ค้างรอชื่อไฟล์นานเกินนี้ ถือว่าผู้ใช้ไม่ตอบแล้ว
+_STALE_PENDING_URL = timedelta(days=1)
+
+Op = Tuple[str, Sequence[Any]]
+
+
+class StateStore:
+    def __init__(self, path: str, flush_interval: float = 0.5, exempt_retention_days: int = 30):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.exempt_retention = timedelta(days=exempt_retention_days)
+        self._conn: Optional[sqlite3.Connection] = None
+        # sqlite ใช้จาก thread เดียวตลอด
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._ops: List[Op] = []
+        self._task: Optional[asyncio.Task] = None
+        self._last_compact = 0.0
+
+    # ----------------- เปิด/ปิด -----------------
+
+    def _open_blocking(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def open(self) -> None:
+        await self._call(self._open_blocking)
+        await self.compact()
+        self._task = asyncio.create_task(self._writer(), name="state-store-writer")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._conn is not None:
+            await self._call(self._conn.close)
+            self._conn = None
+
+    # ----------------- เขียนแบบรวมชุด -----------------
+
+    def _write_blocking(self, ops: List[Op]) -> None:
+        assert self._conn is not None
+        with self._conn:
+            for sql, params in ops:
+                self._conn.execute(sql, params)
+
+    async def flush(self) -> None:
+        if not self._ops or self._conn is None:
+            return
+        ops, self._ops = self._ops, []
+        try:
+            await self._call(self._write_blocking, ops)
+        except sqlite3.Error as e:
+            print("State store write error:", e)
+
+    async def _writer(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.time() - self._last_compact > 3600:
+                await self.compact()
+
+    def _queue(self, sql: str, params: Sequence[Any] = ()) -> None:
+        self._ops.append((sql, params))
+
+    # ----------------- บีบอัด (ลบข้อมูลหมดอายุ) -----------------
+
+    def _compact_blocking(self) -> None:
+        assert self._conn is not None
+        now = time.time()
+        # id ข้อความ (snowflake) บอกเวลาสร้างข้อความได้ ใช้ตัดข้อความยกเว้นที่เก่ามาก
+        exempt_cutoff = discord.utils.time_snowflake(discord.utils.utcnow() - self.exempt_retention)
+        with self._conn:
+            self._conn.execute("DELETE FROM exempt WHERE message_id < ?", (exempt_cutoff,))
+            self._conn.execute(
+                "DELETE FROM deletions WHERE due_at < ?", (now - _STALE_DELETION.total_seconds(),)
+            )
+            self._conn.execute(
+                "DELETE FROM pending_urls WHERE created_at < ?", (now - _STALE_PENDING_URL.total_seconds(),)
+            )
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def compact(self) -> None:
+        await self.flush()
+        self._last_compact = time.time()
+        try:
+            await self._call(self._compact_blocking)
+        except sqlite3.Error as e:
+            print("State store compact error:", e)
+
+    # ----------------- โหลดสถานะตอนเริ่ม -----------------
+
+    def _load_blocking(self) -> Dict[str, Any]:
+        assert self._conn is not None
+        cur = self._conn.cursor()
+        return {
+            "settings": dict(cur.execute("SELECT key, value FROM settings").fetchall()),
+            "admins": {row[0] for row in cur.execute("SELECT user_id FROM admins")},
+            "exempt": {row[0] for row in cur.execute("SELECT message_id FROM exempt")},
+            "pending_urls": {
+                row[0]: (row[1], row[2])
+                for row in cur.execute("SELECT user_id, url, fmt FROM pending_urls")
+            },
+            "jobs": cur.execute(
+                "SELECT job_id, user_id, url, custom_name, fmt, split FROM jobs ORDER BY enqueued_at, job_id"
+            ).fetchall(),
+            "deletions": cur.execute("SELECT message_id, channel_id, due_at FROM deletions").fetchall(),
+        }
+
+    async def load(self) -> Dict[str, Any]:
+        return await self._call(self._load_blocking)
+
+    # ----------------- ค่าตั้ง / แอดมิน / ยกเว้น -----------------
+
+    def set_setting(self, key: str, value: Any) -> None:
+        self._queue("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def add_admin(self, user_id: int) -> None:
+        self._queue("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
+
+    def remove_admin(self, user_id: int) -> None:
+        self._queue("DELETE FROM admins WHERE user_id = ?", (user_id,))
+
+    def add_exempt(self, message_id: int) -> None:
+        self._queue("INSERT OR IGNORE INTO exempt (message_id) VALUES (?)", (message_id,))
+
+    def remove_exempt(self, message_id: int) -> None:
+        self._queue("DELETE FROM exempt WHERE message_id = ?", (message_id,))
+
+    # ----------------- รอชื่อไฟล์ -----------------
+
+    def set_pending_url(self, user_id: int, url: str, fmt: str) -> None:
+        self._queue(
+            "INSERT OR REPLACE INTO pending_urls (user_id, url, fmt, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, url, fmt, time.time()),
+        )
+
+    def remove_pending_url(self, user_id: int) -> None:
+        self._queue("DELETE FROM pending_urls WHERE user_id = ?", (user_id,))
+
+    # ----------------- คิวดาวน์โหลด -----------------
+
+    def add_job(self, job_id: int, user_id: int, url: str, custom_name: Optional[str], fmt: str, split: bool) -> None:
+        self._queue(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, url, custom_name, fmt, split, enqueued_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, url, custom_name, fmt, int(split), time.time()),
+        )
+
+    def remove_job(self, job_id: int) -> None:
+        self._queue("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def clear_jobs(self) -> None:
+        self._queue("DELETE FROM jobs")
+
+    # ----------------- ข้อความที่รอลบ -----------------
+
+    def add_deletion(self, channel_id: int, message_id: int, due_at: float) -> None:
+        self._queue(
+            "INSERT OR REPLACE INTO deletions (message_id, channel_id, due_at) VALUES (?, ?, ?)",
+            (message_id, channel_id, due_at),
+        )
+
+    def remove_deletions(self, message_ids: Sequence[int]) -> None:
+        for message_id in message_ids:
+            self._queue("DELETE FROM deletions WHERE message_id = ?", (message_id,))
+
+    def clear_deletions(self) -> None:
+        self._queue("DELETE FROM deletions")
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""พื้นที่ทำงานชั่วคราวของงานดาวน์โหลด (โฟลเดอร์ ytmp3_*) แบบมีงบประมาณไบต์รวม
+
+ทุกงานต้องจองพื้นที่ (lease) ก่อนเริ่มโหลด ตามขนาดที่ประเมินจาก metadata
+ถ้างบเต็ม งานจะรอตามลำดับ (FIFO) จนกว่างานอื่นจะคืนพื้นที่ แทนที่จะโหลดพร้อมกันจนดิสก์เต็ม
+
+งานเล็ก (ไม่เกิน ram_max_job_bytes) ใช้โฟลเดอร์ใน RAM (เช่น tmpfs /dev/shm) ได้ ถ้าตั้ง ram_root ไว้และงบ RAM ยังเหลือ
+แต่ละ process ใช้โฟลเดอร์ย่อย run-<pid> ของตัวเองใต้ root (TEMP_DIR ค่าเริ่มต้นอยู่ใน /tmp ที่ใช้ร่วมกันได้)
+ตอนเริ่มบอท sweep_orphans ลบเฉพาะ run-<pid> ของ process ที่ไม่มีชีวิตแล้ว (บอทล่มกลางงาน)
+ไม่ไปลบโฟลเดอร์ของบอทอีกตัวที่ยังทำงานอยู่ (rolling restart / หลายบอทบนเครื่องเดียว)
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+# prefix ของโฟลเดอร์งานทั้งหมด (downloader / ชุดงาน) ใช้ระบุโฟลเดอร์ที่กวาดทิ้งได้
+WORK_DIR_PREFIX = "ytmp3_"
+
+# โฟลเดอร์ของแต่ละ process: run-<pid>
+RUN_DIR_PREFIX = "run-"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # มี process นี้อยู่แต่เป็นของผู้ใช้อื่น (PermissionError) -> ถือว่ายังมีชีวิต
+        return True
+    return True
+
+
+@dataclass
+class TempLease:
+    """พื้นที่ที่จองไว้ให้งาน 1 งาน (คืนด้วย release เมื่อลบไฟล์ของงานแล้ว)"""
+    storage: "TempStorage"
+    root: str
+    nbytes: int
+    in_ram: bool = False
+    released: bool = False
+
+    def resize(self, nbytes: int) -> None:
+        """ปรับยอดจองเป็นขนาดจริง (เช่นหลังโหลดเสร็จ เหลือแค่ไฟล์ผลลัพธ์)"""
+        if not self.released:
+            self.storage._resize(self, max(0, nbytes))
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.storage._release(self)
+
+
+class TempStorage:
+    def __init__(
+        self,
+        root: str,
+        budget_bytes: int = 0,
+        ram_root: Optional[str] = None,
+        ram_budget_bytes: int = 0,
+        ram_max_job_bytes: int = 0,
+    ):
+        run_dir = f"{RUN_DIR_PREFIX}{os.getpid()}"
+        self.base_root = root
+        self.root = os.path.join(root, run_dir)
+        self.budget_bytes = max(0, budget_bytes)  # 0 = ไม่จำกัด
+        self.base_ram_root = ram_root if ram_root and ram_budget_bytes > 0 else None
+        self.ram_root = os.path.join(self.base_ram_root, run_dir) if self.base_ram_root else None
+        self.ram_budget_bytes = ram_budget_bytes
+        self.ram_max_job_bytes = ram_max_job_bytes
+        self.reserved_bytes = 0
+        self.ram_reserved_bytes = 0
+        self.active_leases = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.waited_total = 0
+        self.swept_dirs = 0
+        self.swept_bytes = 0
+        os.makedirs(self.root, exist_ok=True)
+        if self.ram_root:
+            os.makedirs(self.ram_root, exist_ok=True)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    # ----------------- จอง / คืนพื้นที่ -----------------
+
+    def _ram_fits(self, nbytes: int) -> bool:
+        return (
+            self.ram_root is not None
+            and nbytes <= self.ram_max_job_bytes
+            and self.ram_reserved_bytes + nbytes <= self.ram_budget_bytes
+        )
+
+    def _fits(self, nbytes: int) -> bool:
+        if self._ram_fits(nbytes):
+            return True
+        return not self.budget_bytes or self.reserved_bytes + nbytes <= self.budget_bytes
+
+    def _grant(self, nbytes: int) -> TempLease:
+        if self._ram_fits(nbytes):
+            self.ram_reserved_bytes += nbytes
+            lease = TempLease(self, self.ram_root, nbytes, in_ram=True)
+        else:
+            self.reserved_bytes += nbytes
+            lease = TempLease(self, self.root, nbytes)
+        self.active_leases += 1
+        return lease
+
+    async def acquire(self, estimate_bytes: int) -> TempLease:
+        """จองพื้นที่ตามขนาดที่ประเมินไว้ ถ้างบไม่พอจะรอคิว (งานที่ใหญ่กว่างบทั้งหมดจะได้งบเต็มแล้วทำทีละงาน)"""
+        nbytes = max(0, int(estimate_bytes))
+        if self.budget_bytes:
+            nbytes = min(nbytes, self.budget_bytes)
+        if not self._waiters and self._fits(nbytes):
+            return self._grant(nbytes)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, fut))
+        self.waited_total += 1
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # ได้พื้นที่พอดีกับตอนถูกยกเลิก -> คืนทันที
+                fut.result().release()
+            else:
+                self._remove_waiter(fut)
+            raise
+
+    def _remove_waiter(self, fut: asyncio.Future) -> None:
+        for entry in list(self._waiters):
+            if entry[1] is fut:
+                self._waiters.remove(entry)
+        self._wake()
+
+    def _wake(self) -> None:
+        # ให้ตามลำดับ ไม่ให้งานเล็กแซงงานใหญ่จนงานใหญ่ไม่ได้ทำ
+        while self._waiters:
+            nbytes, fut = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            fut.set_result(self._grant(nbytes))
+
+    def _resize(self, lease: TempLease, nbytes: int) -> None:
+        if lease.in_ram:
+            self.ram_reserved_bytes += nbytes - lease.nbytes
+        else:
+            self.reserved_bytes += nbytes - lease.nbytes
+        lease.nbytes = nbytes
+        self._wake()
+
+    def _release(self, lease: TempLease) -> None:
+        if lease.in_ram:
+            self.ram_reserved_bytes -= lease.nbytes
+        else:
+            self.reserved_bytes -= lease.nbytes
+        self.active_leases -= 1
+        self._wake()
+
+    # ----------------- กวาดโฟลเดอร์ค้าง / รายงาน -----------------
+
+    def _roots(self) -> List[str]:
+        return [r for r in (self.root, self.ram_root) if r]
+
+    def sweep_orphans(self, legacy_roots: Tuple[str, ...] = (), legacy_min_age: float = 0) -> Tuple[int, int]:
+        """ลบโฟลเดอร์งานที่ค้างตอนเริ่มบอท (ก่อนมีงานจริง) คืน (จำนวนโฟลเดอร์, ไบต์) (blocking)
+
+        - run-<pid> ใต้ root ของบอท: ลบเฉพาะของ process ที่ตายไปแล้ว (และเนื้อหาในโฟลเดอร์ของ process นี้เอง)
+        - ytmp3_* ที่อยู่ตรง root / legacy_roots (ที่เก็บแบบเก่า เช่น /tmp): ไม่รู้ว่าเป็นของใคร
+          ลบเฉพาะที่ไม่ถูกแก้ไขนานกว่า legacy_min_age วินาที
+        """
+        count = freed = 0
+        now = time.time()
+
+        def remove(path: str) -> None:
+            nonlocal count, freed
+            freed += _dir_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            count += 1
+
+        own = set(self._roots())
+        bases = [r for r in (self.base_root, self.base_ram_root) if r]
+        for root in dict.fromkeys(bases + list(legacy_roots)):
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                if not os.path.isdir(path):
+                    continue
+                if path in own:
+                    for child in os.listdir(path):
+                        if os.path.isdir(os.path.join(path, child)):
+                            remove(os.path.join(path, child))
+                elif name.startswith(RUN_DIR_PREFIX) and root in bases:
+                    pid = name[len(RUN_DIR_PREFIX):]
+                    if pid.isdigit() and not _pid_alive(int(pid)):
+                        remove(path)
+                elif name.startswith(WORK_DIR_PREFIX):
+                    try:
+                        if legacy_min_age and now - os.path.getmtime(path) < legacy_min_age:
+                            continue
+                    except OSError:
+                        continue
+                    remove(path)
+        self.swept_dirs += count
+        self.swept_bytes += freed
+        return count, freed
+
+    def usage_blocking(self) -> Dict[str, Dict[str, int]]:
+        """ขนาดโฟลเดอร์งานที่มีอยู่จริง + พื้นที่ว่างของดิสก์ ต่อ root (blocking: ต้องเดินไฟล์)"""
+        report = {}
+        for root in self._roots():
+            used = sum(
+                _dir_size(os.path.join(root, name))
+                for name in os.listdir(root)
+                if name.startswith(WORK_DIR_PREFIX)
+            )
+            disk = shutil.disk_usage(root)
+            report[root] = {"used": used, "free": disk.free, "total": disk.total}
+        return report
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "reserved": self.reserved_bytes,
+            "budget": self.budget_bytes,
+            "ram_reserved": self.ram_reserved_bytes,
+            "ram_budget": self.ram_budget_bytes if self.ram_root else 0,
+            "leases": self.active_leases,
+            "waiting": self.waiting,
+            "waited_total": self.waited_total,
+            "swept_dirs": self.swept_dirs,
+            "swept_bytes": self.swept_bytes,
+        }
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
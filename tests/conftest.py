@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""ให้ pytest import โมดูลระดับบนสุดของบอทได้ (โปรเจกต์นี้เป็นไฟล์เดี่ยว ไม่ใช่ package)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
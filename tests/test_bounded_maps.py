@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""กฎการตัดทิ้งของ TTLDict / SnowflakeSet"""
+
+import pytest
+
+from bounded_maps import SnowflakeSet, TTLDict
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_dict_expires_after_ttl():
+    clock = FakeClock()
+    evicted = []
+    d = TTLDict(ttl_seconds=10, on_evict=evicted.append, clock=clock)
+    d["a"] = 1
+    clock.now += 9.9
+    assert d["a"] == 1
+    clock.now += 0.1
+    assert "a" not in d
+    assert d.get("a") is None
+    with pytest.raises(KeyError):
+        d["a"]
+    assert evicted == ["a"]
+    assert d.evicted_total == 1
+
+
+def test_ttl_dict_set_again_restarts_ttl():
+    clock = FakeClock()
+    d = TTLDict(ttl_seconds=10, clock=clock)
+    d["a"] = 1
+    clock.now += 8
+    d["a"] = 2
+    clock.now += 8
+    assert d["a"] == 2
+
+
+def test_ttl_dict_prune_removes_only_expired_in_order():
+    clock = FakeClock()
+    evicted = []
+    d = TTLDict(ttl_seconds=10, on_evict=evicted.append, clock=clock)
+    d["old"] = 1
+    clock.now += 5
+    d["new"] = 2
+    clock.now += 6
+    assert d.prune() == ["old"]
+    assert evicted == ["old"]
+    assert list(d) == ["new"]
+
+
+def test_ttl_dict_max_items_drops_oldest_set():
+    evicted = []
+    d = TTLDict(max_items=2, on_evict=evicted.append)
+    d["a"] = 1
+    d["b"] = 2
+    d["a"] = 3  # ตั้งค่าใหม่ = กลายเป็นตัวใหม่สุด
+    d["c"] = 4
+    assert evicted == ["b"]
+    assert list(d) == ["a", "c"]
+
+
+def test_ttl_dict_pop_does_not_call_on_evict():
+    evicted = []
+    d = TTLDict(ttl_seconds=10, on_evict=evicted.append, clock=FakeClock())
+    d["a"] = 1
+    assert d.pop("a") == 1
+    assert d.pop("a", None) is None
+    with pytest.raises(KeyError):
+        d.pop("a")
+    assert evicted == []
+
+
+def test_ttl_dict_zero_ttl_never_expires():
+    clock = FakeClock()
+    d = TTLDict(clock=clock)
+    d["a"] = 1
+    clock.now += 10**9
+    assert d.prune() == []
+    assert d["a"] == 1
+
+
+def test_snowflake_set_trims_smallest_ids():
+    evicted = []
+    s = SnowflakeSet(max_items=3, on_evict=evicted.append)
+    s.update([50, 10, 40])
+    s.add(30)
+    s.add(60)
+    assert sorted(s) == [40, 50, 60]
+    assert evicted == [10, 30]
+    assert s.evicted_total == 2
+
+
+def test_snowflake_set_prune_older_than():
+    evicted = []
+    s = SnowflakeSet(on_evict=evicted.append)
+    s.update([1, 5, 9])
+    assert s.prune_older_than(6) == 2
+    assert list(s) == [9]
+    assert evicted == []  # prune ตามเวลาไม่นับเป็นการตัดเพราะเต็ม
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""circuit breaker ของ ProfilePool: trip / half-open / reset"""
+
+from extractor_profiles import CLOSED, HALF_OPEN, OPEN, ExtractorProfile, ProfilePool
+
+BLOCKED = RuntimeError("ERROR: Sign in to confirm you're not a bot")
+UNRELATED = RuntimeError("ERROR: Video unavailable")
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _pool(clock, names=("a", "b"), **kwargs) -> ProfilePool:
+    kwargs.setdefault("failure_threshold", 2)
+    kwargs.setdefault("cooldown_seconds", 60)
+    return ProfilePool([ExtractorProfile(n) for n in names], clock=clock, **kwargs)
+
+
+def _fail(pool, name, error=BLOCKED):
+    profile = pool.acquire(preferred=name)
+    assert profile.name == name
+    pool.report_failure(profile, error)
+
+
+def test_trips_after_consecutive_identity_failures():
+    pool = _pool(FakeClock())
+    _fail(pool, "a")
+    assert pool.health["a"].state == CLOSED
+    _fail(pool, "a")
+    assert pool.health["a"].state == OPEN
+    assert pool.health["a"].trips == 1
+    # ถูกพักอยู่ -> ไม่ถูกเลือกแม้จะขอเจาะจง
+    assert pool.acquire(preferred="a").name == "b"
+
+
+def test_unrelated_errors_do_not_count():
+    pool = _pool(FakeClock())
+    for _ in range(5):
+        _fail(pool, "a", UNRELATED)
+    assert pool.health["a"].state == CLOSED
+    assert pool.health["a"].failures == 0
+
+
+def test_success_resets_consecutive_failures():
+    pool = _pool(FakeClock())
+    _fail(pool, "a")
+    pool.report_success(pool.acquire(preferred="a"))
+    _fail(pool, "a")
+    assert pool.health["a"].state == CLOSED
+
+
+def test_half_open_probe_success_closes():
+    clock = FakeClock()
+    pool = _pool(clock, names=("a",))
+    _fail(pool, "a")
+    _fail(pool, "a")
+    clock.now += 60
+    probe = pool.acquire()
+    assert pool.health["a"].state == HALF_OPEN
+    pool.report_success(probe)
+    assert pool.health["a"].state == CLOSED
+    assert pool.health["a"].consecutive_trips == 0
+
+
+def test_half_open_probe_failure_reopens_with_backoff():
+    clock = FakeClock()
+    pool = _pool(clock, names=("a",))
+    _fail(pool, "a")
+    _fail(pool, "a")
+    assert pool.health["a"].open_until == clock.now + 60
+    clock.now += 60
+    _fail(pool, "a")  # งานทดลองล้มเหลวครั้งเดียวก็พักต่อ
+    h = pool.health["a"]
+    assert h.state == OPEN
+    assert h.open_until == clock.now + 120
+
+
+def test_half_open_allows_single_probe():
+    clock = FakeClock()
+    pool = _pool(clock)
+    _fail(pool, "a")
+    _fail(pool, "a")
+    clock.now += 60
+    first = pool.acquire(preferred="a")
+    assert first.name == "a"
+    assert pool.acquire(preferred="a").name == "b"
+
+
+def test_slow_job_counts_as_strike_unless_throttled():
+    pool = _pool(FakeClock(), names=("a",), failure_threshold=1, min_throughput=1000, min_sample_bytes=10)
+    pool.report_success(pool.acquire(), nbytes=100, seconds=1.0, throttled=True)
+    assert pool.health["a"].state == CLOSED
+    assert pool.health["a"].throughput is None
+    pool.report_success(pool.acquire(), nbytes=100, seconds=1.0)
+    assert pool.health["a"].state == OPEN
+    assert pool.health["a"].slow_jobs == 1
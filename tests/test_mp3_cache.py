@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""LRU + pin ของ Mp3Cache.put / put_async"""
+
+import asyncio
+import os
+
+from mp3_cache import Mp3Cache
+
+
+def _src(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / "work" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_put_moves_file_and_pins(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=1000)
+    src = _src(tmp_path, "a.mp3", 100)
+    entry = cache.put("a", src, "เพลง A")
+    assert entry is not None and entry.pins == 1
+    assert not os.path.exists(src)
+    assert os.path.isfile(entry.path)
+    assert cache.total_bytes == 100
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, _src(tmp_path, key + ".mp3", 100), key)
+        cache.release(key)
+    cache.release(cache.get("a").key)  # a ถูกใช้ล่าสุด -> b เก่าสุด
+    cache.put("c", _src(tmp_path, "c.mp3", 100), "c")
+    assert cache.contains("a")
+    assert not cache.contains("b")
+    assert cache.contains("c")
+    assert cache.evictions == 1
+
+
+def test_put_never_evicts_pinned_entries(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=150)
+    cache.put("a", _src(tmp_path, "a.mp3", 100), "a")  # ยังถือ pin อยู่
+    cache.put("b", _src(tmp_path, "b.mp3", 100), "b")
+    assert cache.contains("a") and cache.contains("b")
+    assert cache.total_bytes == 200  # เกินงบชั่วคราวระหว่างที่ถูก pin
+    cache.release("a")
+    assert not cache.contains("a")
+    assert cache.total_bytes == 100
+
+
+def test_put_existing_key_reuses_entry(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=1000)
+    first = cache.put("a", _src(tmp_path, "a1.mp3", 100), "a")
+    src = _src(tmp_path, "a2.mp3", 120)
+    second = cache.put("a", src, "a")
+    assert second is first and first.pins == 2
+    assert not os.path.exists(src)
+    assert cache.total_bytes == 100
+
+
+def test_put_too_large_returns_none(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=50)
+    src = _src(tmp_path, "big.mp3", 100)
+    assert cache.put("big", src, "big") is None
+    assert os.path.exists(src)
+
+
+def test_put_async_concurrent_same_key(tmp_path):
+    cache = Mp3Cache(str(tmp_path / "cache"), max_bytes=1000)
+
+    async def main():
+        return await asyncio.gather(
+            cache.put_async("a", _src(tmp_path, "a1.mp3", 100), "a"),
+            cache.put_async("a", _src(tmp_path, "a2.mp3", 100), "a"),
+        )
+
+    first, second = asyncio.run(main())
+    assert first is second and first.pins == 2
+    assert cache.stats()["entries"] == 1
+    assert not [n for n in os.listdir(cache.root) if n.endswith(".part")]
+
+
+def test_reload_drops_staging_leftovers(tmp_path):
+    root = tmp_path / "cache"
+    cache = Mp3Cache(str(root), max_bytes=1000)
+    cache.put("a", _src(tmp_path, "a.mp3", 100), "a")
+    (root / "b.1234.mp3.part").write_bytes(b"x")
+    reloaded = Mp3Cache(str(root), max_bytes=1000)
+    assert reloaded.contains("a")
+    assert not (root / "b.1234.mp3.part").exists()
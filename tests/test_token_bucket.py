@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""การหน่วงของ TokenBucket (ใช้นาฬิกาปลอม ไม่ต้องรอจริง)"""
+
+import pytest
+
+import http_fetch
+from http_fetch import TokenBucket
+
+
+class FakeTime:
+    """แทนโมดูล time ใน http_fetch: sleep เลื่อนนาฬิกาไปเลย"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(http_fetch, "time", fake)
+    return fake
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(0)
+    bucket.consume(10**9)
+    assert clock.slept == 0
+    assert bucket.consumed_bytes == 10**9
+    assert not bucket.enabled
+
+
+def test_burst_is_free_then_paced_at_rate(clock):
+    bucket = TokenBucket(1000, burst_bytes=1000)
+    bucket.consume(1000)
+    assert clock.slept == 0
+    bucket.consume(500)
+    assert clock.slept == pytest.approx(0.5)
+    bucket.consume(2000)
+    assert clock.slept == pytest.approx(2.5)
+    assert bucket.throttled_seconds == pytest.approx(2.5)
+
+
+def test_idle_time_refills_up_to_burst(clock):
+    bucket = TokenBucket(1000, burst_bytes=1000)
+    bucket.consume(1000)
+    clock.now += 60  # ว่างนาน เติมได้ไม่เกิน burst
+    bucket.consume(1000)
+    assert clock.slept == 0
+    bucket.consume(1000)
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_check_can_abort_wait(clock):
+    bucket = TokenBucket(1000, burst_bytes=1000)
+    bucket.consume(1000)
+
+    calls = []
+
+    def check():
+        calls.append(clock.now)
+        if len(calls) > 2:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        bucket.consume(5000, check=check)
+    # นอนเป็นช่วงสั้น ๆ ระหว่างรอ จึงยกเลิกได้ก่อนครบ 5 วินาที
+    assert clock.slept == pytest.approx(0.5)
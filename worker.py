@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""worker สำหรับงานหนัก (yt-dlp/ffmpeg) แยกจากบอท ดึงงานจาก broker (job_broker.py)
+
+รันได้หลาย process / หลายเครื่อง ชี้ไป broker เดียวกับบอท (ตั้ง BROKER_URL ของบอทให้ตรงกัน):
+    python worker.py --broker sqlite:///shared/broker.sqlite3 --concurrency 2
+    python worker.py --broker redis://queue-host:6379/0
+
+แต่ละงานถือ lease ไว้ และ thread heartbeat จะต่ออายุ + ส่งความคืบหน้าทุก WORKER_HEARTBEAT_INTERVAL วินาที
+ถ้า heartbeat พบว่างานถูกยกเลิก (ผู้ใช้ /cancel หรือบอทหมดเวลารอ) จะสั่งหยุดงานนั้นทันที
+ถ้า worker ตาย lease จะหมดอายุ แล้ว worker อื่นหยิบงานไปทำใหม่
+"""
+
+import os
+
+# worker ไม่ต่อ Discord จึงไม่ต้องมี DISCORD_TOKEN
+os.environ.setdefault("YTMP3_WORKER", "1")
+
+import argparse
+import shutil
+import socket
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Optional
+
+from config import (
+    BROKER_URL,
+    DOWNLOAD_JOB_TIMEOUT,
+    TEMP_DIR,
+    WORKER_HEARTBEAT_INTERVAL,
+    WORKER_LEASE_SECONDS,
+    WORKER_MAX_ATTEMPTS,
+)
+from downloader import (
+    PROFILE_POOL,
+    CancelToken,
+    EncodeOptions,
+    Progress,
+    download_mp3_blocking,
+    expand_playlist_blocking,
+    prefetch_info_blocking,
+    warm_up_blocking,
+)
+from job_broker import Broker, encode_error, encode_outcome, new_worker_id, open_broker
+
+
+class _ActiveTask:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.cancel = CancelToken()
+        self.progress: Optional[dict] = None
+        self.started = time.monotonic()
+
+    def on_progress(self, p: Progress) -> None:
+        self.progress = asdict(p)
+
+
+class Worker:
+    def __init__(self, broker: Broker, concurrency: int = 1, work_root: Optional[str] = None):
+        self.broker = broker
+        self.concurrency = max(1, concurrency)
+        self.work_root = work_root
+        self.worker_id = new_worker_id()
+        self.active: Dict[str, _ActiveTask] = {}
+        self.done_total = 0
+        self.failed_total = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ----------------- ทำงานทีละงาน -----------------
+
+    def _execute(self, kind: str, payload: dict, task: _ActiveTask):
+        """คืน (result, blobs)"""
+        if kind == "download":
+            outcome = download_mp3_blocking(
+                payload["url"],
+                EncodeOptions(**payload["options"]),
+                payload.get("info"),
+                task.on_progress,
+                task.cancel,
+                self.work_root,
+            )
+            try:
+                blobs = []
+                for path in outcome.parts:
+                    with open(path, "rb") as f:
+                        blobs.append(f.read())
+            finally:
+                shutil.rmtree(os.path.dirname(outcome.path), ignore_errors=True)
+            return encode_outcome(outcome), blobs
+        if kind == "prefetch":
+            return prefetch_info_blocking(payload["url"], EncodeOptions(**payload["options"])), []
+        if kind == "expand":
+            return expand_playlist_blocking(payload["url"], int(payload["limit"])), []
+        raise ValueError(f"ไม่รู้จักงานชนิด {kind}")
+
+    def _run_one(self) -> bool:
+        claimed = self.broker.claim(self.worker_id, WORKER_LEASE_SECONDS)
+        if claimed is None:
+            return False
+        task_id, payload = claimed
+        task = _ActiveTask(task_id)
+        with self._lock:
+            self.active[task_id] = task
+        try:
+            result, blobs = self._execute(payload.get("kind", "download"), payload, task)
+        except Exception as e:
+            with self._lock:
+                self.failed_total += 1
+            self.broker.fail(task_id, self.worker_id, encode_error(e))
+        else:
+            with self._lock:
+                self.done_total += 1
+            self.broker.complete(task_id, self.worker_id, result, blobs)
+        finally:
+            with self._lock:
+                self.active.pop(task_id, None)
+        return True
+
+    def _loop(self, poll_interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = self._run_one()
+            except Exception as e:
+                print("Worker loop error:", e)
+                busy = False
+            if not busy:
+                self._stop.wait(poll_interval)
+
+    # ----------------- heartbeat -----------------
+
+    def _heartbeat_once(self) -> None:
+        with self._lock:
+            tasks = list(self.active.values())
+            done, failed = self.done_total, self.failed_total
+        for task in tasks:
+            alive = self.broker.heartbeat(task.task_id, self.worker_id, WORKER_LEASE_SECONDS, task.progress)
+            timed_out = DOWNLOAD_JOB_TIMEOUT > 0 and time.monotonic() - task.started > DOWNLOAD_JOB_TIMEOUT
+            if not alive or timed_out:
+                task.cancel.cancel()
+        self.broker.report_worker(self.worker_id, {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "concurrency": self.concurrency,
+            "active": len(tasks),
+            "done": done,
+            "failed": failed,
+            "profiles": PROFILE_POOL.snapshot(),
+        })
+
+    def _heartbeat_loop(self) -> None:
+        last_purge = 0.0
+        while not self._stop.wait(WORKER_HEARTBEAT_INTERVAL):
+            try:
+                self._heartbeat_once()
+                if time.monotonic() - last_purge > 60:
+                    last_purge = time.monotonic()
+                    self.broker.purge_stale()
+            except Exception as e:
+                print("Worker heartbeat error:", e)
+
+    # ----------------- เริ่ม / หยุด -----------------
+
+    def run(self, poll_interval: float = 0.5) -> None:
+        """รันจนกว่าจะถูกสั่งหยุด (Ctrl+C)"""
+        threads = [threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True)]
+        threads += [
+            threading.Thread(target=self._loop, args=(poll_interval,), name=f"job-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        print(f"Worker {self.worker_id} พร้อมทำงาน ({self.concurrency} งานพร้อมกัน)")
+        try:
+            while any(t.is_alive() for t in threads):
+                threads[0].join(1.0)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            tasks = list(self.active.values())
+        for task in tasks:
+            task.cancel.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="worker แปลงไฟล์เสียง ดึงงานจาก broker ของบอท")
+    parser.add_argument("--broker", default=BROKER_URL, help="sqlite:///path หรือ redis://host:port/db")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "1")))
+    parser.add_argument("--poll", type=float, default=0.5, help="ระยะห่างการถามหางานเมื่อคิวว่าง (วินาที)")
+    args = parser.parse_args()
+    if not args.broker:
+        raise SystemExit("❌ ERROR: ต้องระบุ --broker หรือ BROKER_URL")
+
+    # ไม่กวาดโฟลเดอร์ค้างตอนเริ่ม เพราะ worker หลาย process บนเครื่องเดียวกันใช้โฟลเดอร์นี้ร่วมกัน
+    work_root = os.path.join(TEMP_DIR, "worker")
+    os.makedirs(work_root, exist_ok=True)
+    try:
+        warm_up_blocking()
+    except Exception as e:
+        print("Warm-up error:", e)
+    broker = open_broker(args.broker)
+    broker.max_attempts = WORKER_MAX_ATTEMPTS
+    Worker(broker, args.concurrency, work_root).run(args.poll)
+
+
+if __name__ == "__main__":
+    main()